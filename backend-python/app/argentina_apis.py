@@ -12,6 +12,8 @@ from dataclasses import dataclass
 import json
 import os
 
+from .http_client import http_clients
+
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -65,7 +67,7 @@ class ArgentinaAPIService:
     """Servicio principal para APIs de Argentina"""
     
     def __init__(self):
-        self.session: Optional[aiohttp.ClientSession] = None
+        self._own_session: Optional[aiohttp.ClientSession] = None
         self.cache_file = "argentina_apis_cache.json"
         self.cache_duration = timedelta(hours=12)
         self.last_update: Optional[datetime] = None
@@ -98,15 +100,22 @@ class ArgentinaAPIService:
         # Inicializar
         self._load_cache()
     
+    @property
+    def session(self) -> Optional[aiohttp.ClientSession]:
+        """Sesión compartida de la aplicación, o la propia si se usa como context manager"""
+        return self._own_session or http_clients.get("argentina_apis")
+    
     async def __aenter__(self):
-        """Context manager entry"""
-        self.session = aiohttp.ClientSession()
+        """Context manager entry (sesión propia solo si no hay cliente compartido)"""
+        if http_clients.get("argentina_apis") is None:
+            self._own_session = aiohttp.ClientSession()
         return self
     
     async def __aexit__(self, exc_type, exc_val, exc_tb):
         """Context manager exit"""
-        if self.session:
-            await self.session.close()
+        if self._own_session:
+            await self._own_session.close()
+            self._own_session = None
     
     def _load_cache(self):
         """Cargar cache desde archivo"""
@@ -375,10 +384,15 @@ argentina_api_service = ArgentinaAPIService()
 
 async def get_current_prices() -> ConstructionPrices:
     """Función helper para obtener precios actuales"""
+    if http_clients.get("argentina_apis") is not None:
+        # Instancia global: reutiliza la sesión compartida y el cache en memoria
+        return await argentina_api_service.get_construction_prices()
     async with ArgentinaAPIService() as service:
         return await service.get_construction_prices()
 
 async def get_current_exchange_rate() -> ExchangeRate:
     """Función helper para obtener tipo de cambio actual"""
+    if http_clients.get("argentina_apis") is not None:
+        return await argentina_api_service.get_exchange_rate()
     async with ArgentinaAPIService() as service:
         return await service.get_exchange_rate()
@@ -0,0 +1,254 @@
+"""
+Registro de eventos de auditoría (tabla de logs de NocoDB)
+Calculadora, rutas y servicios de email emiten eventos estructurados
+(cotizacion_generada, contacto_recibido, email_enviado, ...) en un buffer
+circular en memoria; una tarea periódica los inserta en NocoDB en lote.
+Los tipos de evento de alto volumen se muestrean (AUDIT_SAMPLE_RATES).
+Si NocoDB no responde el lote va a un archivo JSON-lines local, que se
+reenvía en el siguiente envío exitoso. Los workers comparten el archivo: las
+escrituras y el reenvío toman un flock sobre {archivo}.lock.
+"""
+
+import asyncio
+import fcntl
+import json
+import logging
+import os
+import random
+import threading
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, IO, Iterator, List, Optional
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+# Entrega de un lote de registros a la tabla de logs (True = aceptado)
+Deliver = Callable[[List[Dict[str, Any]]], Awaitable[bool]]
+
+
+class AuditLog:
+    def __init__(self, buffer_size: int, flush_seconds: float, fallback_path: str,
+                 sample_rates: Dict[str, float], replay_max_records: int, enabled: bool = True):
+        self.enabled = enabled
+        self.flush_seconds = flush_seconds
+        self.fallback_path = fallback_path
+        self.sample_rates = sample_rates
+        self.replay_max_records = replay_max_records
+        self._buffer: deque = deque(maxlen=max(1, buffer_size))
+        self._lock = threading.Lock()  # emit() se llama también desde threads (SMTP, cálculos)
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._deliver: Optional[Deliver] = None
+        self._task: Optional[asyncio.Task] = None
+        self.stats = {
+            "emitted": 0, "sampled_out": 0, "dropped": 0, "flushed": 0,
+            "flush_errors": 0, "fallback_written": 0, "fallback_replayed": 0
+        }
+
+    def emit(self, event_type: str, message: str, level: str = "INFO", user: str = "sistema",
+             ip: Optional[str] = None, **data: Any) -> bool:
+        """
+        Registrar un evento (no bloquea ni hace I/O). Los errores nunca se muestrean.
+        Devuelve False si el evento se descartó por muestreo o con el registro desactivado
+        """
+        if not self.enabled:
+            return False
+        rate = self.sample_rates.get(event_type, 1.0)
+        if level != "ERROR" and rate < 1.0:
+            if random.random() >= rate:
+                with self._lock:
+                    self.stats["sampled_out"] += 1
+                return False
+            data["muestreo"] = rate  # para extrapolar los totales
+        
+        record = {
+            "tipo_evento": event_type,
+            "mensaje": message,
+            "nivel_log": level,
+            "usuario": user,
+            "ip_cliente": ip or "",
+            "fecha_hora": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "datos_adicionales": json.dumps(data, ensure_ascii=False, default=str)
+        }
+        with self._lock:
+            if len(self._buffer) == self._buffer.maxlen:
+                self.stats["dropped"] += 1  # el buffer descarta el evento más viejo
+            self._buffer.append(record)
+            self.stats["emitted"] += 1
+        return True
+
+    def _take(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            records = list(self._buffer)
+            self._buffer.clear()
+        return records
+
+    def drain(self) -> List[Dict[str, Any]]:
+        """Sacar los eventos del buffer sin enviarlos (procesos del pool de cálculo, ver extend)"""
+        return self._take()
+
+    def extend(self, records: List[Dict[str, Any]]):
+        """Agregar eventos ya armados y muestreados en otro proceso (el del pool de cálculo)"""
+        if not self.enabled or not records:
+            return
+        with self._lock:
+            for record in records:
+                if len(self._buffer) == self._buffer.maxlen:
+                    self.stats["dropped"] += 1
+                self._buffer.append(record)
+            self.stats["emitted"] += len(records)
+
+    def _open_lock(self, blocking: bool = True) -> Optional[IO]:
+        """Tomar el flock del archivo local (compartido entre workers); None si está tomado y no se espera"""
+        directory = os.path.dirname(self.fallback_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        lock_file = open(f"{self.fallback_path}.lock", "a")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            return None
+        return lock_file
+
+    @contextmanager
+    def _fallback_locked(self) -> Iterator[None]:
+        lock_file = self._open_lock()
+        try:
+            yield
+        finally:
+            lock_file.close()  # libera el flock
+
+    def _append_fallback(self, records: List[Dict[str, Any]]):
+        with self._fallback_locked():
+            with open(self.fallback_path, "a", encoding="utf-8") as fallback:
+                fallback.writelines(json.dumps(record, ensure_ascii=False) + "\n" for record in records)
+
+    def _read_fallback(self) -> List[str]:
+        if not self.fallback_path or not os.path.exists(self.fallback_path):
+            return []
+        with open(self.fallback_path, encoding="utf-8") as fallback:
+            return [line for line in fallback if line.strip()]
+
+    def _rewrite_fallback(self, lines: List[str]):
+        if not lines:
+            os.remove(self.fallback_path)
+            return
+        temporary = f"{self.fallback_path}.tmp"
+        with open(temporary, "w", encoding="utf-8") as fallback:
+            fallback.writelines(lines)
+        os.replace(temporary, self.fallback_path)
+
+    async def _deliver_safely(self, records: List[Dict[str, Any]]) -> bool:
+        try:
+            return bool(await self._deliver(records))
+        except Exception as e:
+            logger.error(f"❌ Error enviando eventos de auditoría a NocoDB: {e}")
+            return False
+
+    async def flush(self) -> int:
+        """Enviar los eventos del buffer (y los pendientes del archivo local); devuelve los enviados"""
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        async with self._flush_lock:
+            records = self._take()
+            if not records:
+                return await self._replay_fallback()
+            if self._deliver is not None and await self._deliver_safely(records):
+                self.stats["flushed"] += len(records)
+                return len(records) + await self._replay_fallback()
+            
+            self.stats["flush_errors"] += 1
+            if not self.fallback_path:
+                logger.error(f"❌ {len(records)} eventos de auditoría perdidos (sin archivo local)")
+                return 0
+            try:
+                await asyncio.to_thread(self._append_fallback, records)
+                self.stats["fallback_written"] += len(records)
+                logger.warning(f"⚠️ {len(records)} eventos de auditoría guardados en {self.fallback_path}")
+            except OSError as e:
+                logger.error(f"❌ Error escribiendo eventos de auditoría en {self.fallback_path}: {e}")
+            return 0
+
+    async def _replay_fallback(self) -> int:
+        """
+        Reenviar a NocoDB hasta replay_max_records eventos del archivo local.
+        El flock se mantiene entre la lectura y la reescritura: ningún worker agrega
+        líneas en el medio (esperan) ni reenvía las mismas (si está tomado, se saltea)
+        """
+        if self._deliver is None or not self.fallback_path or not os.path.exists(self.fallback_path):
+            return 0
+        lock_file = await asyncio.to_thread(self._open_lock, False)
+        if lock_file is None:
+            return 0
+        try:
+            lines = await asyncio.to_thread(self._read_fallback)
+            if not lines:
+                return 0
+            batch = lines[:self.replay_max_records]
+            records = []
+            for line in batch:
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    logger.warning(f"⚠️ Línea inválida descartada de {self.fallback_path}")
+            if records and not await self._deliver_safely(records):
+                return 0
+            await asyncio.to_thread(self._rewrite_fallback, lines[len(batch):])
+        finally:
+            lock_file.close()
+        self.stats["fallback_replayed"] += len(records)
+        logger.info(f"✅ {len(records)} eventos de auditoría reenviados desde {self.fallback_path}")
+        return len(records)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_seconds)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"❌ Error en el envío periódico de eventos de auditoría: {e}")
+
+    def start(self, deliver: Deliver):
+        """Iniciar el envío periódico a NocoDB"""
+        self._deliver = deliver
+        self._flush_lock = asyncio.Lock()
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self._run())
+            logger.info(f"📝 Registro de auditoría iniciado (envío cada {self.flush_seconds:.0f}s)")
+
+    async def stop(self):
+        """Detener el envío periódico y enviar lo pendiente (o guardarlo en el archivo local)"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            buffered = len(self._buffer)
+        return {
+            **self.stats,
+            "enabled": self.enabled,
+            "running": self._task is not None,
+            "buffered": buffered,
+            "buffer_size": self._buffer.maxlen,
+            "sample_rates": self.sample_rates
+        }
+
+
+# Instancia global del registro de auditoría
+audit_log = AuditLog(
+    buffer_size=settings.AUDIT_BUFFER_SIZE,
+    flush_seconds=settings.AUDIT_FLUSH_SECONDS,
+    fallback_path=settings.AUDIT_FALLBACK_PATH,
+    sample_rates=settings.AUDIT_SAMPLE_RATES,
+    replay_max_records=settings.AUDIT_REPLAY_MAX_RECORDS,
+    enabled=settings.AUDIT_LOG_ENABLED
+)
@@ -0,0 +1,157 @@
+"""
+Cálculo de diseños solares por lotes
+JSON (lista acotada en memoria) y NDJSON en streaming: las líneas se leen, calculan
+y devuelven por tandas, así la memoria no crece con el tamaño del archivo
+"""
+
+import asyncio
+import json
+import logging
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
+from starlette.requests import ClientDisconnect
+from starlette.types import Receive, Scope, Send
+
+from .compute_executor import ComputeExecutor, ExecutorSaturatedError
+from .solar_calculator import SolarCalculator
+from .solar_models import SolarQuoteRequest, SolarSystemDesign
+
+logger = logging.getLogger(__name__)
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+
+class LineTooLongError(ValueError):
+    """Una línea NDJSON supera el tamaño máximo permitido"""
+
+
+class NDJSONStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse full-duplex: la respuesta se envía mientras se sigue leyendo el
+    cuerpo de la solicitud. No usa el listener de desconexión de Starlette porque
+    consumiría los mensajes del cuerpo; la desconexión la detecta request.stream()
+    """
+    media_type = NDJSON_MEDIA_TYPE
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
+
+
+def _error_message(error: Exception) -> str:
+    if isinstance(error, ValidationError):
+        return "; ".join(
+            f"{'.'.join(str(part) for part in item['loc']) or 'línea'}: {item['msg']}"
+            for item in error.errors()
+        )
+    return str(error) or type(error).__name__
+
+
+def calculate_one(calculator: SolarCalculator, request: SolarQuoteRequest) -> Tuple[Optional[SolarSystemDesign], Optional[str]]:
+    """Calcular un diseño; devuelve (diseño, None) o (None, error)"""
+    try:
+        return calculator.calculate_system_design(request), None
+    except ValueError as e:
+        return None, str(e)
+    except Exception as e:
+        logger.error(f"Error calculando diseño del lote: {e}")
+        return None, "Error interno calculando el diseño"
+
+
+def calculate_batch(calculator: SolarCalculator, requests: List[SolarQuoteRequest]) -> List[Dict[str, Any]]:
+    """Calcular una lista de solicitudes ya validadas (una entrada por solicitud, en orden)"""
+    results = []
+    for index, request in enumerate(requests):
+        design, error = calculate_one(calculator, request)
+        if error is None:
+            results.append({"index": index, "status": "ok", "design": design})
+        else:
+            results.append({"index": index, "status": "error", "error": error})
+    return results
+
+
+def calculate_ndjson_chunk(calculator: SolarCalculator, lines: List[Tuple[int, bytes]]) -> bytes:
+    """
+    Validar y calcular una tanda de líneas NDJSON.
+    Devuelve las líneas de salida ya serializadas ({"line", "status", "design"|"error"}).
+    """
+    output = []
+    for line_number, raw in lines:
+        try:
+            request = SolarQuoteRequest.model_validate_json(raw)
+        except ValidationError as e:
+            output.append(_error_line(line_number, _error_message(e)))
+            continue
+        design, error = calculate_one(calculator, request)
+        if error is not None:
+            output.append(_error_line(line_number, error))
+            continue
+        # El diseño se serializa con pydantic-core directamente, sin dict intermedio
+        output.append(
+            b'{"line":%d,"status":"ok","design":%s}\n' % (line_number, design.model_dump_json().encode("utf-8"))
+        )
+    return b"".join(output)
+
+
+def _error_line(line_number: int, error: str) -> bytes:
+    return (json.dumps({"line": line_number, "status": "error", "error": error}, ensure_ascii=False) + "\n").encode("utf-8")
+
+
+async def iter_ndjson_lines(chunks: AsyncIterator[bytes], max_line_bytes: int) -> AsyncIterator[Tuple[int, bytes]]:
+    """Partir un flujo de bytes en líneas (número de línea, contenido) sin acumular el cuerpo"""
+    buffer = b""
+    line_number = 0
+    async for chunk in chunks:
+        buffer += chunk
+        *complete, buffer = buffer.split(b"\n")
+        for raw in complete:
+            line_number += 1
+            if raw.strip():
+                yield line_number, raw
+        if len(buffer) > max_line_bytes:
+            raise LineTooLongError(f"La línea {line_number + 1} supera {max_line_bytes} bytes")
+    if buffer.strip():
+        yield line_number + 1, buffer
+
+
+async def stream_designs(chunks: AsyncIterator[bytes], calculator: SolarCalculator,
+                         executor: ComputeExecutor, chunk_size: int,
+                         max_line_bytes: int) -> AsyncIterator[bytes]:
+    """
+    Leer NDJSON de solicitudes y devolver NDJSON de diseños por tandas de `chunk_size`.
+    Cada tanda se calcula en el ejecutor de cálculos (pool de procesos si está
+    configurado); si está saturado se espera
+    (la respuesta ya empezó, no se puede devolver 503).
+    """
+    pending: List[Tuple[int, bytes]] = []
+    stats = {"lines": 0, "chunks": 0}
+
+    async def flush() -> bytes:
+        batch = list(pending)
+        pending.clear()
+        stats["chunks"] += 1
+        while True:
+            try:
+                return await executor.run(calculate_ndjson_chunk, calculator, batch, heavy=True)
+            except ExecutorSaturatedError:
+                await asyncio.sleep(0.05)
+
+    try:
+        async for item in iter_ndjson_lines(chunks, max_line_bytes):
+            pending.append(item)
+            stats["lines"] += 1
+            if len(pending) >= chunk_size:
+                yield await flush()
+        if pending:
+            yield await flush()
+    except LineTooLongError as e:
+        if pending:
+            yield await flush()
+        yield _error_line(0, str(e))
+    except ClientDisconnect:
+        logger.warning(f"⚠️ Cliente desconectado durante el lote NDJSON ({stats['lines']} líneas leídas)")
+        return
+    logger.info(f"📦 Lote NDJSON procesado: {stats['lines']} líneas en {stats['chunks']} tandas")
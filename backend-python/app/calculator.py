@@ -74,7 +74,7 @@ class ConstructionCalculator:
         regional_multiplier = self.price_service.get_price_multiplier_by_region(request.provincia)
         
         # Calcular costos base
-        costos = await self._calculate_base_costs(request, regional_multiplier)
+        costos = self._calculate_base_costs(request, regional_multiplier)
         
         # Aplicar factores de complejidad
         costos = self._apply_complexity_factors(request, costos)
@@ -109,7 +109,7 @@ class ConstructionCalculator:
             validez_dias=30
         )
     
-    async def _calculate_base_costs(self, request: CotizacionRequest, regional_multiplier: float) -> CalculoCostos:
+    def _calculate_base_costs(self, request: CotizacionRequest, regional_multiplier: float) -> CalculoCostos:
         """Calcula los costos base por metro cuadrado"""
         
         m2 = request.metros_cuadrados
@@ -285,11 +285,11 @@ class ConstructionCalculator:
         
         return observaciones
     
-    async def get_cost_breakdown(self, request: CotizacionRequest) -> Dict[str, float]:
+    def get_cost_breakdown(self, request: CotizacionRequest) -> Dict[str, float]:
         """Retorna el desglose detallado de costos"""
         
         # Calcular costos base
-        costos = await self._calculate_base_costs(request, 1.0)
+        costos = self._calculate_base_costs(request, 1.0)
         
         # Aplicar todos los factores
         costos = self._apply_complexity_factors(request, costos)
@@ -0,0 +1,221 @@
+"""
+Circuit breaker con timeouts adaptativos para llamadas HTTP salientes
+Un breaker por endpoint (tabla + método): tras N fallos seguidos se abre y las
+llamadas fallan al instante; pasado el plazo deja pasar una sola llamada de
+prueba (semiabierto) que decide si vuelve a cerrarse.
+El timeout de cada llamada sale del percentil de latencia reciente del endpoint.
+"""
+
+import asyncio
+import logging
+import math
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Optional
+
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(ConnectionError):
+    """El breaker del endpoint está abierto: la llamada no se hizo"""
+
+    def __init__(self, name: str, retry_after_seconds: float):
+        super().__init__(f"Circuito abierto para {name} (reintentar en {retry_after_seconds:.1f}s)")
+        self.name = name
+        self.retry_after_seconds = retry_after_seconds
+
+
+def _percentile(samples: Deque[float], percentile: float) -> float:
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, math.ceil(percentile * len(ordered)) - 1))
+    return ordered[index]
+
+
+class CircuitBreaker:
+    """Estado cerrado / abierto / semiabierto y ventana de latencias de un endpoint"""
+
+    def __init__(self, name: str, failure_threshold: int, open_seconds: float,
+                 latency_window: int, min_samples: int, timeout_percentile: float,
+                 timeout_multiplier: float, min_timeout_seconds: float, max_timeout_seconds: float):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.open_seconds = open_seconds
+        self.min_samples = min_samples
+        self.timeout_percentile = timeout_percentile
+        self.timeout_multiplier = timeout_multiplier
+        self.min_timeout_seconds = min_timeout_seconds
+        self.max_timeout_seconds = max_timeout_seconds
+
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._latencies: Deque[float] = deque(maxlen=max(1, latency_window))
+        self.metrics = {"calls": 0, "failures": 0, "rejected": 0, "opened": 0, "last_error": None}
+
+    def timeout(self) -> float:
+        """Timeout total para la próxima llamada: percentil de latencia x multiplicador, acotado"""
+        if len(self._latencies) < self.min_samples:
+            return self.max_timeout_seconds
+        adaptive = _percentile(self._latencies, self.timeout_percentile) * self.timeout_multiplier
+        return min(self.max_timeout_seconds, max(self.min_timeout_seconds, adaptive))
+
+    def is_open(self) -> bool:
+        """La próxima llamada se rechazaría"""
+        if self.state == OPEN:
+            return time.monotonic() - self._opened_at < self.open_seconds
+        return self.state == HALF_OPEN and self._probe_in_flight
+
+    def before_call(self):
+        """Reservar la llamada o lanzar CircuitOpenError si hay que fallar rápido"""
+        if self.state == OPEN:
+            elapsed = time.monotonic() - self._opened_at
+            if elapsed < self.open_seconds:
+                self.metrics["rejected"] += 1
+                raise CircuitOpenError(self.name, self.open_seconds - elapsed)
+            self.state = HALF_OPEN
+            logger.info(f"🟡 Circuito {self.name} semiabierto: se prueba con una llamada")
+        if self.state == HALF_OPEN:
+            if self._probe_in_flight:
+                self.metrics["rejected"] += 1
+                raise CircuitOpenError(self.name, 0.0)
+            self._probe_in_flight = True
+        self.metrics["calls"] += 1
+
+    def record_success(self, latency_seconds: float):
+        self._latencies.append(latency_seconds)
+        self.consecutive_failures = 0
+        self._probe_in_flight = False
+        if self.state != CLOSED:
+            self.state = CLOSED
+            logger.info(f"🟢 Circuito {self.name} cerrado: NocoDB volvió a responder")
+
+    def record_failure(self, error: str):
+        self.metrics["failures"] += 1
+        self.metrics["last_error"] = error[:300]
+        self.consecutive_failures += 1
+        self._probe_in_flight = False
+        if self.state == HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            if self.state != OPEN:
+                self.metrics["opened"] += 1
+                logger.warning(
+                    f"🔴 Circuito {self.name} abierto por {self.open_seconds:.0f}s "
+                    f"({self.consecutive_failures} fallos seguidos: {error})"
+                )
+            self.state = OPEN
+            self._opened_at = time.monotonic()
+
+    def release(self):
+        """La llamada se canceló sin resultado: liberar la prueba del semiabierto"""
+        self._probe_in_flight = False
+
+    def get_stats(self) -> Dict[str, Any]:
+        state = self.state
+        if state == OPEN and not self.is_open():
+            # Venció el plazo: la próxima llamada será la de prueba
+            state = HALF_OPEN
+        stats: Dict[str, Any] = {
+            **self.metrics,
+            "state": state,
+            "consecutive_failures": self.consecutive_failures,
+            "timeout_seconds": round(self.timeout(), 3),
+            "samples": len(self._latencies),
+        }
+        if self._latencies:
+            stats["latency_p50_ms"] = round(_percentile(self._latencies, 0.5) * 1000, 1)
+            stats["latency_p99_ms"] = round(_percentile(self._latencies, 0.99) * 1000, 1)
+        return stats
+
+
+class BreakerRegistry:
+    """Breakers creados a demanda por nombre de endpoint, con la misma configuración"""
+
+    def __init__(self, **config: Any):
+        self.config = config
+        self._breakers: Dict[str, CircuitBreaker] = {}
+
+    def get(self, name: str) -> CircuitBreaker:
+        breaker = self._breakers.get(name)
+        if breaker is None:
+            breaker = self._breakers[name] = CircuitBreaker(name, **self.config)
+        return breaker
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {name: breaker.get_stats() for name, breaker in sorted(self._breakers.items())}
+
+
+class _GuardedRequest:
+    def __init__(self, breaker: CircuitBreaker, session: aiohttp.ClientSession,
+                 method: str, url: str, kwargs: Dict[str, Any]):
+        self.breaker = breaker
+        self.session = session
+        self.method = method
+        self.url = url
+        self.kwargs = kwargs
+        self.response: Optional[aiohttp.ClientResponse] = None
+        self._started = 0.0
+
+    async def __aenter__(self) -> aiohttp.ClientResponse:
+        self.breaker.before_call()
+        self.kwargs.setdefault("timeout", aiohttp.ClientTimeout(total=self.breaker.timeout()))
+        self._started = time.monotonic()
+        try:
+            self.response = await self.session.request(self.method, self.url, **self.kwargs)
+        except asyncio.TimeoutError:
+            self.breaker.record_failure(f"timeout de {self.kwargs['timeout'].total:.1f}s")
+            raise
+        except aiohttp.ClientError as e:
+            self.breaker.record_failure(str(e) or type(e).__name__)
+            raise
+        except BaseException:
+            self.breaker.release()
+            raise
+        return self.response
+
+    async def __aexit__(self, exc_type, exc, tb):
+        try:
+            if exc_type is None or not issubclass(exc_type, (asyncio.TimeoutError, aiohttp.ClientError, asyncio.CancelledError)):
+                # Los 4xx son errores del pedido, no de NocoDB
+                if self.response.status >= 500:
+                    self.breaker.record_failure(f"HTTP {self.response.status}")
+                else:
+                    self.breaker.record_success(time.monotonic() - self._started)
+            elif issubclass(exc_type, asyncio.CancelledError):
+                self.breaker.release()
+            else:
+                self.breaker.record_failure(str(exc) or exc_type.__name__)
+        finally:
+            self.response.release()
+
+
+class GuardedSession:
+    """
+    Envoltorio de una sesión aiohttp: cada request pasa por el breaker de su
+    endpoint y, si no se indica otro, usa el timeout adaptativo del breaker
+    """
+
+    def __init__(self, session: aiohttp.ClientSession, breaker_for: Callable[[str, str], CircuitBreaker]):
+        self.session = session
+        self.breaker_for = breaker_for
+
+    def request(self, method: str, url: str, **kwargs: Any) -> _GuardedRequest:
+        method = method.upper()
+        return _GuardedRequest(self.breaker_for(method, url), self.session, method, url, kwargs)
+
+    def get(self, url: str, **kwargs: Any) -> _GuardedRequest:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs: Any) -> _GuardedRequest:
+        return self.request("POST", url, **kwargs)
+
+    def patch(self, url: str, **kwargs: Any) -> _GuardedRequest:
+        return self.request("PATCH", url, **kwargs)
+
+    def delete(self, url: str, **kwargs: Any) -> _GuardedRequest:
+        return self.request("DELETE", url, **kwargs)
@@ -0,0 +1,155 @@
+"""
+Ejecutor acotado para cálculos que consumen CPU
+Saca los cálculos del event loop (pool de threads para los livianos, pool de
+procesos para los pesados) y rechaza trabajo con 503 + Retry-After cuando la
+cola supera el límite configurado.
+Los eventos de auditoría que emite un cálculo en el pool de procesos vuelven
+con el resultado y se registran en el proceso principal
+"""
+
+import asyncio
+import logging
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+
+from .audit_log import audit_log
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class ExecutorSaturatedError(Exception):
+    """Hay demasiados cálculos pendientes"""
+
+
+def _init_process_worker():
+    """Descartar los eventos de auditoría heredados del proceso principal (fork)"""
+    audit_log.drain()
+
+
+def _run_in_process(fn: Callable[..., Any], *args: Any) -> Tuple[Any, Optional[Exception], List[Dict[str, Any]]]:
+    """
+    En un proceso del pool: ejecutar fn(*args) y devolver (resultado, error, eventos de auditoría).
+    El proceso no envía eventos a NocoDB: los registra el proceso principal
+    """
+    try:
+        return fn(*args), None, audit_log.drain()
+    except Exception as e:
+        return None, e, audit_log.drain()
+
+
+class ComputeExecutor:
+    """Pools de threads y procesos con límite de trabajos en vuelo y métricas"""
+
+    def __init__(self, thread_workers: int, process_workers: int, max_pending: int,
+                 retry_after_seconds: int):
+        self.thread_workers = thread_workers
+        self.process_workers = process_workers
+        self.max_pending = max_pending
+        self.retry_after_seconds = retry_after_seconds
+
+        self._thread_pool: Optional[ThreadPoolExecutor] = None
+        self._process_pool: Optional[ProcessPoolExecutor] = None
+
+        self.in_flight = 0
+        self.metrics: Dict[str, Any] = {
+            "submitted": 0, "completed": 0, "failed": 0, "rejected": 0,
+            "max_in_flight": 0, "wait_seconds_total": 0.0, "run_seconds_total": 0.0
+        }
+
+    def _pool(self, heavy: bool) -> Executor:
+        if heavy and self.process_workers > 0:
+            if self._process_pool is None:
+                self._process_pool = ProcessPoolExecutor(
+                    max_workers=self.process_workers, initializer=_init_process_worker
+                )
+            return self._process_pool
+        if self._thread_pool is None:
+            self._thread_pool = ThreadPoolExecutor(
+                max_workers=self.thread_workers, thread_name_prefix="compute"
+            )
+        return self._thread_pool
+
+    async def run(self, fn: Callable[..., Any], *args: Any, heavy: bool = False) -> Any:
+        """
+        Ejecutar fn(*args) fuera del event loop.
+        heavy=True usa el pool de procesos (fn y args deben ser serializables con pickle).
+        """
+        if self.in_flight >= self.max_pending:
+            self.metrics["rejected"] += 1
+            raise ExecutorSaturatedError(f"{self.in_flight} cálculos en curso (límite {self.max_pending})")
+
+        self.in_flight += 1
+        self.metrics["submitted"] += 1
+        self.metrics["max_in_flight"] = max(self.metrics["max_in_flight"], self.in_flight)
+        submitted = time.perf_counter()
+        timing: Dict[str, float] = {}
+
+        def timed(*call_args):
+            timing["started"] = time.perf_counter()
+            return fn(*call_args)
+
+        pool = self._pool(heavy)
+        loop = asyncio.get_running_loop()
+        try:
+            if isinstance(pool, ProcessPoolExecutor):
+                result, error, events = await loop.run_in_executor(pool, _run_in_process, fn, *args)
+                audit_log.extend(events)
+                if error is not None:
+                    raise error
+            else:
+                result = await loop.run_in_executor(pool, timed, *args)
+            self.metrics["completed"] += 1
+            return result
+        except Exception:
+            self.metrics["failed"] += 1
+            raise
+        finally:
+            self.in_flight -= 1
+            finished = time.perf_counter()
+            started = timing.get("started", submitted)
+            self.metrics["wait_seconds_total"] += started - submitted
+            self.metrics["run_seconds_total"] += finished - started
+
+    async def run_or_503(self, fn: Callable[..., Any], *args: Any, heavy: bool = False) -> Any:
+        """Igual que run() pero traduce la saturación a HTTP 503 con Retry-After"""
+        try:
+            return await self.run(fn, *args, heavy=heavy)
+        except ExecutorSaturatedError as e:
+            logger.warning(f"⚠️ Cálculo rechazado: {e}")
+            raise HTTPException(
+                status_code=503,
+                detail="Servidor ocupado, reintente en unos segundos",
+                headers={"Retry-After": str(self.retry_after_seconds)}
+            )
+
+    def get_metrics(self) -> Dict[str, Any]:
+        finished = self.metrics["completed"] + self.metrics["failed"]
+        return {
+            **self.metrics,
+            "in_flight": self.in_flight,
+            "max_pending": self.max_pending,
+            "thread_workers": self.thread_workers,
+            "process_workers": self.process_workers,
+            "avg_wait_ms": round(self.metrics["wait_seconds_total"] / finished * 1000, 3) if finished else 0.0,
+            "avg_run_ms": round(self.metrics["run_seconds_total"] / finished * 1000, 3) if finished else 0.0,
+        }
+
+    def shutdown(self):
+        for pool in (self._thread_pool, self._process_pool):
+            if pool is not None:
+                pool.shutdown(wait=False, cancel_futures=True)
+        self._thread_pool = None
+        self._process_pool = None
+
+
+# Instancia global del ejecutor de cálculos
+compute_executor = ComputeExecutor(
+    thread_workers=settings.COMPUTE_THREAD_WORKERS,
+    process_workers=settings.COMPUTE_PROCESS_WORKERS,
+    max_pending=settings.COMPUTE_MAX_PENDING,
+    retry_after_seconds=settings.COMPUTE_RETRY_AFTER_SECONDS
+)
@@ -4,7 +4,7 @@ Credenciales SMTP y configuración de Nocodb
 """
 
 import os
-from typing import Optional
+from typing import Dict, Optional
 from pydantic_settings import BaseSettings
 
 class Settings(BaseSettings):
@@ -35,6 +35,52 @@ class Settings(BaseSettings):
     NOCODB_COTIZACIONES_TABLE_ID: str = "m6rk1j231s70p8m"
     NOCODB_MATERIALES_TABLE_ID: str = "m2p9ng5e1hn53k0"
     NOCODB_LOGS_TABLE_ID: str = "m1xm2vu3e5bcuiy"
+    NOCODB_CLIENTES_TABLE_ID: str = "m6snjo5tgkirewb"  # cotizador de construcción (misma tabla que contactos)
+    
+    # Lecturas de NocoDB: coalescencia de pedidos idénticos y cache corta
+    NOCODB_READ_CACHE_TTL_SECONDS: float = 5.0  # 0 = solo coalescencia
+    NOCODB_READ_CACHE_MAX_ENTRIES: int = 256
+    NOCODB_CRM_CACHE_TTL_SECONDS: float = 15.0  # contactos, clientes y cotizaciones; las escrituras solo invalidan la cache de su worker
+    
+    # Altas diferidas en NocoDB (contactos, cotizaciones, materiales y logs)
+    NOCODB_WRITE_BEHIND_ENABLED: bool = True
+    NOCODB_WRITE_BEHIND_BATCH_SIZE: int = 50
+    NOCODB_WRITE_BEHIND_FLUSH_MS: float = 200.0
+    NOCODB_WRITE_BEHIND_MAX_CONCURRENCY: int = 4
+    
+    # Outbox durable de altas en NocoDB (tiene prioridad sobre el write-behind)
+    NOCODB_OUTBOX_ENABLED: bool = True
+    NOCODB_OUTBOX_PATH: str = "data/nocodb_outbox.db"
+    NOCODB_OUTBOX_BATCH_SIZE: int = 100
+    NOCODB_OUTBOX_FLUSH_MS: float = 200.0
+    NOCODB_OUTBOX_POLL_SECONDS: float = 5.0
+    NOCODB_OUTBOX_BACKOFF_BASE_SECONDS: float = 2.0
+    NOCODB_OUTBOX_BACKOFF_MAX_SECONDS: float = 600.0
+    NOCODB_OUTBOX_MAX_ATTEMPTS: int = 20  # luego el registro pasa a nocodb_outbox_dead
+    NOCODB_OUTBOX_LEASE_SECONDS: float = 120.0  # reclamo de un lote por un proceso (compartido entre workers)
+    # Columna de texto (crearla en contactos, cotizaciones, materiales y logs) donde se guarda el id de
+    # idempotencia de cada alta: los reintentos hacen upsert por ella. Vacío = los reintentos solo insertan
+    # (pueden duplicar un alta que ya llegó, pero nunca pisan otro registro)
+    NOCODB_OUTBOX_ID_FIELD: str = ""
+    
+    # Circuit breaker por endpoint de NocoDB (tabla + método) y timeouts adaptativos
+    NOCODB_BREAKER_FAILURE_THRESHOLD: int = 5  # fallos seguidos para abrir
+    NOCODB_BREAKER_OPEN_SECONDS: float = 30.0  # luego se prueba con una llamada
+    NOCODB_BREAKER_LATENCY_WINDOW: int = 200
+    NOCODB_BREAKER_MIN_SAMPLES: int = 20  # con menos muestras se usa el timeout máximo
+    NOCODB_BREAKER_TIMEOUT_PERCENTILE: float = 0.99
+    NOCODB_BREAKER_TIMEOUT_MULTIPLIER: float = 3.0
+    NOCODB_BREAKER_MIN_TIMEOUT_SECONDS: float = 2.0
+    NOCODB_BREAKER_MAX_TIMEOUT_SECONDS: float = 30.0
+    
+    # Operaciones masivas en NocoDB
+    NOCODB_ID_FIELD: str = "id"
+    NOCODB_BULK_BATCH_SIZE: int = 100
+    NOCODB_LIST_MAX_LIMIT: int = 1000  # tope de los listados en memoria; más filas por la exportación en streaming
+    
+    # Importación masiva de materiales desde CSV
+    MATERIALS_IMPORT_CHUNK_SIZE: int = 500
+    MATERIALS_IMPORT_CONCURRENCY: int = 4
     
     # Variables de entorno del contenedor NocoDB
     NC_DATABASE_URL: Optional[str] = None
@@ -42,6 +88,81 @@ class Settings(BaseSettings):
     NC_AUTH_JWT_SECRET: Optional[str] = None
     NC_PUBLIC_URL: Optional[str] = None
     
+    # Refresco periódico del catálogo desde NocoDB (0 = solo al iniciar)
+    MATERIALS_REFRESH_INTERVAL_SECONDS: float = 900.0
+    
+    # Historial de precios de materiales (archivo binario de solo-agregado; vacío = solo memoria)
+    PRICE_HISTORY_PATH: str = "data/price_history.bin"
+    
+    # Repositorio de cotizaciones solares (sqlite | memory)
+    QUOTE_STORE_BACKEND: str = "sqlite"
+    QUOTE_STORE_PATH: str = "data/quotes.db"
+    QUOTE_STORE_MAX_ENTRIES: int = 100000  # 0 = sin límite
+    QUOTE_SWEEP_INTERVAL_SECONDS: float = 3600.0  # 0 = sin barrido periódico
+    QUOTE_ARCHIVE_EXPIRED: bool = True  # archivar en lugar de borrar (solo sqlite)
+    
+    # Idempotencia de POST /api/solar/quote
+    IDEMPOTENCY_STORE_PATH: str = "data/idempotency.db"
+    IDEMPOTENCY_WINDOW_SECONDS: float = 86400.0  # con header Idempotency-Key
+    # Reclamo sin resultado que no se renueva en este tiempo se considera huérfano (worker caído).
+    # Mayor que la latencia peor caso de /quote; el líder lo renueva mientras ejecuta
+    IDEMPOTENCY_PENDING_TIMEOUT_SECONDS: float = 120.0
+    DUPLICATE_SUBMIT_WINDOW_SECONDS: float = 10.0  # envíos idénticos sin header (0 = desactivado)
+    
+    # Reservas de stock de cotizaciones aceptadas
+    STOCK_RESERVATIONS_PATH: str = "data/stock_reservations.db"
+    STOCK_RESERVATION_TTL_HOURS: float = 72.0
+    STOCK_SNAPSHOT_TTL_SECONDS: float = 2.0  # refresco del snapshot en memoria (reservas de otros workers y vencimientos)
+    
+    # Cache de diseños solares (invalidada por versión del catálogo y reservas de stock)
+    DESIGN_CACHE_SIZE: int = 256
+    
+    # Respuestas JSON por el camino rápido (orjson si está instalado, sin revalidar response_model)
+    FAST_JSON_RESPONSES: bool = False
+    
+    # Ejecutor de cálculos (fuera del event loop) y control de admisión
+    COMPUTE_THREAD_WORKERS: int = 4
+    COMPUTE_PROCESS_WORKERS: int = 0  # 0 = los cálculos pesados también usan threads
+    COMPUTE_MAX_PENDING: int = 32
+    COMPUTE_RETRY_AFTER_SECONDS: int = 2
+    
+    # Colas de trabajos en segundo plano (guardado en NocoDB, emails y PDFs)
+    JOB_NOCODB_CONCURRENCY: int = 4
+    JOB_EMAIL_CONCURRENCY: int = 2  # SMTP y PDF corren en threads
+    JOB_MAX_RETRIES: int = 3  # reintentos si el trabajo falla o devuelve False
+    JOB_RETRY_BACKOFF_SECONDS: float = 2.0  # se duplica en cada reintento
+    JOB_QUEUE_MAX_SIZE: int = 1000  # 0 = sin límite
+    JOB_SHUTDOWN_TIMEOUT_SECONDS: float = 10.0  # espera al apagar antes de cancelar
+    
+    # Eventos de auditoría (tabla de logs de NocoDB, envío por lotes)
+    AUDIT_LOG_ENABLED: bool = True
+    AUDIT_BUFFER_SIZE: int = 10000  # buffer circular: si se llena se descartan los más viejos
+    AUDIT_FLUSH_SECONDS: float = 10.0
+    AUDIT_FALLBACK_PATH: str = "data/audit_log.jsonl"  # vacío = sin respaldo local
+    AUDIT_REPLAY_MAX_RECORDS: int = 1000  # reenviados del respaldo por envío
+    AUDIT_SAMPLE_RATES: Dict[str, float] = {"calculo_sistema": 0.1}  # fracción registrada por tipo
+    
+    # Cálculo por lotes (/api/solar/calculate/batch y /calculate/stream)
+    BATCH_MAX_ITEMS: int = 500  # lote JSON
+    BATCH_STREAM_CHUNK_SIZE: int = 100  # líneas NDJSON por tanda
+    BATCH_STREAM_MAX_LINE_BYTES: int = 65536
+    
+    # Exportación CSV en streaming (cotizaciones, contactos y logs)
+    EXPORT_PAGE_SIZE: int = 500  # filas por página leída del store / NocoDB
+    EXPORT_FLUSH_ROWS: int = 200  # filas por bloque enviado al cliente
+    
+    # Cliente HTTP saliente compartido (NocoDB, APIs de Argentina, precios)
+    HTTP_POOL_LIMIT: int = 100
+    HTTP_POOL_LIMIT_PER_HOST: int = 20
+    HTTP_KEEPALIVE_SECONDS: float = 30.0
+    HTTP_DNS_CACHE_SECONDS: int = 300
+    HTTP_TIMEOUT_TOTAL_SECONDS: float = 30.0
+    HTTP_TIMEOUT_CONNECT_SECONDS: float = 10.0
+    
+    # Health checks: ventana de validez del chequeo profundo (readiness)
+    HEALTH_READY_STALENESS_SECONDS: float = 15.0
+    HEALTH_CHECK_TIMEOUT_SECONDS: float = 5.0
+    
     # Configuración de la aplicación
     APP_NAME: str = "Cotizador de Construcción - Sumpetrol"
     APP_VERSION: str = "1.0.0"
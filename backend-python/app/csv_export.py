@@ -0,0 +1,141 @@
+"""
+Exportación CSV en streaming de cotizaciones, contactos y logs
+Usa los mismos encabezados que cotizaciones_solares.csv, contactos.csv y
+logs_sistema.csv; las filas se generan de a una desde el store o desde NocoDB
+"""
+
+import csv
+import io
+import json
+from datetime import datetime
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
+from .quote_store import QuoteRepository, sort_key
+from .solar_models import SolarQuoteResponse
+
+CSV_DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+QUOTE_COLUMNS = [
+    "nombre_cliente", "email_cliente", "ubicacion_proyecto", "consumo_mensual_kwh", "tipo_tarifa",
+    "area_disponible_m2", "tipo_instalacion", "potencia_requerida_kwp", "cantidad_paneles",
+    "generacion_mensual_kwh", "ahorro_mensual_ars", "inversion_total_ars", "retorno_inversion_anos",
+    "estado_cotizacion", "fecha_creacion", "valida_hasta", "notas_proyecto"
+]
+
+CONTACT_COLUMNS = [
+    "nombre_cliente", "email_cliente", "telefono_cliente", "mensaje_consulta", "fecha_consulta",
+    "estado_consulta", "origen_consulta", "notas_internas", "fecha_respuesta", "usuario_respuesta"
+]
+
+LOG_COLUMNS = [
+    "tipo_evento", "mensaje", "nivel_log", "usuario", "ip_cliente", "fecha_hora", "datos_adicionales"
+]
+
+# Nombres con los que save_solar_quote guarda algunas columnas en NocoDB
+QUOTE_COLUMN_ALIASES = {
+    "retorno_inversion_anos": "roi_anos",
+    "fecha_creacion": "fecha_cotizacion",
+    "notas_proyecto": "notas_adicionales",
+}
+
+# Columnas a pedir a NocoDB para exportar cotizaciones (con ambos nombres)
+QUOTE_NOCODB_FIELDS = QUOTE_COLUMNS + list(QUOTE_COLUMN_ALIASES.values())
+
+
+def _format(value: Any) -> Any:
+    if value is None:
+        return ""
+    if isinstance(value, datetime):
+        return value.strftime(CSV_DATE_FORMAT)
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False)
+    if hasattr(value, "value"):  # enums
+        return value.value
+    return value
+
+
+def quote_to_row(quote: SolarQuoteResponse) -> Dict[str, Any]:
+    """Cotización del store en el formato de cotizaciones_solares.csv"""
+    request, design = quote.request, quote.design
+    return {
+        "nombre_cliente": request.client_name,
+        "email_cliente": request.client_email,
+        "ubicacion_proyecto": request.location,
+        "consumo_mensual_kwh": request.monthly_consumption_kwh,
+        "tipo_tarifa": request.tariff_type,
+        "area_disponible_m2": request.available_area_m2,
+        "tipo_instalacion": request.installation_type,
+        "potencia_requerida_kwp": design.required_power_kwp,
+        "cantidad_paneles": design.panel_count,
+        "generacion_mensual_kwh": design.monthly_generation_kwh,
+        "ahorro_mensual_ars": design.monthly_savings,
+        "inversion_total_ars": design.total_investment,
+        "retorno_inversion_anos": design.payback_years,
+        "estado_cotizacion": quote.status,
+        "fecha_creacion": quote.created_at,
+        "valida_hasta": quote.valid_until,
+        "notas_proyecto": request.notes,
+    }
+
+
+def nocodb_quote_to_row(record: Dict[str, Any]) -> Dict[str, Any]:
+    """Registro de la tabla de cotizaciones de NocoDB en el formato del CSV"""
+    return {
+        column: record.get(column, record.get(QUOTE_COLUMN_ALIASES.get(column, column)))
+        for column in QUOTE_COLUMNS
+    }
+
+
+async def iter_store_quotes(repository: QuoteRepository, page_size: int,
+                            **filters: Any) -> AsyncIterator[SolarQuoteResponse]:
+    """Recorrer el store completo por páginas keyset (más recientes primero)"""
+    after = None
+    while True:
+        quotes, has_more = await repository.page(limit=page_size, after=after, **filters)
+        for quote in quotes:
+            yield quote
+        if not has_more or not quotes:
+            return
+        after = sort_key(quotes[-1])
+
+
+async def prefetch(records: AsyncIterator[Any]) -> AsyncIterator[Any]:
+    """
+    Obtener el primer elemento antes de empezar a responder, para que un error de
+    origen (NocoDB caído) se informe con un código HTTP y no como un CSV cortado
+    """
+    iterator = records.__aiter__()
+    try:
+        first = await iterator.__anext__()
+    except StopAsyncIteration:
+        first = None
+        iterator = None
+
+    async def chained() -> AsyncIterator[Any]:
+        if iterator is None:
+            return
+        yield first
+        async for record in iterator:
+            yield record
+
+    return chained()
+
+
+async def stream_csv(records: AsyncIterator[Any], columns: List[str],
+                     to_row: Optional[Callable[[Any], Dict[str, Any]]] = None,
+                     flush_rows: int = 200) -> AsyncIterator[str]:
+    """Encabezado y filas CSV, entregadas en bloques de `flush_rows` filas"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerow(columns)
+    pending = 0
+    async for record in records:
+        row = to_row(record) if to_row is not None else record
+        writer.writerow([_format(row.get(column)) for column in columns])
+        pending += 1
+        if pending >= flush_rows:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+    yield buffer.getvalue()
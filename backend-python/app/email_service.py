@@ -11,6 +11,7 @@ from email import encoders
 from typing import List, Optional
 import logging
 from .config import settings
+from .audit_log import audit_log
 
 logger = logging.getLogger(__name__)
 
@@ -216,10 +217,14 @@ class EmailService:
             server.quit()
             
             logger.info("Email enviado exitosamente")
+            audit_log.emit("email_enviado", "Email enviado exitosamente",
+                           destinatario=msg['To'], asunto=msg['Subject'])
             return True
             
         except Exception as e:
             logger.error(f"Error enviando email: {e}")
+            audit_log.emit("error_email", "Error enviando email", level="ERROR",
+                           destinatario=msg['To'], asunto=msg['Subject'], error=str(e))
             return False
 
 # Instancia global del servicio de email
@@ -13,6 +13,7 @@ import logging
 import json
 from datetime import datetime
 from .config import settings
+from .audit_log import audit_log
 
 logger = logging.getLogger(__name__)
 
@@ -369,10 +370,14 @@ class ImprovedEmailService:
             server.quit()
             
             logger.info(f"Email enviado exitosamente a {msg['To']}")
+            audit_log.emit("email_enviado", "Email enviado exitosamente",
+                           destinatario=msg['To'], asunto=msg['Subject'])
             return True
             
         except Exception as e:
             logger.error(f"Error enviando email: {e}")
+            audit_log.emit("error_email", "Error enviando email", level="ERROR",
+                           destinatario=msg['To'], asunto=msg['Subject'], error=str(e))
             return False
 
 # Instancia global del servicio mejorado
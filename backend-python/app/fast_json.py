@@ -0,0 +1,66 @@
+"""
+Serialización JSON rápida para respuestas de cotizaciones, diseños y materiales
+Usa orjson si está instalado; si no, el serializador de pydantic / json estándar.
+Los modelos ya fueron validados al construirse, por eso se devuelven como Response
+y FastAPI no vuelve a validarlos contra response_model.
+"""
+
+import json
+from typing import Any, Mapping, Optional
+
+from fastapi.responses import Response
+from pydantic import BaseModel
+
+from .config import settings
+
+try:
+    import orjson
+except ImportError:  # dependencia opcional
+    orjson = None
+
+
+def _default(obj: Any) -> Any:
+    # orjson serializa datetimes y enums de forma nativa: alcanza con el dump en modo python
+    if isinstance(obj, BaseModel):
+        return obj.model_dump()
+    # Igual que el camino con json estándar (Decimal, UUID, Path, ...)
+    return str(obj)
+
+
+def _default_json(obj: Any) -> Any:
+    if isinstance(obj, BaseModel):
+        return obj.model_dump(mode="json")
+    return str(obj)
+
+
+def dumps(content: Any) -> bytes:
+    """Serializar a bytes JSON (UTF-8, sin espacios)"""
+    if isinstance(content, BaseModel):
+        # El serializador de pydantic-core ya es nativo y evita el dump intermedio
+        return content.model_dump_json().encode("utf-8")
+    if orjson is not None:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, default=_default_json, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class FastJSONResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def fast_response(content: Any, sub_response: Optional[Response] = None,
+                  headers: Optional[Mapping[str, str]] = None) -> Any:
+    """
+    Devolver `content` por el camino rápido si FAST_JSON_RESPONSES está activo;
+    si no, devolverlo tal cual para que FastAPI lo serialice como siempre.
+    Los headers del Response inyectado en el endpoint se copian (FastAPI no los
+    agrega cuando el endpoint devuelve un Response propio).
+    """
+    if not settings.FAST_JSON_RESPONSES:
+        return content
+    merged = dict(sub_response.headers) if sub_response is not None else {}
+    merged.pop("content-length", None)
+    merged.update(headers or {})
+    return FastJSONResponse(content, headers=merged)
@@ -0,0 +1,111 @@
+"""
+Servicio de health checks
+Separa el chequeo de vida (liveness) del chequeo profundo de disponibilidad (readiness)
+"""
+
+import asyncio
+import logging
+import time
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+HealthCheck = Callable[[], Awaitable[Dict[str, Any]]]
+
+
+class HealthService:
+    """Ejecuta los chequeos de readiness y cachea el resultado durante una ventana configurable"""
+
+    def __init__(self, staleness_seconds: float, check_timeout_seconds: float):
+        self.staleness_seconds = staleness_seconds
+        self.check_timeout_seconds = check_timeout_seconds
+        self.started_at = datetime.now()
+
+        # nombre -> (función de chequeo, es crítico)
+        self._checks: Dict[str, tuple] = {}
+
+        self._last_result: Optional[Dict[str, Any]] = None
+        self._last_checked: float = 0.0
+        self._lock = asyncio.Lock()
+
+    def register_check(self, name: str, check: HealthCheck, critical: bool = True):
+        """Registrar un chequeo; si es crítico y falla, el servicio no está listo"""
+        self._checks[name] = (check, critical)
+
+    def liveness(self) -> Dict[str, Any]:
+        """Chequeo superficial: el proceso responde"""
+        return {
+            "status": "ok",
+            "timestamp": datetime.now().isoformat(),
+            "uptime_seconds": round((datetime.now() - self.started_at).total_seconds(), 1)
+        }
+
+    async def readiness(self, force: bool = False) -> Dict[str, Any]:
+        """Chequeo profundo cacheado; las llamadas concurrentes comparten una sola ejecución"""
+        if not force and self._is_fresh():
+            return self._with_age(cached=True)
+
+        async with self._lock:
+            # Otra corrutina pudo haber refrescado el resultado mientras esperábamos
+            if not force and self._is_fresh():
+                return self._with_age(cached=True)
+
+            results = await asyncio.gather(
+                *(self._run_check(name, check) for name, (check, _) in self._checks.items())
+            )
+            checks = dict(zip(self._checks.keys(), results))
+            ready = all(
+                checks[name]["status"] == "ok"
+                for name, (_, critical) in self._checks.items() if critical
+            )
+
+            self._last_result = {
+                "status": "ready" if ready else "not_ready",
+                "checked_at": datetime.now().isoformat(),
+                "checks": checks
+            }
+            self._last_checked = time.monotonic()
+            return self._with_age(cached=False)
+
+    def _is_fresh(self) -> bool:
+        return (
+            self._last_result is not None
+            and time.monotonic() - self._last_checked < self.staleness_seconds
+        )
+
+    def _with_age(self, cached: bool) -> Dict[str, Any]:
+        return {
+            **self._last_result,
+            "cached": cached,
+            "age_seconds": round(time.monotonic() - self._last_checked, 3),
+            "staleness_seconds": self.staleness_seconds
+        }
+
+    async def _run_check(self, name: str, check: HealthCheck) -> Dict[str, Any]:
+        started = time.perf_counter()
+        try:
+            detail = await asyncio.wait_for(check(), timeout=self.check_timeout_seconds)
+            status = "ok"
+        except asyncio.TimeoutError:
+            detail = {"error": f"timeout ({self.check_timeout_seconds}s)"}
+            status = "error"
+        except Exception as e:
+            logger.warning(f"Health check '{name}' falló: {e}")
+            detail = {"error": str(e)}
+            status = "error"
+
+        return {
+            "status": status,
+            "latency_ms": round((time.perf_counter() - started) * 1000, 1),
+            **(detail or {})
+        }
+
+
+# Instancia global del servicio de health checks
+health_service = HealthService(
+    staleness_seconds=settings.HEALTH_READY_STALENESS_SECONDS,
+    check_timeout_seconds=settings.HEALTH_CHECK_TIMEOUT_SECONDS
+)
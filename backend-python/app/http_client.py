@@ -0,0 +1,111 @@
+"""
+Registro de sesiones HTTP salientes (aiohttp) con el ciclo de vida de la aplicación
+Una sesión con pool de conexiones por upstream (nocodb, argentina_apis, ...):
+keep-alive, límite de conexiones por host, cache de DNS y timeouts configurables.
+Se inicia en el startup y se cierra en el shutdown de FastAPI.
+"""
+
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Optional
+
+import aiohttp
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class HTTPClientRegistry:
+    """
+    Sesiones compartidas por nombre, ligadas al event loop de la aplicación.
+    Fuera de ese loop (scripts, threads con su propio loop) session() entrega
+    una sesión temporal que se cierra al salir, como antes.
+    """
+
+    def __init__(self, limit: int, limit_per_host: int, keepalive_seconds: float,
+                 dns_cache_seconds: int, total_timeout_seconds: float, connect_timeout_seconds: float):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.keepalive_seconds = keepalive_seconds
+        self.dns_cache_seconds = dns_cache_seconds
+        self.timeout = aiohttp.ClientTimeout(total=total_timeout_seconds, connect=connect_timeout_seconds)
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._sessions: Dict[str, aiohttp.ClientSession] = {}
+        self.metrics = {"shared_requests": 0, "temporary_sessions": 0}
+
+    def _new_session(self) -> aiohttp.ClientSession:
+        connector = aiohttp.TCPConnector(
+            limit=self.limit,
+            limit_per_host=self.limit_per_host,
+            keepalive_timeout=self.keepalive_seconds,
+            ttl_dns_cache=self.dns_cache_seconds,
+            use_dns_cache=True
+        )
+        return aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+
+    def start(self):
+        """Ligar el registro al event loop actual (startup de la aplicación)"""
+        self._loop = asyncio.get_running_loop()
+        logger.info(
+            f"🌐 Cliente HTTP compartido iniciado (límite {self.limit}, {self.limit_per_host} por host, "
+            f"keep-alive {self.keepalive_seconds}s)"
+        )
+
+    def get(self, name: str = "default") -> Optional[aiohttp.ClientSession]:
+        """Sesión compartida `name`, o None si no hay registro activo en este loop"""
+        if self._loop is None:
+            return None
+        try:
+            if asyncio.get_running_loop() is not self._loop:
+                return None
+        except RuntimeError:
+            return None
+        session = self._sessions.get(name)
+        if session is None or session.closed:
+            session = self._new_session()
+            self._sessions[name] = session
+        return session
+
+    @asynccontextmanager
+    async def session(self, name: str = "default") -> AsyncIterator[aiohttp.ClientSession]:
+        """`async with http_clients.session("nocodb") as session:` (no cierra la compartida)"""
+        shared = self.get(name)
+        if shared is not None:
+            self.metrics["shared_requests"] += 1
+            yield shared
+            return
+        self.metrics["temporary_sessions"] += 1
+        async with self._new_session() as temporary:
+            yield temporary
+
+    async def close(self):
+        """Cerrar todas las sesiones (shutdown de la aplicación)"""
+        sessions = list(self._sessions.values())
+        self._sessions.clear()
+        self._loop = None
+        for session in sessions:
+            if not session.closed:
+                await session.close()
+        if sessions:
+            logger.info(f"🌐 {len(sessions)} sesiones HTTP cerradas")
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.metrics,
+            "active": self._loop is not None,
+            "sessions": sorted(name for name, session in self._sessions.items() if not session.closed),
+        }
+
+
+# Instancia global del registro de clientes HTTP
+http_clients = HTTPClientRegistry(
+    limit=settings.HTTP_POOL_LIMIT,
+    limit_per_host=settings.HTTP_POOL_LIMIT_PER_HOST,
+    keepalive_seconds=settings.HTTP_KEEPALIVE_SECONDS,
+    dns_cache_seconds=settings.HTTP_DNS_CACHE_SECONDS,
+    total_timeout_seconds=settings.HTTP_TIMEOUT_TOTAL_SECONDS,
+    connect_timeout_seconds=settings.HTTP_TIMEOUT_CONNECT_SECONDS
+)
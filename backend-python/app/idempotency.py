@@ -0,0 +1,198 @@
+"""
+Claves de idempotencia para operaciones con efectos secundarios (cotizaciones)
+Las solicitudes concurrentes con la misma clave comparten una sola ejecución y las
+repeticiones dentro de la ventana devuelven el resultado guardado sin repetir efectos.
+Mientras el líder ejecuta renueva su reclamo (created_at), así otro worker no lo toma
+por huérfano aunque la operación tarde más que pending_timeout_seconds
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class IdempotencyConflictError(Exception):
+    """La solicitud con esta clave sigue en proceso en otro worker"""
+
+
+class IdempotencyKeyReusedError(IdempotencyConflictError):
+    """La clave ya se usó con una solicitud distinta"""
+
+
+def fingerprint(payload: str) -> str:
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class IdempotencyStore:
+    """
+    Registro clave -> resultado en SQLite (compartido entre workers)
+    y coalescencia en el proceso con un future por clave en vuelo
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS idempotency_keys (
+        idempotency_key TEXT PRIMARY KEY,
+        request_hash TEXT NOT NULL,
+        result_id TEXT,
+        created_at REAL NOT NULL,
+        expires_at REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_idempotency_keys_expires_at ON idempotency_keys (expires_at);
+    """
+
+    def __init__(self, path: str, pending_timeout_seconds: float = 120.0):
+        self.path = path
+        self.pending_timeout_seconds = pending_timeout_seconds
+        self._inflight: Dict[str, Tuple[str, asyncio.Future]] = {}  # clave -> (hash de la solicitud, resultado)
+        self._local = threading.local()
+        self._schema_lock = threading.Lock()
+        self._schema_ready = False
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            with self._schema_lock:
+                if not self._schema_ready:
+                    connection.executescript(self.SCHEMA)
+                    self._schema_ready = True
+            self._local.connection = connection
+        return connection
+
+    def _claim(self, key: str, request_hash: str, window_seconds: float) -> Tuple[str, Optional[str]]:
+        """
+        Reservar la clave. Devuelve ("new", None) si este proceso debe ejecutar,
+        ("done", result_id) si ya hay resultado, o ("pending", None) si otro la está ejecutando.
+        """
+        now = time.time()
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.execute("DELETE FROM idempotency_keys WHERE expires_at <= ?", (now,))
+            # Reclamos sin resultado que quedaron huérfanos (worker caído) se liberan
+            connection.execute(
+                "DELETE FROM idempotency_keys WHERE result_id IS NULL AND created_at <= ?",
+                (now - self.pending_timeout_seconds,)
+            )
+            row = connection.execute(
+                "SELECT request_hash, result_id FROM idempotency_keys WHERE idempotency_key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                connection.execute(
+                    "INSERT INTO idempotency_keys VALUES (?, ?, NULL, ?, ?)",
+                    (key, request_hash, now, now + window_seconds)
+                )
+                state = ("new", None)
+            elif row[0] != request_hash:
+                state = ("conflict", None)
+            elif row[1] is None:
+                state = ("pending", None)
+            else:
+                state = ("done", row[1])
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        return state
+
+    def _complete(self, key: str, result_id: str):
+        self._connection().execute(
+            "UPDATE idempotency_keys SET result_id = ? WHERE idempotency_key = ?", (result_id, key)
+        )
+
+    def _touch(self, key: str):
+        self._connection().execute(
+            "UPDATE idempotency_keys SET created_at = ? WHERE idempotency_key = ? AND result_id IS NULL",
+            (time.time(), key)
+        )
+
+    async def _heartbeat(self, key: str):
+        """Renovar el reclamo mientras la operación sigue en curso"""
+        interval = self.pending_timeout_seconds / 3
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await asyncio.to_thread(self._touch, key)
+            except sqlite3.Error as e:
+                logger.warning(f"⚠️ No se pudo renovar el reclamo de idempotencia {key}: {e}")
+
+    def _release(self, key: str):
+        self._connection().execute("DELETE FROM idempotency_keys WHERE idempotency_key = ?", (key,))
+
+    async def release(self, key: str):
+        await asyncio.to_thread(self._release, key)
+
+    async def run(self, key: str, request_hash: str, window_seconds: float,
+                  operation: Callable[[], Awaitable[str]]) -> Tuple[str, bool]:
+        """
+        Ejecutar `operation` una sola vez por clave dentro de la ventana.
+        Devuelve (id del resultado, True si es una repetición).
+        """
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            inflight_hash, inflight_future = inflight
+            if inflight_hash != request_hash:
+                raise IdempotencyKeyReusedError("La clave de idempotencia ya se usó con otra solicitud")
+            # Misma clave en vuelo en este proceso: esperar el mismo resultado
+            return await asyncio.shield(inflight_future), True
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = (request_hash, future)
+        try:
+            result_id, replayed = await self._run_claimed(key, request_hash, window_seconds, operation)
+            future.set_result(result_id)
+            return result_id, replayed
+        except BaseException as e:
+            future.set_exception(e)
+            # Evitar el aviso de excepción no recuperada si nadie más esperaba
+            future.exception()
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+    async def _run_claimed(self, key: str, request_hash: str, window_seconds: float,
+                           operation: Callable[[], Awaitable[str]]) -> Tuple[str, bool]:
+        deadline = time.monotonic() + self.pending_timeout_seconds
+        while True:
+            state, result_id = await asyncio.to_thread(self._claim, key, request_hash, window_seconds)
+            if state == "done":
+                return result_id, True
+            if state == "conflict":
+                raise IdempotencyKeyReusedError("La clave de idempotencia ya se usó con otra solicitud")
+            if state == "new":
+                break
+            # Otro worker está ejecutando la misma clave
+            if time.monotonic() > deadline:
+                raise IdempotencyConflictError("La solicitud con esta clave sigue en proceso")
+            await asyncio.sleep(0.1)
+
+        heartbeat = asyncio.create_task(self._heartbeat(key))
+        try:
+            result_id = await operation()
+        except BaseException:
+            await asyncio.to_thread(self._release, key)
+            raise
+        finally:
+            heartbeat.cancel()
+        await asyncio.to_thread(self._complete, key, result_id)
+        return result_id, False
+
+
+# Instancia global de claves de idempotencia
+idempotency_store = IdempotencyStore(
+    settings.IDEMPOTENCY_STORE_PATH,
+    pending_timeout_seconds=settings.IDEMPOTENCY_PENDING_TIMEOUT_SECONDS
+)
@@ -0,0 +1,230 @@
+"""
+Ejecutor de trabajos en segundo plano con colas por nombre
+Reemplaza a BackgroundTasks: cada cola tiene su límite de concurrencia y de
+tamaño, reintentos con backoff exponencial y métricas (en cola, en curso,
+espera y duración). Las funciones async corren en el event loop; las
+síncronas (SMTP, PDF) en threads, así el loop no se bloquea.
+Un trabajo falla si lanza una excepción o devuelve False.
+"""
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Set
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Job:
+    queue: str
+    fn: Callable[..., Any]
+    args: tuple
+    kwargs: Dict[str, Any]
+    enqueued_at: float = field(default_factory=time.monotonic)
+    attempts: int = 0
+
+    @property
+    def name(self) -> str:
+        return getattr(self.fn, "__qualname__", repr(self.fn))
+
+
+class _JobQueue:
+    def __init__(self, name: str, concurrency: int, max_retries: int, max_size: int):
+        self.name = name
+        self.concurrency = max(1, concurrency)
+        self.max_retries = max_retries
+        self.max_size = max_size
+        self.queue: Optional[asyncio.Queue] = None
+        self.workers: List[asyncio.Task] = []
+        self.retry_handles: Set[asyncio.TimerHandle] = set()
+        self.running = 0
+        self.metrics = {"submitted": 0, "completed": 0, "failed": 0, "retried": 0, "rejected": 0, "cancelled": 0}
+        self._started = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._run_total = 0.0
+        self._finished = 0
+
+    @property
+    def busy(self) -> bool:
+        return bool(self.running or self.retry_handles or (self.queue is not None and self.queue.qsize()))
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.metrics,
+            "queued": self.queue.qsize() if self.queue is not None else 0,
+            "running": self.running,
+            "retry_pending": len(self.retry_handles),
+            "concurrency": self.concurrency,
+            "avg_wait_ms": round(self._wait_total / self._started * 1000, 2) if self._started else 0.0,
+            "max_wait_ms": round(self._wait_max * 1000, 2),
+            "avg_run_ms": round(self._run_total / self._finished * 1000, 2) if self._finished else 0.0,
+        }
+
+
+class JobRunner:
+    """Colas de trabajos del proceso; se inicia en el startup y se detiene en el shutdown"""
+
+    def __init__(self, retry_backoff_seconds: float, shutdown_timeout_seconds: float):
+        self.retry_backoff_seconds = retry_backoff_seconds
+        self.shutdown_timeout_seconds = shutdown_timeout_seconds
+        self._queues: Dict[str, _JobQueue] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def add_queue(self, name: str, concurrency: int, max_retries: int = 0, max_size: int = 0):
+        """Registrar una cola (max_size 0 = sin límite)"""
+        self._queues[name] = _JobQueue(name, concurrency, max_retries, max_size)
+
+    @property
+    def running(self) -> bool:
+        return self._loop is not None
+
+    def start(self):
+        """Iniciar los workers de todas las colas en el event loop actual"""
+        if self.running:
+            return
+        self._loop = asyncio.get_running_loop()
+        for job_queue in self._queues.values():
+            job_queue.queue = asyncio.Queue(maxsize=job_queue.max_size)
+            job_queue.workers = [
+                asyncio.create_task(self._worker(job_queue)) for _ in range(job_queue.concurrency)
+            ]
+        logger.info(
+            "🧵 Colas de trabajos iniciadas: "
+            + ", ".join(f"{q.name} ({q.concurrency} en paralelo)" for q in self._queues.values())
+        )
+
+    def submit(self, queue: str, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> bool:
+        """
+        Encolar fn(*args, **kwargs) en la cola indicada (desde cualquier thread).
+        Devuelve False si la cola está llena o el ejecutor no está en marcha.
+        """
+        job_queue = self._queues[queue]
+        if self._loop is None:
+            job_queue.metrics["rejected"] += 1
+            logger.error(f"❌ Trabajo {getattr(fn, '__qualname__', fn)} descartado: colas de trabajos detenidas")
+            return False
+        job = Job(queue, fn, args, kwargs)
+        try:
+            current = asyncio.get_running_loop()
+        except RuntimeError:
+            current = None
+        if current is not self._loop:
+            self._loop.call_soon_threadsafe(self._enqueue, job_queue, job)
+            return True
+        return self._enqueue(job_queue, job)
+
+    def _enqueue(self, job_queue: _JobQueue, job: Job) -> bool:
+        try:
+            job_queue.queue.put_nowait(job)
+        except asyncio.QueueFull:
+            job_queue.metrics["rejected"] += 1
+            logger.error(f"❌ Cola de trabajos {job_queue.name} llena: se descarta {job.name}")
+            return False
+        if job.attempts == 0:
+            job_queue.metrics["submitted"] += 1
+        return True
+
+    async def _worker(self, job_queue: _JobQueue):
+        while True:
+            job = await job_queue.queue.get()
+            started = time.monotonic()
+            wait = started - job.enqueued_at
+            job_queue._started += 1
+            job_queue._wait_total += wait
+            job_queue._wait_max = max(job_queue._wait_max, wait)
+            job_queue.running += 1
+            try:
+                await self._execute(job_queue, job)
+            except asyncio.CancelledError:
+                job_queue.metrics["cancelled"] += 1
+                raise
+            finally:
+                job_queue.running -= 1
+                job_queue._finished += 1
+                job_queue._run_total += time.monotonic() - started
+                job_queue.queue.task_done()
+
+    async def _execute(self, job_queue: _JobQueue, job: Job):
+        job.attempts += 1
+        try:
+            if asyncio.iscoroutinefunction(job.fn):
+                result = await job.fn(*job.args, **job.kwargs)
+            else:
+                result = await asyncio.to_thread(job.fn, *job.args, **job.kwargs)
+            error = None if result is not False else "devolvió False"
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            error = str(e) or type(e).__name__
+        
+        if error is None:
+            job_queue.metrics["completed"] += 1
+            return
+        if job.attempts <= job_queue.max_retries:
+            delay = self.retry_backoff_seconds * (2 ** (job.attempts - 1))
+            job_queue.metrics["retried"] += 1
+            logger.warning(
+                f"⚠️ Trabajo {job.name} falló ({error}); reintento {job.attempts}/{job_queue.max_retries} en {delay:.1f}s"
+            )
+            self._schedule_retry(job_queue, job, delay)
+        else:
+            job_queue.metrics["failed"] += 1
+            logger.error(f"❌ Trabajo {job.name} falló tras {job.attempts} intentos: {error}")
+
+    def _schedule_retry(self, job_queue: _JobQueue, job: Job, delay: float):
+        def requeue():
+            job_queue.retry_handles.discard(handle)
+            job.enqueued_at = time.monotonic()
+            self._enqueue(job_queue, job)
+        
+        handle = self._loop.call_later(delay, requeue)
+        job_queue.retry_handles.add(handle)
+
+    async def stop(self):
+        """Esperar hasta shutdown_timeout_seconds a que terminen los trabajos y cancelar el resto"""
+        if not self.running:
+            return
+        deadline = time.monotonic() + self.shutdown_timeout_seconds
+        while any(q.busy for q in self._queues.values()) and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        
+        for job_queue in self._queues.values():
+            for handle in job_queue.retry_handles:
+                handle.cancel()
+            job_queue.metrics["cancelled"] += len(job_queue.retry_handles) + job_queue.queue.qsize()
+            job_queue.retry_handles.clear()
+            for worker in job_queue.workers:
+                worker.cancel()
+        workers = [worker for q in self._queues.values() for worker in q.workers]
+        await asyncio.gather(*workers, return_exceptions=True)
+        cancelled = sum(q.metrics["cancelled"] for q in self._queues.values())
+        if cancelled:
+            logger.warning(f"⚠️ Colas de trabajos detenidas con {cancelled} trabajos cancelados")
+        self._loop = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {"running": self.running, "queues": {name: q.get_stats() for name, q in self._queues.items()}}
+
+
+# Instancia global del ejecutor de trabajos
+job_runner = JobRunner(
+    retry_backoff_seconds=settings.JOB_RETRY_BACKOFF_SECONDS,
+    shutdown_timeout_seconds=settings.JOB_SHUTDOWN_TIMEOUT_SECONDS
+)
+job_runner.add_queue(
+    "nocodb",
+    concurrency=settings.JOB_NOCODB_CONCURRENCY,
+    max_retries=settings.JOB_MAX_RETRIES,
+    max_size=settings.JOB_QUEUE_MAX_SIZE
+)
+job_runner.add_queue(
+    "email",
+    concurrency=settings.JOB_EMAIL_CONCURRENCY,
+    max_retries=settings.JOB_MAX_RETRIES,
+    max_size=settings.JOB_QUEUE_MAX_SIZE
+)
@@ -1,8 +1,9 @@
-from fastapi import FastAPI, HTTPException, BackgroundTasks, Request
+from fastapi import FastAPI, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse, FileResponse
 from pydantic import ValidationError
 import uvicorn
+import asyncio
 import logging
 from typing import List, Dict, Any
 import json
@@ -22,51 +23,25 @@ from .pdf_service import pdf_service
 from .argentina_apis import argentina_api_service, get_current_prices, get_current_exchange_rate
 from .price_updater import price_updater_service, start_price_updater, get_price_updater_status
 from .config import settings
-from .solar_routes import router as solar_router
-
-# Función wrapper para guardar contacto en NocoDB
-def save_contact_to_nocodb(contact_data: Dict[str, Any]):
-    """Wrapper síncrono para guardar contacto en NocoDB"""
-    import asyncio
-    import aiohttp
-    try:
-        logger.info(f"🔄 Guardando contacto en NocoDB: {contact_data.get('nombre', 'Sin nombre')}")
-        logger.info(f"📊 Datos recibidos: {contact_data}")
-        
-        # Preparar datos para NocoDB con columnas correctas
-        nocodb_data = {
-            "nombre_cliente": contact_data.get("nombre", ""),
-            "email_cliente": contact_data.get("email", ""),
-            "telefono_cliente": contact_data.get("telefono", ""),
-            "mensaje_consulta": contact_data.get("mensaje", ""),
-            "fecha_consulta": contact_data.get("fecha", datetime.now().strftime("%Y-%m-%d %H:%M:%S")),
-            "estado_consulta": "Nuevo",
-            "origen_consulta": "Web Solar",
-            "notas_internas": "",
-            "fecha_respuesta": None,
-            "usuario_respuesta": None
-        }
-        
-        logger.info(f"📝 Datos preparados para NocoDB: {nocodb_data}")
-        
-        # Crear nuevo loop de eventos para la tarea async
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        
-        try:
-            # Llamar directamente a la función async
-            success = loop.run_until_complete(nocodb_service.save_contact_form(contact_data))
-            if success:
-                logger.info("✅ Contacto guardado exitosamente en NocoDB")
-            else:
-                logger.error("❌ Error guardando contacto en NocoDB")
-        finally:
-            loop.close()
-            
-    except Exception as e:
-        logger.error(f"❌ Error en wrapper de guardado de contacto: {e}")
-        import traceback
-        logger.error(f"❌ Traceback: {traceback.format_exc()}")
+from .solar_routes import router as solar_router, start_materials_refresh, stop_materials_refresh
+from .quote_store import start_quote_sweeper, stop_quote_sweeper
+from .stock_reservations import start_stock_refresh, stop_stock_refresh
+from .price_history import price_history
+from .compute_executor import compute_executor
+from .http_client import http_clients
+from .job_runner import job_runner
+from .audit_log import audit_log
+
+# Trabajo de la cola "nocodb": guardar contacto en NocoDB
+async def save_contact_to_nocodb(contact_data: Dict[str, Any]) -> bool:
+    """Guardar contacto en NocoDB desde el event loop de la aplicación"""
+    logger.info(f"🔄 Guardando contacto en NocoDB: {contact_data.get('nombre', 'Sin nombre')}")
+    success = await nocodb_service.save_contact_form(contact_data)
+    if success:
+        logger.info("✅ Contacto guardado exitosamente en NocoDB")
+    else:
+        logger.error("❌ Error guardando contacto en NocoDB")
+    return success
 
 # Configuración de logging
 logging.basicConfig(level=logging.INFO)
@@ -118,7 +93,7 @@ async def test_nocodb_connection():
     """Test NocoDB connection"""
     try:
         # Test contactos table
-        contactos_result = await nocodb_service.get_contacts(limit=1)
+        contactos_ok = await nocodb_service.check_connection()
         
         return {
             "status": "success",
@@ -126,7 +101,7 @@ async def test_nocodb_connection():
             "base_id": settings.NOCODB_BASE_ID,
             "contactos_table_id": getattr(settings, 'NOCODB_CONTACTOS_TABLE_ID', 'not_set'),
             "contactos_url": nocodb_service.contactos_url,
-            "contactos_test": "ok" if contactos_result is not None else "error",
+            "contactos_test": "ok" if contactos_ok else "error",
             "message": "NocoDB connection test completed"
         }
     except Exception as e:
@@ -161,7 +136,7 @@ async def test_email_service():
         }
 
 @app.post("/cotizar", response_model=CotizacionResponse)
-async def crear_cotizacion(request: CotizacionRequest, background_tasks: BackgroundTasks):
+async def crear_cotizacion(request: CotizacionRequest):
     """Crea una nueva cotización de construcción"""
     try:
         logger.info(f"Nueva cotización solicitada por: {request.nombre}")
@@ -177,7 +152,8 @@ async def crear_cotizacion(request: CotizacionRequest, background_tasks: Backgro
         cotizacion = await calculator.calculate_quote(request)
         
         # Guardar en Nocodb en background
-        background_tasks.add_task(
+        job_runner.submit(
+            "nocodb",
             nocodb_service.save_customer_data,
             {
                 "fecha": datetime.now().strftime("%Y-%m-%d"),
@@ -197,6 +173,13 @@ async def crear_cotizacion(request: CotizacionRequest, background_tasks: Backgro
         )
         
         logger.info(f"Cotización creada exitosamente. ID: {cotizacion.id}")
+        audit_log.emit(
+            "cotizacion_construccion_generada",
+            f"Cotización de construcción generada para {request.nombre}",
+            cotizacion_id=cotizacion.id,
+            cliente=request.nombre,
+            total=cotizacion.total_estimado
+        )
         
         return cotizacion
         
@@ -208,10 +191,7 @@ async def crear_cotizacion(request: CotizacionRequest, background_tasks: Backgro
         raise HTTPException(status_code=500, detail="Error interno del servidor")
 
 @app.post("/cotizar/enviar-email")
-async def enviar_cotizacion_email(
-    request: Request,
-    background_tasks: BackgroundTasks
-):
+async def enviar_cotizacion_email(request: Request):
     """Envía la cotización por email al cliente"""
     try:
         # Obtener datos del body
@@ -238,8 +218,9 @@ async def enviar_cotizacion_email(
         
         logger.info(f"Enviando email de cotización a {customer_email} para {customer_name}")
         
-        # Generar PDF en background
-        background_tasks.add_task(
+        # Generar PDF y enviar en background (en un thread: PDF y SMTP son bloqueantes)
+        job_runner.submit(
+            "email",
             _generate_and_send_pdf_email,
             customer_email,
             customer_name,
@@ -256,8 +237,8 @@ async def enviar_cotizacion_email(
         logger.error(f"Error enviando email: {e}")
         raise HTTPException(status_code=500, detail=f"Error enviando email: {str(e)}")
 
-async def _generate_and_send_pdf_email(customer_email: str, customer_name: str, quote_data: Dict[str, Any]):
-    """Función helper para generar PDF y enviar email en background"""
+def _generate_and_send_pdf_email(customer_email: str, customer_name: str, quote_data: Dict[str, Any]) -> bool:
+    """Función helper para generar PDF y enviar email en background (False = reintentar)"""
     try:
         # Generar PDF
         pdf_path = pdf_service.generate_quote_pdf(quote_data, {"nombre": customer_name, "email": customer_email})
@@ -273,15 +254,14 @@ async def _generate_and_send_pdf_email(customer_email: str, customer_name: str,
             logger.info(f"Email con PDF enviado exitosamente a {customer_email}")
         else:
             logger.error(f"Error enviando email a {customer_email}")
-            
+        return success
+        
     except Exception as e:
         logger.error(f"Error en proceso de email con PDF: {e}")
+        return False
 
 @app.post("/contacto/enviar")
-async def enviar_contacto(
-    request: Request,
-    background_tasks: BackgroundTasks
-):
+async def enviar_contacto(request: Request):
     """Envía formulario de contacto"""
     try:
         logger.info("📧 Recibiendo formulario de contacto...")
@@ -302,7 +282,8 @@ async def enviar_contacto(
             raise HTTPException(status_code=400, detail="Faltan datos requeridos")
         
         # Enviar email usando el servicio mejorado
-        background_tasks.add_task(
+        job_runner.submit(
+            "email",
             improved_email_service.send_contact_form_email,
             nombre,
             email,
@@ -311,7 +292,8 @@ async def enviar_contacto(
         )
         
         # Guardar en Nocodb
-        background_tasks.add_task(
+        job_runner.submit(
+            "nocodb",
             save_contact_to_nocodb,
             {
                 "fecha": datetime.now().strftime("%Y-%m-%d"),
@@ -322,6 +304,13 @@ async def enviar_contacto(
             }
         )
         
+        audit_log.emit(
+            "contacto_recibido",
+            "Nuevo formulario de contacto recibido",
+            ip=request.client.host if request.client else None,
+            nombre=nombre,
+            email=email
+        )
         logger.info("✅ Formulario de contacto procesado exitosamente")
         
         return {
@@ -380,7 +369,10 @@ async def crear_cliente(customer_data: dict):
         raise HTTPException(status_code=500, detail=f"Error creando cliente: {str(e)}")
 
 @app.get("/nocodb/clientes")
-async def obtener_clientes(limit: int = 100):
+async def obtener_clientes(
+    limit: int = Query(100, ge=1, le=settings.NOCODB_LIST_MAX_LIMIT,
+                       description="Para listados completos usar /api/solar/contacts/export")
+):
     """Obtiene lista de clientes desde Nocodb"""
     try:
         clientes = await nocodb_service.get_customers(limit)
@@ -426,10 +418,12 @@ async def obtener_desglose_costos(
             tipo_uso=tipo_uso,
             nivel_terminacion=nivel_terminacion,
             metros_cuadrados=metros_cuadrados,
-            provincia=provincia
+            provincia=provincia,
+            ciudad="Consulta"
         )
         
-        desglose = await calculator.get_cost_breakdown(request)
+        # Cálculo aritmético de microsegundos: se hace directamente en el event loop
+        desglose = calculator.get_cost_breakdown(request)
         
         return {
             "metros_cuadrados": metros_cuadrados,
@@ -440,6 +434,8 @@ async def obtener_desglose_costos(
             "desglose": desglose
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error calculando desglose: {e}")
         raise HTTPException(status_code=500, detail="Error calculando costos")
@@ -791,10 +787,38 @@ async def startup_event():
     try:
         logger.info("🚀 Iniciando Cotizador de Construcción API...")
         
+        # Sesiones HTTP salientes compartidas (pool de conexiones por upstream)
+        http_clients.start()
+        
+        # Colas de trabajos en segundo plano (NocoDB, emails y PDFs)
+        job_runner.start()
+        
+        # Eventos de auditoría: envío periódico por lotes a la tabla de logs
+        audit_log.start(nocodb_service.save_system_logs)
+        
+        # Altas en NocoDB: outbox durable o, si está desactivado, por lotes en memoria
+        if settings.NOCODB_OUTBOX_ENABLED:
+            nocodb_service.outbox.start(nocodb_service.deliver_outbox_batch)
+        elif settings.NOCODB_WRITE_BEHIND_ENABLED:
+            nocodb_service.writer.start()
+        
         # Iniciar servicio de actualización automática
         await start_price_updater()
         
         logger.info("✅ Servicio de actualización automática iniciado")
+        
+        # Historial de precios desde disco, fuera del event loop (antes del primer refresco del catálogo)
+        await asyncio.to_thread(price_history.load)
+        
+        # Cargar el catálogo solar desde NocoDB y refrescarlo periódicamente
+        start_materials_refresh()
+        
+        # Barrido periódico de cotizaciones solares vencidas
+        start_quote_sweeper()
+        
+        # Snapshot en memoria de las reservas de stock (otros workers y vencimientos)
+        start_stock_refresh()
+        
         logger.info("✅ API lista para recibir solicitudes")
         
     except Exception as e:
@@ -808,6 +832,15 @@ async def shutdown_event():
         
         # Detener servicio de actualización automática
         price_updater_service.stop()
+        await stop_materials_refresh()
+        await stop_quote_sweeper()
+        await stop_stock_refresh()
+        compute_executor.shutdown()
+        await job_runner.stop()
+        await audit_log.stop()
+        await nocodb_service.outbox.stop()
+        await nocodb_service.writer.drain()
+        await http_clients.close()
         
         logger.info("✅ Servicio de actualización automática detenido")
         logger.info("✅ API cerrada correctamente")
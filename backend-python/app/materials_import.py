@@ -0,0 +1,292 @@
+"""
+Importación masiva de listas de precios de proveedores (esquema de materiales_solares.csv)
+Lee el CSV en streaming, valida por tandas y hace upsert en NocoDB con llamadas masivas
+
+Uso por línea de comandos:
+    python -m app.materials_import materiales_solares.csv [--dry-run] [--no-upsert]
+"""
+
+import argparse
+import asyncio
+import csv
+import logging
+import time
+from datetime import datetime
+from itertools import islice
+from typing import Any, Dict, Iterable, Iterator, List, Optional, TextIO, Tuple
+
+from .config import settings
+from .nocodb_service import NocodbService, material_key, nocodb_service
+from .solar_materials_service import SolarMaterialsService, map_nocodb_material
+
+logger = logging.getLogger(__name__)
+
+# Columnas de la tabla materiales_solares en NocoDB
+NOCODB_COLUMNS = [
+    "tipo_material", "marca", "modelo", "potencia_watts", "potencia_kw",
+    "precio_ars", "precio_por_kw", "stock_disponible", "activo",
+    "especificaciones_tecnicas", "garantia_anos", "proveedor", "fecha_actualizacion"
+]
+
+MATERIAL_TYPES = {"panel", "inversor", "bateria", "montaje", "cable", "proteccion"}
+
+FLOAT_COLUMNS = {"potencia_kw", "precio_ars", "precio_por_kw", "capacity_ah", "voltage", "efficiency", "weight"}
+INT_COLUMNS = {"potencia_watts", "stock_disponible", "garantia_anos", "cycles"}
+
+# Cantidad máxima de errores de validación que se devuelven en el resumen
+MAX_REPORTED_ERRORS = 100
+
+
+# Alta pendiente (registro, Future con el id creado) y modificación (registro, id o Future)
+PendingInsert = Tuple[Dict[str, Any], "asyncio.Future"]
+PendingUpdate = Tuple[Dict[str, Any], Any]
+
+
+class RowValidationError(ValueError):
+    """Fila del CSV que no cumple el esquema"""
+
+
+def parse_bool(value: Any) -> bool:
+    """Interpretar los valores de checkbox que usan las planillas de proveedores"""
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in {"true", "1", "si", "sí", "yes", "x"}
+
+
+def validate_row(row: Dict[str, Any]) -> Dict[str, Any]:
+    """Validar y normalizar una fila; devuelve el registro con tipos nativos"""
+    record: Dict[str, Any] = {}
+    for column, value in row.items():
+        if column is None:
+            continue
+        value = value.strip() if isinstance(value, str) else value
+        if value in (None, ""):
+            continue
+        try:
+            if column in FLOAT_COLUMNS:
+                record[column] = float(value)
+            elif column in INT_COLUMNS:
+                record[column] = int(float(value))
+            elif column == "activo":
+                record[column] = parse_bool(value)
+            else:
+                record[column] = value
+        except (TypeError, ValueError):
+            raise RowValidationError(f"Valor inválido en '{column}': {value!r}")
+
+    tipo = str(record.get("tipo_material", "")).lower()
+    if tipo not in MATERIAL_TYPES:
+        raise RowValidationError(f"tipo_material inválido: {record.get('tipo_material')!r}")
+    record["tipo_material"] = tipo
+
+    for column in ("marca", "modelo"):
+        if not record.get(column):
+            raise RowValidationError(f"Falta '{column}'")
+
+    if tipo == "montaje":
+        if record.get("precio_por_kw", 0) <= 0:
+            raise RowValidationError("precio_por_kw debe ser mayor a 0")
+    elif record.get("precio_ars", 0) <= 0:
+        raise RowValidationError("precio_ars debe ser mayor a 0")
+
+    record.setdefault("activo", True)
+    record.setdefault("fecha_actualizacion", datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+    return record
+
+
+def iter_chunks(rows: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    """Agrupar un iterable en listas de a lo sumo `size` elementos sin materializarlo"""
+    iterator = iter(rows)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class MaterialsImporter:
+    """Importa materiales por tandas: validación, upsert masivo en NocoDB y actualización del catálogo"""
+
+    def __init__(self,
+                 nocodb: NocodbService = nocodb_service,
+                 materials_service: Optional[SolarMaterialsService] = None,
+                 chunk_size: Optional[int] = None,
+                 concurrency: Optional[int] = None):
+        self.nocodb = nocodb
+        self.materials_service = materials_service
+        self.chunk_size = chunk_size or settings.MATERIALS_IMPORT_CHUNK_SIZE
+        self.concurrency = concurrency or settings.MATERIALS_IMPORT_CONCURRENCY
+
+    async def import_csv(self, stream: TextIO, dry_run: bool = False, upsert: bool = True) -> Dict[str, Any]:
+        """Importar desde un flujo de texto CSV (se lee fila por fila)"""
+        return await self.import_rows(csv.DictReader(stream), dry_run=dry_run, upsert=upsert)
+
+    async def import_rows(self, rows: Iterable[Dict[str, Any]], dry_run: bool = False, upsert: bool = True) -> Dict[str, Any]:
+        """Importar registros con el esquema de materiales_solares"""
+        started = time.perf_counter()
+        summary: Dict[str, Any] = {
+            "total_rows": 0, "valid_rows": 0, "invalid_rows": 0,
+            "inserted": 0, "updated": 0, "failed": 0,
+            "duplicate_rows": 0, "batches": 0, "dry_run": dry_run, "errors": []
+        }
+
+        existing: Dict[tuple, Any] = {}
+        if upsert and not dry_run:
+            keys = await self.nocodb.get_material_keys()
+            if keys is None:
+                raise ConnectionError("No se pudo obtener el índice de materiales de NocoDB")
+            existing = keys
+
+        pending: set = set()
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        # Las filas se numeran desde 2 (la 1 es el encabezado)
+        for chunk in iter_chunks(enumerate(rows, start=2), self.chunk_size):
+            valid: Dict[tuple, Dict[str, Any]] = {}
+            for line_number, row in chunk:
+                summary["total_rows"] += 1
+                try:
+                    record = validate_row(row)
+                except RowValidationError as e:
+                    summary["invalid_rows"] += 1
+                    if len(summary["errors"]) < MAX_REPORTED_ERRORS:
+                        summary["errors"].append({"line": line_number, "error": str(e)})
+                    continue
+                summary["valid_rows"] += 1
+                # Filas repetidas dentro de la tanda: gana la última
+                key = material_key(record)
+                if key in valid:
+                    summary["duplicate_rows"] += 1
+                    del valid[key]
+                valid[key] = record
+
+            if dry_run or not valid:
+                continue
+
+            inserts, updates = self._classify(valid, existing)
+
+            # Limitar las tandas en vuelo mantiene acotada la memoria
+            await semaphore.acquire()
+            task = asyncio.create_task(self._write_chunk(inserts, updates, existing, summary))
+            task.add_done_callback(lambda _: semaphore.release())
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+            summary["batches"] += 1
+
+        if pending:
+            await asyncio.gather(*pending)
+
+        summary["elapsed_seconds"] = round(time.perf_counter() - started, 3)
+        logger.info(
+            f"Importación de materiales: {summary['valid_rows']}/{summary['total_rows']} filas válidas, "
+            f"{summary['inserted']} insertadas, {summary['updated']} actualizadas en {summary['elapsed_seconds']}s"
+        )
+        return summary
+
+    @staticmethod
+    def _classify(valid: Dict[tuple, Dict[str, Any]], existing: Dict[tuple, Any]) -> Tuple[List[PendingInsert], List[PendingUpdate]]:
+        """
+        Separar la tanda en altas y modificaciones antes de despacharla.
+        Las claves nuevas quedan reservadas en `existing` con un Future que resuelve
+        el id creado, así una tanda posterior con la misma clave espera el alta
+        en lugar de insertar un duplicado
+        """
+        loop = asyncio.get_running_loop()
+        inserts: List[PendingInsert] = []
+        updates: List[PendingUpdate] = []
+        for key, record in valid.items():
+            material_id = existing.get(key)
+            if material_id is None:
+                reservation = loop.create_future()
+                existing[key] = reservation
+                inserts.append((record, reservation))
+            else:
+                updates.append((record, material_id))
+        return inserts, updates
+
+    async def _write_chunk(self, inserts: List[PendingInsert], updates: List[PendingUpdate],
+                           existing: Dict[tuple, Any], summary: Dict[str, Any]):
+        """Enviar las altas y modificaciones de la tanda en llamadas masivas"""
+        id_field = settings.NOCODB_ID_FIELD
+        catalog_entries: List[Tuple[str, Dict[str, Any]]] = []
+
+        try:
+            if inserts:
+                records = [record for record, _ in inserts]
+                created = await self.nocodb.bulk_insert_records(
+                    self.nocodb.materiales_url,
+                    [self._nocodb_columns(r) for r in records]
+                )
+                if created is None:
+                    summary["failed"] += len(inserts)
+                    for record, reservation in inserts:
+                        # Sin alta la clave queda libre para tandas futuras
+                        existing.pop(material_key(record), None)
+                        reservation.set_result(None)
+                else:
+                    summary["inserted"] += len(inserts)
+                    for (record, reservation), result in zip(inserts, created):
+                        record[id_field] = result.get(id_field, result.get("Id"))
+                        existing[material_key(record)] = record[id_field]
+                        reservation.set_result(record[id_field])
+                    catalog_entries.extend(filter(None, map(map_nocodb_material, records)))
+        finally:
+            for _, reservation in inserts:
+                if not reservation.done():
+                    reservation.set_result(None)
+
+        if updates:
+            ready: List[Dict[str, Any]] = []
+            for record, material_id in updates:
+                if isinstance(material_id, asyncio.Future):
+                    # Clave reservada por una tanda anterior: esperar su alta
+                    material_id = await material_id
+                if material_id is None:
+                    summary["failed"] += 1
+                    continue
+                record[id_field] = material_id
+                ready.append(record)
+            payload = [{id_field: r[id_field], **self._nocodb_columns(r)} for r in ready]
+            if payload and await self.nocodb.bulk_update_records(self.nocodb.materiales_url, payload):
+                summary["updated"] += len(ready)
+                catalog_entries.extend(filter(None, map(map_nocodb_material, ready)))
+            else:
+                summary["failed"] += len(ready)
+
+        if self.materials_service is not None and catalog_entries:
+            self.materials_service.upsert_materials(catalog_entries)
+
+    @staticmethod
+    def _nocodb_columns(record: Dict[str, Any]) -> Dict[str, Any]:
+        return {column: record[column] for column in NOCODB_COLUMNS if column in record}
+
+
+async def _main(args: argparse.Namespace) -> Dict[str, Any]:
+    importer = MaterialsImporter(chunk_size=args.chunk_size, concurrency=args.concurrency)
+    with open(args.path, "r", encoding="utf-8-sig", newline="") as stream:
+        return await importer.import_csv(stream, dry_run=args.dry_run, upsert=not args.no_upsert)
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Importar lista de precios de materiales solares a NocoDB")
+    parser.add_argument("path", help="Archivo CSV con el esquema de materiales_solares.csv")
+    parser.add_argument("--dry-run", action="store_true", help="Solo validar, sin escribir en NocoDB")
+    parser.add_argument("--no-upsert", action="store_true", help="Insertar siempre, sin buscar materiales existentes")
+    parser.add_argument("--chunk-size", type=int, default=None, help="Filas por tanda")
+    parser.add_argument("--concurrency", type=int, default=None, help="Tandas simultáneas hacia NocoDB")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    summary = asyncio.run(_main(args))
+    print(
+        f"Filas: {summary['total_rows']} | válidas: {summary['valid_rows']} | inválidas: {summary['invalid_rows']} | "
+        f"duplicadas: {summary['duplicate_rows']} | insertadas: {summary['inserted']} | actualizadas: {summary['updated']} | fallidas: {summary['failed']} | "
+        f"{summary['elapsed_seconds']}s"
+    )
+    for error in summary["errors"]:
+        print(f"  línea {error['line']}: {error['error']}")
+    return 0 if summary["failed"] == 0 else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,261 @@
+"""
+Búsqueda facetada sobre el catálogo de materiales solares
+Índice invertido en memoria sobre marca, modelo, especificaciones y proveedor,
+actualizado incrementalmente cuando cambia la versión del catálogo
+"""
+
+import bisect
+import logging
+import re
+import unicodedata
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+# Campos indexados y su peso en el ranking
+INDEXED_FIELDS = {
+    "brand": 3.0,
+    "model": 3.0,
+    "specifications": 1.0,
+    "supplier": 1.5,
+}
+
+# Bandas de potencia en watts: (límite superior exclusivo, etiqueta)
+PANEL_POWER_BANDS = [(300, "<300W"), (450, "300-449W"), (550, "450-549W"), (float("inf"), ">=550W")]
+SYSTEM_POWER_BANDS = [(3000, "<3kW"), (10000, "3-10kW"), (float("inf"), ">10kW")]
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:[.,][0-9]+)?")
+
+
+def normalize(text: Any) -> str:
+    """Minúsculas y sin acentos"""
+    text = unicodedata.normalize("NFKD", str(text or "").lower())
+    return "".join(c for c in text if not unicodedata.combining(c))
+
+
+def tokenize(text: Any) -> List[str]:
+    return _TOKEN_RE.findall(normalize(text))
+
+
+def material_power_watts(category: str, item: Dict[str, Any]) -> Optional[float]:
+    """Potencia del material normalizada a watts (None si no aplica)"""
+    if category == "panels":
+        return float(item.get("power_watts") or 0)
+    if category in ("inverters", "batteries"):
+        return float(item.get("power_kw") or 0) * 1000
+    return None
+
+
+def material_price(category: str, item: Dict[str, Any]) -> float:
+    if category == "mounting":
+        return float(item.get("price_per_kw") or 0)
+    return float(item.get("price_ars") or 0)
+
+
+def power_band(category: str, item: Dict[str, Any]) -> Optional[str]:
+    watts = material_power_watts(category, item)
+    if watts is None:
+        return None
+    bands = PANEL_POWER_BANDS if category == "panels" else SYSTEM_POWER_BANDS
+    for upper, label in bands:
+        if watts < upper:
+            return label
+    return None
+
+
+class MaterialsSearchIndex:
+    """Índice invertido con facetas por tipo, marca y banda de potencia"""
+
+    def __init__(self):
+        self.version: Optional[int] = None
+
+        # clave "categoría:id" -> documento
+        self._docs: Dict[str, Dict[str, Any]] = {}
+        # token -> {clave: peso acumulado}
+        self._postings: Dict[str, Dict[str, float]] = {}
+        # clave -> tokens del documento (para poder des-indexarlo)
+        self._doc_tokens: Dict[str, Set[str]] = {}
+
+        # Vocabulario ordenado para búsquedas por prefijo; se regenera solo si cambia
+        self._vocabulary: List[str] = []
+        self._vocabulary_dirty = False
+
+    def sync(self, materials_service) -> Dict[str, int]:
+        """Actualizar el índice si cambió la versión del catálogo, reindexando solo lo modificado"""
+        if self.version == materials_service.version:
+            return {"added": 0, "updated": 0, "removed": 0}
+
+        stats = {"added": 0, "updated": 0, "removed": 0}
+        seen: Set[str] = set()
+        for category, items in materials_service.get_materials().items():
+            for item in items:
+                key = f"{category}:{item.get('id')}"
+                seen.add(key)
+                current = self._docs.get(key)
+                if current is not None and current["item"] == item:
+                    continue
+                if current is not None:
+                    self._remove(key)
+                    stats["updated"] += 1
+                else:
+                    stats["added"] += 1
+                self._add(key, category, item)
+
+        for key in [k for k in self._docs if k not in seen]:
+            self._remove(key)
+            stats["removed"] += 1
+
+        self.version = materials_service.version
+        if any(stats.values()):
+            logger.info(f"Índice de búsqueda sincronizado (versión {self.version}): {stats}")
+        return stats
+
+    def _add(self, key: str, category: str, item: Dict[str, Any]):
+        # Copia superficial: el catálogo reemplaza diccionarios, no los modifica in situ
+        doc = {
+            "key": key,
+            "category": category,
+            "item": dict(item),
+            "brand": str(item.get("brand") or ""),
+            "brand_normalized": normalize(item.get("brand")),
+            "power_band": power_band(category, item),
+            "power_watts": material_power_watts(category, item),
+            "price": material_price(category, item),
+            "active": item.get("active", True),
+        }
+        self._docs[key] = doc
+
+        tokens: Set[str] = set()
+        for field, weight in INDEXED_FIELDS.items():
+            for token in tokenize(item.get(field)):
+                postings = self._postings.setdefault(token, {})
+                if not postings:
+                    self._vocabulary_dirty = True
+                postings[key] = postings.get(key, 0.0) + weight
+                tokens.add(token)
+        self._doc_tokens[key] = tokens
+
+    def _remove(self, key: str):
+        self._docs.pop(key, None)
+        for token in self._doc_tokens.pop(key, set()):
+            postings = self._postings.get(token)
+            if postings is None:
+                continue
+            postings.pop(key, None)
+            if not postings:
+                del self._postings[token]
+                self._vocabulary_dirty = True
+
+    def _expand(self, token: str) -> List[str]:
+        """Tokens del vocabulario que empiezan con el prefijo dado"""
+        if self._vocabulary_dirty:
+            self._vocabulary = sorted(self._postings)
+            self._vocabulary_dirty = False
+        start = bisect.bisect_left(self._vocabulary, token)
+        matches = []
+        for candidate in self._vocabulary[start:]:
+            if not candidate.startswith(token):
+                break
+            matches.append(candidate)
+        return matches
+
+    def _match_text(self, query: str) -> Optional[Dict[str, float]]:
+        """Claves que contienen todos los términos (el último como prefijo) con su puntaje"""
+        terms = tokenize(query)
+        if not terms:
+            return None
+
+        scores: Optional[Dict[str, float]] = None
+        for position, term in enumerate(terms):
+            is_last = position == len(terms) - 1
+            candidates = self._expand(term) if is_last else ([term] if term in self._postings else [])
+            term_scores: Dict[str, float] = {}
+            for candidate in candidates:
+                for key, weight in self._postings[candidate].items():
+                    term_scores[key] = max(term_scores.get(key, 0.0), weight)
+            if scores is None:
+                scores = term_scores
+            else:
+                scores = {k: v + term_scores[k] for k, v in scores.items() if k in term_scores}
+            if not scores:
+                return {}
+        return scores
+
+    def search(self,
+               query: Optional[str] = None,
+               material_type: Optional[str] = None,
+               brand: Optional[str] = None,
+               band: Optional[str] = None,
+               min_price: Optional[float] = None,
+               max_price: Optional[float] = None,
+               min_power_watts: Optional[float] = None,
+               max_power_watts: Optional[float] = None,
+               include_inactive: bool = False,
+               limit: int = 20,
+               offset: int = 0) -> Dict[str, Any]:
+        """Buscar materiales; las facetas de cada dimensión ignoran su propio filtro"""
+        scores = self._match_text(query) if query else None
+        keys: Iterable[str] = scores.keys() if scores is not None else self._docs.keys()
+
+        def in_ranges(doc: Dict[str, Any]) -> bool:
+            if not include_inactive and not doc["active"]:
+                return False
+            if min_price is not None and doc["price"] < min_price:
+                return False
+            if max_price is not None and doc["price"] > max_price:
+                return False
+            if min_power_watts is not None or max_power_watts is not None:
+                watts = doc["power_watts"]
+                if watts is None:
+                    return False
+                if min_power_watts is not None and watts < min_power_watts:
+                    return False
+                if max_power_watts is not None and watts > max_power_watts:
+                    return False
+            return True
+
+        brand_filter = normalize(brand) if brand else None
+        candidates = [doc for doc in (self._docs[k] for k in keys) if in_ranges(doc)]
+
+        def passes(doc: Dict[str, Any], skip: str = "") -> bool:
+            if skip != "type" and material_type and doc["category"] != material_type:
+                return False
+            if skip != "brand" and brand_filter and doc["brand_normalized"] != brand_filter:
+                return False
+            if skip != "band" and band and doc["power_band"] != band:
+                return False
+            return True
+
+        facets = {
+            "type": Counter(d["category"] for d in candidates if passes(d, skip="type")),
+            "brand": Counter(d["brand"] for d in candidates if passes(d, skip="brand") and d["brand"]),
+            "power_band": Counter(d["power_band"] for d in candidates if passes(d, skip="band") and d["power_band"]),
+        }
+
+        results = [doc for doc in candidates if passes(doc)]
+        if scores is not None:
+            results.sort(key=lambda d: (-scores[d["key"]], d["price"]))
+        else:
+            results.sort(key=lambda d: (d["category"], d["price"]))
+
+        return {
+            "total": len(results),
+            "limit": limit,
+            "offset": offset,
+            "results": [
+                {
+                    "material_type": doc["category"],
+                    "power_band": doc["power_band"],
+                    **({"score": scores[doc["key"]]} if scores is not None else {}),
+                    **doc["item"]
+                }
+                for doc in results[offset:offset + limit]
+            ],
+            "facets": {name: dict(counter.most_common()) for name, counter in facets.items()},
+            "catalog_version": self.version
+        }
+
+
+# Instancia global del índice de búsqueda
+materials_search_index = MaterialsSearchIndex()
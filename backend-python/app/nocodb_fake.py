@@ -0,0 +1,389 @@
+"""
+NocoDB local para tests y benchmarks (sin red)
+Implementa la parte de la API v2 de registros que usa el cotizador, guardando
+los datos en SQLite:
+
+    GET   /api/v2/tables/{tabla}/records        limit, offset, where, fields, sort
+    GET   /api/v2/tables/{tabla}/records/{id}
+    POST  /api/v2/tables/{tabla}/records        un registro o una lista (alta masiva)
+    PATCH /api/v2/tables/{tabla}/records        un registro o una lista, con su id
+    PATCH /api/v2/tables/{tabla}/records/{id}
+
+Permite inyectar latencia y errores para probar timeouts, reintentos y el
+circuit breaker. Uso independiente (p. ej. para correr la app sin NocoDB):
+
+    python -m app.nocodb_fake --port 8090 --latency-ms 40
+    NC_DB_URL=http://127.0.0.1:8090 uvicorn app.main:app
+
+No importa la configuración de la aplicación: se puede levantar antes de
+importar app.config y apuntar NC_DB_URL a él.
+"""
+
+import argparse
+import asyncio
+import csv
+import json
+import operator
+import random
+import re
+import sqlite3
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from aiohttp import web
+
+_CONDITION = re.compile(r"\(([^,()]+),([^,()]+)(?:,([^()]*))?\)")
+_JOIN = re.compile(r"^~(and|or)")
+
+_COMPARISONS = {
+    "eq": operator.eq, "neq": operator.ne,
+    "gt": operator.gt, "ge": operator.ge, "lt": operator.lt, "le": operator.le,
+}
+
+
+def _coerce(stored: Any, value: str) -> Tuple[Any, Any]:
+    """Llevar el valor del filtro al tipo del valor guardado para comparar"""
+    if isinstance(stored, bool):
+        return stored, value.strip().lower() in ("true", "1")
+    if isinstance(stored, (int, float)):
+        try:
+            return stored, float(value)
+        except ValueError:
+            return str(stored), value
+    return ("" if stored is None else str(stored)).lower(), value.lower()
+
+
+def _matches(row: Dict[str, Any], field: str, op: str, value: Optional[str]) -> bool:
+    stored = row.get(field)
+    if op == "blank":
+        return stored is None or stored == ""
+    if op == "notblank":
+        return not (stored is None or stored == "")
+    if op == "checked":
+        return bool(stored)
+    if op == "notchecked":
+        return not stored
+    value = value or ""
+    if op == "in":
+        return any(_matches(row, field, "eq", item) for item in value.split(","))
+    if op in ("like", "nlike"):
+        pattern = value.lower().strip("%")
+        found = pattern in ("" if stored is None else str(stored)).lower()
+        return found if op == "like" else not found
+    compare = _COMPARISONS.get(op)
+    if compare is None:
+        raise ValueError(f"Operador no soportado: {op}")
+    if stored is None:
+        return op == "neq"
+    try:
+        return compare(*_coerce(stored, value))
+    except TypeError:
+        return False
+
+
+def parse_where(where: str) -> Callable[[Dict[str, Any]], bool]:
+    """Filtro (campo,op,valor)~and(...)~or(...) evaluado de izquierda a derecha"""
+    terms: List[Tuple[str, Tuple[str, str, Optional[str]]]] = []
+    position, join = 0, "and"
+    while position < len(where):
+        match = _CONDITION.match(where, position)
+        if match is None:
+            raise ValueError(f"Filtro where inválido: {where}")
+        terms.append((join, (match.group(1).strip(), match.group(2).strip(), match.group(3))))
+        position = match.end()
+        if position < len(where):
+            join_match = _JOIN.match(where[position:])
+            if join_match is None:
+                raise ValueError(f"Filtro where inválido: {where}")
+            join = join_match.group(1)
+            position += join_match.end()
+
+    def predicate(row: Dict[str, Any]) -> bool:
+        result = True
+        for index, (term_join, condition) in enumerate(terms):
+            matched = _matches(row, *condition)
+            if index == 0:
+                result = matched
+            elif term_join == "and":
+                result = result and matched
+            else:
+                result = result or matched
+        return result
+
+    return predicate
+
+
+def _sort_rows(rows: List[Dict[str, Any]], sort: str) -> List[Dict[str, Any]]:
+    # Orden estable: se aplica de la última columna a la primera; los nulos al final
+    for field in reversed([item.strip() for item in sort.split(",") if item.strip()]):
+        descending = field.startswith("-")
+        name = field.lstrip("-")
+        present = [row for row in rows if row.get(name) is not None]
+        missing = [row for row in rows if row.get(name) is None]
+        present.sort(key=lambda row: (isinstance(row[name], str), row[name]), reverse=descending)
+        rows = present + missing
+    return rows
+
+
+class FakeNocodb:
+    """
+    Servidor NocoDB en proceso. Los datos viven en SQLite (en memoria por defecto);
+    las fallas se configuran en caliente con configure() y fail_next().
+    """
+
+    def __init__(self, path: str = ":memory:", token: Optional[str] = None, id_field: str = "id",
+                 latency_ms: float = 0.0, jitter_ms: float = 0.0, error_rate: float = 0.0,
+                 error_status: int = 500, seed: Optional[int] = None):
+        self.token = token
+        self.id_field = id_field
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self._random = random.Random(seed)
+        self._fail_next: List[int] = []
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS records ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, table_id TEXT NOT NULL, data TEXT NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS idx_records_table ON records (table_id, id)")
+
+        # (método, tabla, cantidad de registros) de cada pedido atendido
+        self.calls: List[Tuple[str, str, int]] = []
+        self.url: Optional[str] = None
+        self._runner: Optional[web.AppRunner] = None
+        self._thread: Optional[threading.Thread] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    # --- Datos ---
+
+    def insert(self, table_id: str, records: List[Dict[str, Any]]) -> List[int]:
+        """Alta directa (para preparar datos en los tests); devuelve los ids"""
+        ids = []
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            for record in records:
+                data = {key: value for key, value in record.items() if key != self.id_field}
+                cursor = self._db.execute(
+                    "INSERT INTO records (table_id, data) VALUES (?, ?)",
+                    (table_id, json.dumps(data, ensure_ascii=False, default=str))
+                )
+                ids.append(cursor.lastrowid)
+            self._db.execute("COMMIT")
+        return ids
+
+    def update(self, table_id: str, records: List[Dict[str, Any]]) -> Optional[List[int]]:
+        """Actualizar por id; None si algún id no existe (no se aplica nada)"""
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                for record in records:
+                    row = self._db.execute(
+                        "SELECT data FROM records WHERE table_id = ? AND id = ?",
+                        (table_id, record.get(self.id_field))
+                    ).fetchone()
+                    if row is None:
+                        self._db.execute("ROLLBACK")
+                        return None
+                    data = {**json.loads(row[0]), **{k: v for k, v in record.items() if k != self.id_field}}
+                    self._db.execute(
+                        "UPDATE records SET data = ? WHERE id = ?",
+                        (json.dumps(data, ensure_ascii=False, default=str), record.get(self.id_field))
+                    )
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+        return [record[self.id_field] for record in records]
+
+    def rows(self, table_id: str) -> List[Dict[str, Any]]:
+        """Todos los registros de una tabla, con su id, en orden de alta"""
+        with self._lock:
+            fetched = self._db.execute(
+                "SELECT id, data FROM records WHERE table_id = ? ORDER BY id", (table_id,)
+            ).fetchall()
+        return [{self.id_field: row_id, **json.loads(data)} for row_id, data in fetched]
+
+    def reset(self):
+        """Borrar los datos, el registro de pedidos y las fallas configuradas"""
+        with self._lock:
+            self._db.execute("DELETE FROM records")
+        self.calls.clear()
+        self._fail_next.clear()
+        self.configure(latency_ms=0.0, jitter_ms=0.0, error_rate=0.0, error_status=500)
+
+    # --- Fallas ---
+
+    def configure(self, **faults: Any):
+        """latency_ms, jitter_ms, error_rate (0..1) y error_status"""
+        for name, value in faults.items():
+            if name not in ("latency_ms", "jitter_ms", "error_rate", "error_status"):
+                raise ValueError(f"Parámetro de falla desconocido: {name}")
+            setattr(self, name, value)
+
+    def fail_next(self, count: int = 1, status: int = 500):
+        """Los próximos `count` pedidos responden `status`"""
+        self._fail_next.extend([status] * count)
+
+    async def _inject(self) -> Optional[web.Response]:
+        delay = self.latency_ms + (self._random.uniform(0, self.jitter_ms) if self.jitter_ms else 0.0)
+        if delay > 0:
+            await asyncio.sleep(delay / 1000)
+        if self._fail_next:
+            status = self._fail_next.pop(0)
+        elif self.error_rate and self._random.random() < self.error_rate:
+            status = self.error_status
+        else:
+            return None
+        return web.json_response({"msg": "Error inyectado por NocoDB local"}, status=status)
+
+    # --- API ---
+
+    @web.middleware
+    async def _middleware(self, request: web.Request, handler):
+        if self.token and request.headers.get("xc-token") != self.token:
+            return web.json_response({"msg": "Authentication required"}, status=401)
+        injected = await self._inject()
+        if injected is not None:
+            return injected
+        try:
+            return await handler(request)
+        except (ValueError, json.JSONDecodeError) as e:
+            return web.json_response({"msg": str(e)}, status=400)
+
+    async def _list(self, request: web.Request) -> web.Response:
+        table_id = request.match_info["table_id"]
+        limit = int(request.query.get("limit", 25))
+        offset = int(request.query.get("offset", 0))
+        rows = self.rows(table_id)
+        if request.query.get("where"):
+            rows = list(filter(parse_where(request.query["where"]), rows))
+        if request.query.get("sort"):
+            rows = _sort_rows(rows, request.query["sort"])
+        page = rows[offset:offset + limit]
+        if request.query.get("fields"):
+            fields = [field.strip() for field in request.query["fields"].split(",")]
+            page = [{field: row[field] for field in fields if field in row} for row in page]
+        self.calls.append(("GET", table_id, len(page)))
+        return web.json_response({
+            "list": page,
+            "pageInfo": {
+                "totalRows": len(rows),
+                "page": offset // limit + 1 if limit else 1,
+                "pageSize": limit,
+                "isFirstPage": offset == 0,
+                "isLastPage": offset + limit >= len(rows),
+            }
+        })
+
+    async def _read(self, request: web.Request) -> web.Response:
+        table_id = request.match_info["table_id"]
+        record_id = int(request.match_info["record_id"])
+        self.calls.append(("GET", table_id, 1))
+        for row in self.rows(table_id):
+            if row[self.id_field] == record_id:
+                return web.json_response(row)
+        return web.json_response({"msg": f"Record '{record_id}' not found"}, status=404)
+
+    async def _create(self, request: web.Request) -> web.Response:
+        table_id = request.match_info["table_id"]
+        body = await request.json()
+        records = body if isinstance(body, list) else [body]
+        ids = self.insert(table_id, records)
+        self.calls.append(("POST", table_id, len(records)))
+        created = [{self.id_field: record_id} for record_id in ids]
+        return web.json_response(created if isinstance(body, list) else created[0])
+
+    async def _patch(self, request: web.Request) -> web.Response:
+        table_id = request.match_info["table_id"]
+        body = await request.json()
+        if "record_id" in request.match_info:
+            # PATCH /records/{id}: el id va en la ruta (lo usan las actualizaciones de estado)
+            body = {**body, self.id_field: int(request.match_info["record_id"])}
+        records = body if isinstance(body, list) else [body]
+        ids = self.update(table_id, records)
+        self.calls.append(("PATCH", table_id, len(records)))
+        if ids is None:
+            return web.json_response({"msg": "Record not found"}, status=404)
+        updated = [{self.id_field: record_id} for record_id in ids]
+        return web.json_response(updated if isinstance(body, list) else updated[0])
+
+    def make_app(self) -> web.Application:
+        app = web.Application(middlewares=[self._middleware])
+        app.router.add_get("/api/v2/tables/{table_id}/records", self._list)
+        app.router.add_get("/api/v2/tables/{table_id}/records/{record_id:\\d+}", self._read)
+        app.router.add_post("/api/v2/tables/{table_id}/records", self._create)
+        app.router.add_patch("/api/v2/tables/{table_id}/records", self._patch)
+        app.router.add_patch("/api/v2/tables/{table_id}/records/{record_id:\\d+}", self._patch)
+        return app
+
+    # --- Servidor ---
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """Levantar el servidor en el event loop actual; devuelve la URL base"""
+        self._runner = web.AppRunner(self.make_app())
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        bound_port = self._runner.addresses[0][1]
+        self.url = f"http://{host}:{bound_port}"
+        return self.url
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def start_in_thread(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """Levantar el servidor en un thread con su propio loop (tests con TestClient)"""
+        started = threading.Event()
+
+        def serve():
+            self._loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self._loop)
+            self._loop.run_until_complete(self.start(host, port))
+            started.set()
+            self._loop.run_forever()
+            self._loop.run_until_complete(self.stop())
+            self._loop.close()
+
+        self._thread = threading.Thread(target=serve, name="nocodb-fake", daemon=True)
+        self._thread.start()
+        if not started.wait(timeout=10):
+            raise RuntimeError("No se pudo iniciar el NocoDB local")
+        return self.url
+
+    def stop_thread(self):
+        if self._loop is not None and self._thread is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(timeout=10)
+            self._thread = None
+            self._loop = None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="NocoDB local (API v2 de registros) sobre SQLite")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--db", default=":memory:", help="Archivo SQLite (por defecto en memoria)")
+    parser.add_argument("--token", default=None, help="Exigir este xc-token")
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--seed-csv", nargs=2, action="append", metavar=("TABLA", "CSV"), default=[],
+                        help="Cargar un CSV en una tabla (se puede repetir)")
+    args = parser.parse_args()
+
+    fake = FakeNocodb(args.db, token=args.token, latency_ms=args.latency_ms,
+                      jitter_ms=args.jitter_ms, error_rate=args.error_rate)
+    for table_id, csv_path in args.seed_csv:
+        with open(csv_path, newline="", encoding="utf-8") as handle:
+            fake.insert(table_id, list(csv.DictReader(handle)))
+    print(f"NocoDB local en http://{args.host}:{args.port} (Ctrl+C para salir)")
+    web.run_app(fake.make_app(), host=args.host, port=args.port, print=None)
+
+
+if __name__ == "__main__":
+    main()
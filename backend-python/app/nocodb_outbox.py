@@ -0,0 +1,418 @@
+"""
+Outbox durable para las escrituras en NocoDB
+Las altas se guardan primero en SQLite y un worker las entrega por lotes, con
+reintentos con backoff exponencial; sobreviven a reinicios y caídas de NocoDB.
+Varios procesos pueden compartir el archivo: cada lote se reclama con un lease
+antes de entregarlo. Los registros que NocoDB rechaza (4xx) o que agotan los
+intentos pasan a la tabla nocodb_outbox_dead.
+Cada alta lleva un id de idempotencia (uuid) que se escribe en la columna
+id_field de NocoDB: los reintentos hacen upsert por ese id y nunca pisan otro registro
+"""
+
+import asyncio
+import json
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+# (tabla, registros, es reintento) -> entregado
+Deliver = Callable[[str, List[Dict[str, Any]], bool], Awaitable[bool]]
+
+# Fila reclamada: (id, tabla, payload, intentos fallidos, reclamos, id de idempotencia)
+ClaimedRow = Tuple[int, str, str, int, int, str]
+
+
+class RejectedWriteError(Exception):
+    """NocoDB rechazó la escritura (4xx): reintentar el mismo lote no sirve"""
+
+    def __init__(self, status: int, detail: str):
+        super().__init__(f"{status} - {detail[:300]}")
+        self.status = status
+
+
+class NocodbOutbox:
+    """Cola persistente de altas pendientes por tabla con backoff exponencial por lote"""
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS nocodb_outbox (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        table_name TEXT NOT NULL,
+        dedupe_key TEXT,
+        payload TEXT NOT NULL,
+        created_at REAL NOT NULL,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        next_attempt_at REAL NOT NULL,
+        last_error TEXT,
+        UNIQUE (table_name, dedupe_key)
+    );
+    CREATE INDEX IF NOT EXISTS idx_nocodb_outbox_due ON nocodb_outbox (next_attempt_at, id);
+    CREATE TABLE IF NOT EXISTS nocodb_outbox_dead (
+        id INTEGER PRIMARY KEY,
+        table_name TEXT NOT NULL,
+        dedupe_key TEXT,
+        payload TEXT NOT NULL,
+        created_at REAL NOT NULL,
+        attempts INTEGER NOT NULL,
+        failed_at REAL NOT NULL,
+        last_error TEXT
+    );
+    """
+    # Columnas agregadas después de la primera versión (archivos existentes)
+    MIGRATIONS = {
+        "lease_until": "ALTER TABLE nocodb_outbox ADD COLUMN lease_until REAL NOT NULL DEFAULT 0",
+        "claims": "ALTER TABLE nocodb_outbox ADD COLUMN claims INTEGER NOT NULL DEFAULT 0",
+        "idempotency_id": (
+            "ALTER TABLE nocodb_outbox ADD COLUMN idempotency_id TEXT;"
+            "UPDATE nocodb_outbox SET idempotency_id = lower(hex(randomblob(16))) WHERE idempotency_id IS NULL;"
+        ),
+    }
+
+    def __init__(self, path: str, batch_size: int, flush_interval_ms: float, poll_seconds: float,
+                 backoff_base_seconds: float, backoff_max_seconds: float,
+                 max_attempts: int = 20, lease_seconds: float = 120.0, id_field: str = ""):
+        self.path = path
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval_ms / 1000
+        self.poll_seconds = poll_seconds
+        self.backoff_base_seconds = backoff_base_seconds
+        self.backoff_max_seconds = backoff_max_seconds
+        self.max_attempts = max(1, max_attempts)
+        self.lease_seconds = lease_seconds
+        # Columna de NocoDB donde se escribe el id de idempotencia ("" = no se envía)
+        self.id_field = id_field
+
+        self._local = threading.local()
+        self._schema_lock = threading.Lock()
+        self._schema_ready = False
+
+        self._deliver: Optional[Deliver] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self.metrics = {
+            "enqueued": 0, "delivered": 0, "failed_attempts": 0, "batches": 0, "dead_lettered": 0, "last_error": None
+        }
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            with self._schema_lock:
+                if not self._schema_ready:
+                    connection.executescript(self.SCHEMA)
+                    columns = {row[1] for row in connection.execute("PRAGMA table_info(nocodb_outbox)")}
+                    for column, statement in self.MIGRATIONS.items():
+                        if column not in columns:
+                            connection.executescript(statement)
+                    self._schema_ready = True
+            self._local.connection = connection
+        return connection
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    # --- Encolado (desde cualquier thread / event loop) ---
+
+    def _enqueue(self, table_name: str, record: Dict[str, Any], dedupe_key: Optional[str]) -> bool:
+        now = time.time()
+        cursor = self._connection().execute(
+            "INSERT OR IGNORE INTO nocodb_outbox "
+            "(table_name, dedupe_key, payload, created_at, next_attempt_at, idempotency_id) VALUES (?, ?, ?, ?, ?, ?)",
+            (table_name, dedupe_key, json.dumps(record, ensure_ascii=False, default=str), now, now, uuid.uuid4().hex)
+        )
+        return cursor.rowcount > 0
+
+    async def enqueue(self, table_name: str, record: Dict[str, Any], dedupe_key: Optional[str] = None) -> bool:
+        """
+        Guardar el alta de forma durable (True si quedó encolada o ya lo estaba).
+        Con dedupe_key, la misma clave en la misma tabla se encola una sola vez.
+        """
+        added = await asyncio.to_thread(self._enqueue, table_name, record, dedupe_key)
+        if added:
+            self.metrics["enqueued"] += 1
+            self._notify()
+        return True
+
+    def _notify(self):
+        if self._loop is None or self._wakeup is None:
+            return
+        try:
+            current = asyncio.get_running_loop()
+        except RuntimeError:
+            current = None
+        if current is self._loop:
+            self._wakeup.set()
+        else:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    # --- Entrega ---
+
+    def _claim(self, limit: int) -> List[ClaimedRow]:
+        """Reclamar hasta limit registros vencidos (lease): otro proceso no los toma mientras dure"""
+        now = time.time()
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            rows = connection.execute(
+                "SELECT id, table_name, payload, attempts, claims, idempotency_id FROM nocodb_outbox "
+                "WHERE next_attempt_at <= ? AND lease_until <= ? ORDER BY next_attempt_at, id LIMIT ?",
+                (now, now, limit)
+            ).fetchall()
+            connection.executemany(
+                "UPDATE nocodb_outbox SET lease_until = ?, claims = claims + 1 WHERE id = ?",
+                [(now + self.lease_seconds, row[0]) for row in rows]
+            )
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        return [(row_id, table_name, payload, attempts, claims + 1, idempotency_id)
+                for row_id, table_name, payload, attempts, claims, idempotency_id in rows]
+
+    def _release(self, ids: List[int]):
+        """Devolver registros reclamados sin intentar (p. ej. al detener el worker)"""
+        self._connection().executemany(
+            "UPDATE nocodb_outbox SET lease_until = 0 WHERE id = ?", [(row_id,) for row_id in ids]
+        )
+
+    def _ack(self, table_name: str, ids: List[int]):
+        now = time.time()
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.executemany("DELETE FROM nocodb_outbox WHERE id = ?", [(row_id,) for row_id in ids])
+            # La tabla volvió a aceptar altas: sus reprogramados se reintentan ya, en lotes completos
+            connection.execute(
+                "UPDATE nocodb_outbox SET next_attempt_at = ? "
+                "WHERE table_name = ? AND next_attempt_at > ? AND attempts > 0",
+                (now, table_name, now)
+            )
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+
+    def _move_to_dead(self, connection: sqlite3.Connection, rows: List[Tuple[int, str]]):
+        now = time.time()
+        for row_id, error in rows:
+            connection.execute(
+                "INSERT OR REPLACE INTO nocodb_outbox_dead "
+                "(id, table_name, dedupe_key, payload, created_at, attempts, failed_at, last_error) "
+                "SELECT id, table_name, dedupe_key, payload, created_at, attempts + 1, ?, ? "
+                "FROM nocodb_outbox WHERE id = ?",
+                (now, error[:500], row_id)
+            )
+            connection.execute("DELETE FROM nocodb_outbox WHERE id = ?", (row_id,))
+
+    def _dead_letter(self, rows: List[Tuple[int, str]]):
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            self._move_to_dead(connection, rows)
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+
+    def _backoff(self, rows: List[Tuple[int, int]], error: str) -> int:
+        """Reprogramar el lote; los que agotan max_attempts pasan a descartados (devuelve cuántos)"""
+        exhausted = [(row_id, error) for row_id, attempts in rows if attempts + 1 >= self.max_attempts]
+        retrying = [(row_id, attempts) for row_id, attempts in rows if attempts + 1 < self.max_attempts]
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            if retrying:
+                # Un solo horario para todo el lote, así el reintento vuelve a ser un lote
+                attempts = max(row_attempts for _, row_attempts in retrying)
+                delay = min(self.backoff_max_seconds, self.backoff_base_seconds * (2 ** attempts))
+                next_attempt_at = time.time() + delay * random.uniform(0.8, 1.2)
+                connection.executemany(
+                    "UPDATE nocodb_outbox SET attempts = attempts + 1, next_attempt_at = ?, lease_until = 0, "
+                    "last_error = ? WHERE id = ?",
+                    [(next_attempt_at, error[:500], row_id) for row_id, _ in retrying]
+                )
+            self._move_to_dead(connection, exhausted)
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        return len(exhausted)
+
+    def _next_due_in(self) -> Optional[float]:
+        row = self._connection().execute(
+            "SELECT MIN(MAX(next_attempt_at, lease_until)) FROM nocodb_outbox"
+        ).fetchone()
+        return None if row[0] is None else max(0.0, row[0] - time.time())
+
+    async def _deliver_items(self, table_name: str, items: List[ClaimedRow], pending: set) -> Tuple[int, Optional[str]]:
+        """
+        Entregar registros reclamados de una tabla. Ante un rechazo (4xx) el lote se
+        divide en mitades hasta aislar los registros rechazados, que pasan a descartados.
+        Devuelve (entregados, error transitorio o None)
+        """
+        records = [json.loads(row[2]) for row in items]
+        if self.id_field:
+            for record, row in zip(records, items):
+                record[self.id_field] = row[5]
+        # Un reclamo anterior pudo haber llegado a NocoDB: entregar sin duplicar
+        retry = any(row[4] > 1 for row in items)
+        ids = [row[0] for row in items]
+        self.metrics["batches"] += 1
+        try:
+            ok = await self._deliver(table_name, records, retry)
+            error = "" if ok else "NocoDB no aceptó el lote"
+        except RejectedWriteError as e:
+            if len(items) > 1:
+                middle = len(items) // 2
+                delivered, error = await self._deliver_items(table_name, items[:middle], pending)
+                if error is None:
+                    more, error = await self._deliver_items(table_name, items[middle:], pending)
+                    return delivered + more, error
+                rest = items[middle:]
+                await asyncio.to_thread(self._backoff, [(row[0], row[3]) for row in rest], error)
+                pending.difference_update(row[0] for row in rest)
+                return delivered, error
+            await asyncio.to_thread(self._dead_letter, [(ids[0], f"Rechazado por NocoDB: {e}")])
+            pending.discard(ids[0])
+            self.metrics["dead_lettered"] += 1
+            logger.error(f"❌ Outbox NocoDB: registro {ids[0]} de {table_name} rechazado y descartado ({e})")
+            return 0, None
+        except Exception as e:
+            ok, error = False, str(e) or type(e).__name__
+
+        if ok:
+            await asyncio.to_thread(self._ack, table_name, ids)
+            pending.difference_update(ids)
+            self.metrics["delivered"] += len(items)
+            return len(items), None
+
+        dead = await asyncio.to_thread(self._backoff, [(row[0], row[3]) for row in items], error)
+        pending.difference_update(ids)
+        self.metrics["failed_attempts"] += len(items)
+        self.metrics["dead_lettered"] += dead
+        self.metrics["last_error"] = error
+        logger.warning(f"⚠️ Outbox NocoDB: lote de {len(items)} en {table_name} reprogramado ({error})")
+        if dead:
+            logger.error(f"❌ Outbox NocoDB: {dead} registros de {table_name} agotaron {self.max_attempts} intentos")
+        return 0, error
+
+    async def deliver_due(self) -> int:
+        """
+        Reclamar y entregar un lote de registros vencidos agrupados por tabla.
+        Devuelve cuántos se entregaron; corta el ciclo ante el primer fallo transitorio.
+        """
+        rows = await asyncio.to_thread(self._claim, self.batch_size)
+        by_table: Dict[str, List[ClaimedRow]] = {}
+        for row in rows:
+            by_table.setdefault(row[1], []).append(row)
+
+        pending = {row[0] for row in rows}
+        delivered = 0
+        try:
+            for table_name, items in by_table.items():
+                table_delivered, error = await self._deliver_items(table_name, items, pending)
+                delivered += table_delivered
+                if error is not None:
+                    break
+        finally:
+            if pending:
+                # Reclamados sin intentar (corte o cancelación): quedan libres para otro proceso
+                self._release(list(pending))
+        return delivered
+
+    async def _run(self):
+        while True:
+            try:
+                delivered = await self.deliver_due()
+                if delivered >= self.batch_size:
+                    # Hay más pendientes (p. ej. tras una caída): seguir sin esperar
+                    continue
+                next_due = await asyncio.to_thread(self._next_due_in)
+                timeout = self.poll_seconds if next_due is None else min(self.poll_seconds, next_due)
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=max(timeout, 0.01))
+                    # Juntar las altas que llegan casi juntas en un mismo lote
+                    await asyncio.sleep(self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ Error en el worker del outbox NocoDB: {e}")
+                await asyncio.sleep(self.poll_seconds)
+
+    def start(self, deliver: Deliver):
+        """Iniciar el worker de entrega en el event loop actual (startup)"""
+        if self.running:
+            return
+        self._deliver = deliver
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"📮 Outbox NocoDB iniciado ({self.path})")
+
+    async def stop(self, drain_timeout_seconds: float = 5.0):
+        """Entregar lo que se pueda dentro del plazo y detener el worker; lo demás queda en disco"""
+        if not self.running:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        deadline = time.monotonic() + drain_timeout_seconds
+        try:
+            while time.monotonic() < deadline:
+                if not await asyncio.wait_for(self.deliver_due(), timeout=max(0.1, deadline - time.monotonic())):
+                    break
+        except (asyncio.TimeoutError, Exception) as e:
+            logger.warning(f"⚠️ Outbox NocoDB detenido con pendientes: {e or 'timeout'}")
+        self._loop = None
+        self._wakeup = None
+
+    def _stats(self) -> Dict[str, Any]:
+        connection = self._connection()
+        depth, oldest, retrying = connection.execute(
+            "SELECT COUNT(*), MIN(created_at), SUM(attempts > 0) FROM nocodb_outbox"
+        ).fetchone()
+        dead = connection.execute("SELECT COUNT(*) FROM nocodb_outbox_dead").fetchone()[0]
+        return {
+            "depth": depth,
+            "retrying": retrying or 0,
+            "dead": dead,
+            "oldest_pending_age_seconds": round(time.time() - oldest, 3) if oldest is not None else 0.0,
+        }
+
+    async def get_stats(self) -> Dict[str, Any]:
+        return {**await asyncio.to_thread(self._stats), **self.metrics, "running": self.running}
+
+
+# Instancia global del outbox de NocoDB
+nocodb_outbox = NocodbOutbox(
+    settings.NOCODB_OUTBOX_PATH,
+    batch_size=settings.NOCODB_OUTBOX_BATCH_SIZE,
+    flush_interval_ms=settings.NOCODB_OUTBOX_FLUSH_MS,
+    poll_seconds=settings.NOCODB_OUTBOX_POLL_SECONDS,
+    backoff_base_seconds=settings.NOCODB_OUTBOX_BACKOFF_BASE_SECONDS,
+    backoff_max_seconds=settings.NOCODB_OUTBOX_BACKOFF_MAX_SECONDS,
+    max_attempts=settings.NOCODB_OUTBOX_MAX_ATTEMPTS,
+    lease_seconds=settings.NOCODB_OUTBOX_LEASE_SECONDS,
+    id_field=settings.NOCODB_OUTBOX_ID_FIELD
+)
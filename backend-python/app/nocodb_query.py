@@ -0,0 +1,102 @@
+"""
+Consultas tipadas a la API v2 de NocoDB
+Arma los parámetros fields / where / sort para que NocoDB devuelva solo las
+columnas y filas necesarias, en lugar de traer todo y filtrar en Python:
+
+    NocodbQuery().select("id", "marca").where("activo", "eq", True).sort("-fecha_actualizacion")
+"""
+
+from dataclasses import dataclass, replace
+from datetime import date, datetime
+from typing import Any, Dict, Literal, Optional, Tuple, get_args
+
+Operator = Literal[
+    "eq", "neq", "gt", "ge", "lt", "le", "like", "nlike", "in",
+    "blank", "notblank", "checked", "notchecked"
+]
+
+# Operadores sin valor: (activo,checked)
+_UNARY_OPERATORS = {"blank", "notblank", "checked", "notchecked"}
+_OPERATORS = set(get_args(Operator))
+
+
+def _check_name(name: str) -> str:
+    if not name or any(char in name for char in ",()~"):
+        raise ValueError(f"Nombre de columna inválido para NocoDB: {name!r}")
+    return name
+
+
+def format_value(value: Any, in_list: bool = False) -> str:
+    """Valor en la sintaxis de filtros de NocoDB (lanza ValueError si no es representable)"""
+    if isinstance(value, bool):
+        text = "true" if value else "false"
+    elif isinstance(value, datetime):
+        text = value.strftime("%Y-%m-%d %H:%M:%S")
+    elif isinstance(value, date):
+        text = value.isoformat()
+    elif value is None:
+        text = ""
+    else:
+        text = str(value)
+    # Los paréntesis cierran la condición y en "in" la coma separa valores
+    if "(" in text or ")" in text or (in_list and "," in text):
+        raise ValueError(f"Valor no representable en un filtro de NocoDB: {text!r}")
+    return text
+
+
+@dataclass(frozen=True)
+class NocodbQuery:
+    """
+    Columnas, condiciones (unidas con AND) y orden de una lectura.
+    Inmutable: cada método devuelve una consulta nueva, así se puede reutilizar
+    como base y como clave de cache.
+    """
+    fields: Tuple[str, ...] = ()
+    conditions: Tuple[Tuple[str, str, Tuple[str, ...]], ...] = ()
+    sort_by: Tuple[str, ...] = ()
+
+    def select(self, *fields: str) -> "NocodbQuery":
+        return replace(self, fields=self.fields + tuple(_check_name(field) for field in fields))
+
+    def where(self, field: str, operator: Operator, value: Any = None) -> "NocodbQuery":
+        if operator not in _OPERATORS:
+            raise ValueError(f"Operador de NocoDB no soportado: {operator}")
+        if operator in _UNARY_OPERATORS:
+            values: Tuple[str, ...] = ()
+        elif operator == "in":
+            values = tuple(format_value(item, in_list=True) for item in value)
+            if not values:
+                raise ValueError("El operador 'in' necesita al menos un valor")
+        else:
+            values = (format_value(value),)
+        return replace(self, conditions=self.conditions + ((_check_name(field), operator, values),))
+
+    def sort(self, *fields: str) -> "NocodbQuery":
+        """Columnas de orden; con '-' delante, descendente"""
+        for field in fields:
+            _check_name(field.lstrip("-"))
+        return replace(self, sort_by=self.sort_by + fields)
+
+    def with_default_sort(self, *fields: str) -> "NocodbQuery":
+        return self if self.sort_by else self.sort(*fields)
+
+    @property
+    def where_clause(self) -> Optional[str]:
+        if not self.conditions:
+            return None
+        return "~and".join(
+            f"({field},{operator}{''.join(',' + value for value in values)})"
+            for field, operator, values in self.conditions
+        )
+
+    def params(self) -> Dict[str, str]:
+        """Parámetros de query string para GET /api/v2/tables/{tabla}/records"""
+        params: Dict[str, str] = {}
+        if self.fields:
+            params["fields"] = ",".join(self.fields)
+        where = self.where_clause
+        if where:
+            params["where"] = where
+        if self.sort_by:
+            params["sort"] = ",".join(self.sort_by)
+        return params
@@ -5,13 +5,54 @@ Guarda los datos de los clientes y cotizaciones en la base de datos
 
 import aiohttp
 import asyncio
+import functools
 import logging
-from typing import Dict, Any, Optional, List
+import re
+from contextlib import aclosing, asynccontextmanager
+from typing import Dict, Any, AsyncIterator, Optional, List
 from datetime import datetime
 from .config import settings
+from .http_client import http_clients
+from .circuit_breaker import BreakerRegistry, CircuitOpenError, GuardedSession
+from .nocodb_query import NocodbQuery
+from .single_flight import SingleFlightCache, coalesced_read, invalidates
+from .write_behind import WriteBehindWriter
+from .nocodb_outbox import RejectedWriteError, nocodb_outbox
 
 logger = logging.getLogger(__name__)
 
+def material_key(material: Dict[str, Any]) -> tuple:
+    """Clave natural de un material: (tipo_material, marca, modelo) normalizados"""
+    return tuple(
+        str(material.get(field) or "").strip().lower()
+        for field in ("tipo_material", "marca", "modelo")
+    )
+
+# Listados del CRM (paneles de administración): TTL propia (NOCODB_CRM_CACHE_TTL_SECONDS), invalidada por las escrituras
+CRM_READS = ("get_contacts", "get_customers", "get_quotes")
+
+# Columnas de materiales que usan el catálogo y /materials (el resto no se pide)
+MATERIAL_CATALOG_FIELDS = (
+    settings.NOCODB_ID_FIELD, "tipo_material", "marca", "modelo", "potencia_watts", "potencia_kw", "precio_ars",
+    "precio_por_kw", "stock_disponible", "activo", "especificaciones_tecnicas", "garantia_anos",
+    "proveedor", "capacity_ah", "voltage", "cycles", "efficiency", "dimensions", "weight", "type",
+)
+
+_TABLE_ID_IN_URL = re.compile(r"/tables/([^/]+)/records")
+
+_DATETIME_PREFIX = re.compile(r"^\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}:\d{2}")
+
+
+def natural_key(record: Dict[str, Any], fields: tuple) -> tuple:
+    """Valores normalizados de las columnas clave (fechas sin zona ni fracción)"""
+    values = []
+    for field in fields:
+        value = str(record.get(field) or "").strip()
+        if _DATETIME_PREFIX.match(value):
+            value = value[:19].replace("T", " ")
+        values.append(value.lower())
+    return tuple(values)
+
 class NocodbService:
     def __init__(self):
         # Usar variables correctas de NocoDB
@@ -24,12 +65,67 @@ class NocodbService:
         self.cotizaciones_table_id = getattr(settings, 'NOCODB_COTIZACIONES_TABLE_ID', 'm6rk1j231s70p8m')
         self.materiales_table_id = getattr(settings, 'NOCODB_MATERIALES_TABLE_ID', 'm2p9ng5e1hn53k0')
         self.logs_table_id = getattr(settings, 'NOCODB_LOGS_TABLE_ID', 'm1xm2vu3e5bcuiy')
+        self.clientes_table_id = getattr(settings, 'NOCODB_CLIENTES_TABLE_ID', settings.NOCODB_TABLE_ID)
         
         # URLs de API v2 (sin base_id para v2)
         self.contactos_url = f"{self.base_url}/api/v2/tables/{self.contactos_table_id}/records"
         self.cotizaciones_url = f"{self.base_url}/api/v2/tables/{self.cotizaciones_table_id}/records"
         self.materiales_url = f"{self.base_url}/api/v2/tables/{self.materiales_table_id}/records"
         self.logs_url = f"{self.base_url}/api/v2/tables/{self.logs_table_id}/records"
+        self.clientes_url = f"{self.base_url}/api/v2/tables/{self.clientes_table_id}/records"
+        
+        # Outbox durable: las altas se guardan en disco y un worker las entrega
+        self.outbox = nocodb_outbox
+        self.outbox_tables = {
+            "contactos": self.contactos_url,
+            "cotizaciones": self.cotizaciones_url,
+            "materiales": self.materiales_url,
+            "logs": self.logs_url,
+        }
+        
+        # Altas diferidas: se envían por lotes con inserción masiva (ver write_behind)
+        self.writer = WriteBehindWriter(
+            functools.partial(self.bulk_insert_records, raise_rejected=True),
+            batch_size=settings.NOCODB_WRITE_BEHIND_BATCH_SIZE,
+            flush_interval_ms=settings.NOCODB_WRITE_BEHIND_FLUSH_MS,
+            max_concurrency=settings.NOCODB_WRITE_BEHIND_MAX_CONCURRENCY
+        )
+        
+        # Un circuit breaker por tabla y método, con timeout según la latencia reciente
+        self.breakers = BreakerRegistry(
+            failure_threshold=settings.NOCODB_BREAKER_FAILURE_THRESHOLD,
+            open_seconds=settings.NOCODB_BREAKER_OPEN_SECONDS,
+            latency_window=settings.NOCODB_BREAKER_LATENCY_WINDOW,
+            min_samples=settings.NOCODB_BREAKER_MIN_SAMPLES,
+            timeout_percentile=settings.NOCODB_BREAKER_TIMEOUT_PERCENTILE,
+            timeout_multiplier=settings.NOCODB_BREAKER_TIMEOUT_MULTIPLIER,
+            min_timeout_seconds=settings.NOCODB_BREAKER_MIN_TIMEOUT_SECONDS,
+            max_timeout_seconds=settings.NOCODB_BREAKER_MAX_TIMEOUT_SECONDS
+        )
+        self.table_names = {self.clientes_table_id: "clientes"}
+        self.table_names.update({
+            self.contactos_table_id: "contactos",
+            self.cotizaciones_table_id: "cotizaciones",
+            self.materiales_table_id: "materiales",
+            self.logs_table_id: "logs",
+        })
+        # Último catálogo leído (completo / solo activos): respaldo con el circuito abierto
+        self._last_materials: Dict[bool, List[Dict[str, Any]]] = {}
+        
+        # Lecturas idénticas concurrentes comparten una sola llamada a NocoDB; los listados
+        # del CRM se cachean más tiempo porque nuestras escrituras los invalidan o corrigen
+        self.read_cache = SingleFlightCache(
+            ttl_seconds=settings.NOCODB_READ_CACHE_TTL_SECONDS,
+            max_entries=settings.NOCODB_READ_CACHE_MAX_ENTRIES,
+            ttl_by_name={name: settings.NOCODB_CRM_CACHE_TTL_SECONDS for name in CRM_READS}
+        )
+        # Lecturas cacheadas que dependen de cada tabla (contactos y clientes pueden ser la misma)
+        self.reads_by_table: Dict[str, List[str]] = {}
+        for table_id, read in ((self.contactos_table_id, "get_contacts"),
+                               (self.clientes_table_id, "get_customers"),
+                               (self.cotizaciones_table_id, "get_quotes"),
+                               (self.materiales_table_id, "get_materials_from_nocodb")):
+            self.reads_by_table.setdefault(table_id, []).append(read)
         
         self.headers = {
             "xc-token": self.token,
@@ -43,6 +139,63 @@ class NocodbService:
         logger.info(f"Materiales URL: {self.materiales_url}")
         logger.info(f"Logs URL: {self.logs_url}")
     
+    def _breaker_name(self, method: str, url: str) -> str:
+        match = _TABLE_ID_IN_URL.search(url)
+        table = self.table_names.get(match.group(1), match.group(1)) if match else "otros"
+        return f"{table} {method}"
+    
+    def _reads_for(self, table_url: str) -> List[str]:
+        match = _TABLE_ID_IN_URL.search(table_url)
+        return self.reads_by_table.get(match.group(1), []) if match else []
+    
+    def invalidate_table(self, table_url: str):
+        """Descartar las lecturas cacheadas que dependen de la tabla (ninguna para logs)"""
+        reads = self._reads_for(table_url)
+        if reads:
+            self.read_cache.invalidate(*reads)
+    
+    def patch_cached_record(self, table_url: str, record_id: Any, changes: Dict[str, Any]):
+        """Aplicar una actualización propia a las filas cacheadas del registro, sin releer NocoDB"""
+        reads = self._reads_for(table_url)
+        if not reads:
+            return
+        id_field = settings.NOCODB_ID_FIELD
+        
+        def apply(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+            return [
+                {**row, **changes} if str(row.get(id_field)) == str(record_id) else row
+                for row in rows
+            ]
+        
+        self.read_cache.patch(reads, apply)
+    
+    @staticmethod
+    def _list_limit(limit: int) -> int:
+        """Acotar los listados que se arman en memoria (para más filas usar la exportación en streaming)"""
+        return max(1, min(limit, settings.NOCODB_LIST_MAX_LIMIT))
+    
+    async def check_connection(self) -> bool:
+        """Leer un contacto salteando la cache (health checks); False si NocoDB no responde"""
+        try:
+            async with aclosing(self.iter_contacts(limit=1)) as contacts:
+                async for _ in contacts:
+                    break
+            return True
+        except ConnectionError as e:
+            logger.error(f"❌ NocoDB no respondió: {e}")
+            return False
+    
+    @asynccontextmanager
+    async def guarded_session(self) -> AsyncIterator[GuardedSession]:
+        """Sesión de NocoDB cuyas llamadas pasan por el circuit breaker de su endpoint"""
+        async with http_clients.session("nocodb") as session:
+            yield GuardedSession(session, lambda method, url: self.breakers.get(self._breaker_name(method, url)))
+    
+    def _write_circuit_open(self, table_url: str) -> bool:
+        """Las altas en la tabla fallarían al instante: mejor dejarlas en el outbox"""
+        return settings.NOCODB_OUTBOX_ENABLED and self.breakers.get(self._breaker_name("POST", table_url)).is_open()
+    
+    @invalidates("get_contacts", "get_customers")
     async def save_contact_form(self, contact_data: Dict[str, Any]) -> bool:
         """
         Guarda formulario de contacto en NocoDB
@@ -70,13 +223,19 @@ class NocodbService:
             logger.info(f"📝 Datos preparados para NocoDB: {nocodb_data}")
             logger.info(f"📡 Headers: {self.headers}")
             
-            async with aiohttp.ClientSession() as session:
+            if self.outbox.running or self._write_circuit_open(self.contactos_url):
+                # Primero al outbox durable; el worker lo entrega por lotes con reintentos
+                return await self.outbox.enqueue("contactos", nocodb_data, None)
+            if self.writer.active:
+                # Se agrupa con otras altas de la tabla en una inserción masiva
+                return await self.writer.submit(self.contactos_url, nocodb_data)
+            
+            async with self.guarded_session() as session:
                 logger.info(f"🚀 Enviando POST a: {self.contactos_url}")
                 async with session.post(
                     self.contactos_url,
                     json=nocodb_data,
-                    headers=self.headers,
-                    timeout=aiohttp.ClientTimeout(total=30)
+                    headers=self.headers
                 ) as response:
                     
                     logger.info(f"📡 Respuesta recibida: {response.status}")
@@ -100,6 +259,7 @@ class NocodbService:
             logger.error(f"❌ Traceback: {traceback.format_exc()}")
             return False
     
+    @invalidates("get_quotes")
     async def save_solar_quote(self, quote_data: Dict[str, Any]) -> bool:
         """
         Guarda cotización solar en NocoDB
@@ -132,12 +292,18 @@ class NocodbService:
             
             logger.info(f"📋 Datos preparados para NocoDB: {nocodb_data}")
             
-            async with aiohttp.ClientSession() as session:
+            if self.outbox.running or self._write_circuit_open(self.cotizaciones_url):
+                # Primero al outbox durable; el worker lo entrega por lotes con reintentos
+                return await self.outbox.enqueue("cotizaciones", nocodb_data, quote_data.get("id_cotizacion"))
+            if self.writer.active:
+                # Se agrupa con otras altas de la tabla en una inserción masiva
+                return await self.writer.submit(self.cotizaciones_url, nocodb_data)
+            
+            async with self.guarded_session() as session:
                 async with session.post(
                     self.cotizaciones_url,
                     json=nocodb_data,
-                    headers=self.headers,
-                    timeout=aiohttp.ClientTimeout(total=30)
+                    headers=self.headers
                 ) as response:
                     
                     if response.status == 200:
@@ -153,6 +319,7 @@ class NocodbService:
             logger.error(f"❌ Error guardando cotización: {e}")
             return False
     
+    @invalidates("get_materials_from_nocodb")
     async def save_material(self, material_data: Dict[str, Any]) -> bool:
         """
         Guarda material solar en NocoDB
@@ -176,12 +343,18 @@ class NocodbService:
                 "fecha_actualizacion": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
             }
             
-            async with aiohttp.ClientSession() as session:
+            if self.outbox.running or self._write_circuit_open(self.materiales_url):
+                # Primero al outbox durable; el worker lo entrega por lotes con reintentos
+                return await self.outbox.enqueue("materiales", nocodb_data, None)
+            if self.writer.active:
+                # Se agrupa con otras altas de la tabla en una inserción masiva
+                return await self.writer.submit(self.materiales_url, nocodb_data)
+            
+            async with self.guarded_session() as session:
                 async with session.post(
                     self.materiales_url,
                     json=nocodb_data,
-                    headers=self.headers,
-                    timeout=aiohttp.ClientTimeout(total=30)
+                    headers=self.headers
                 ) as response:
                     
                     if response.status == 200:
@@ -212,12 +385,18 @@ class NocodbService:
                 "datos_adicionales": str(log_data.get("additional_data", {}))
             }
             
-            async with aiohttp.ClientSession() as session:
+            if self.outbox.running or self._write_circuit_open(self.logs_url):
+                # Primero al outbox durable; el worker lo entrega por lotes con reintentos
+                return await self.outbox.enqueue("logs", nocodb_data, None)
+            if self.writer.active:
+                # Se agrupa con otras altas de la tabla en una inserción masiva
+                return await self.writer.submit(self.logs_url, nocodb_data)
+            
+            async with self.guarded_session() as session:
                 async with session.post(
                     self.logs_url,
                     json=nocodb_data,
-                    headers=self.headers,
-                    timeout=aiohttp.ClientTimeout(total=30)
+                    headers=self.headers
                 ) as response:
                     
                     if response.status == 200:
@@ -232,130 +411,376 @@ class NocodbService:
             logger.error(f"❌ Error guardando log: {e}")
             return False
     
-    async def get_contacts(self, limit: int = 100) -> Optional[list]:
+    async def save_system_logs(self, records: List[Dict[str, Any]]) -> bool:
+        """
+        Inserta en lote registros ya armados de la tabla de logs (registro de auditoría)
         """
-        Obtiene la lista de contactos desde NocoDB
+        return await self.bulk_insert_records(self.logs_url, records) is not None
+    
+    async def bulk_update_records(self, table_url: str, records: List[Dict[str, Any]]) -> bool:
+        """
+        Actualiza registros en lote (PATCH con array) en tandas de NOCODB_BULK_BATCH_SIZE
+        """
+        return await self._bulk_request("patch", table_url, records) is not None
+    
+    async def bulk_insert_records(self, table_url: str, records: List[Dict[str, Any]],
+                                  raise_rejected: bool = False) -> Optional[List[Dict[str, Any]]]:
         """
+        Inserta registros en lote (POST con array) en tandas de NOCODB_BULK_BATCH_SIZE.
+        Devuelve los registros creados (con su id) o None si falla
+        """
+        return await self._bulk_request("post", table_url, records, raise_rejected=raise_rejected)
+    
+    async def get_material_keys(self, page_size: int = 1000) -> Optional[Dict[tuple, Any]]:
+        """
+        Obtiene el índice (tipo_material, marca, modelo) -> id de todos los materiales,
+        pidiendo solo esas columnas página por página
+        """
+        id_field = settings.NOCODB_ID_FIELD
+        query = NocodbQuery().select(id_field, "tipo_material", "marca", "modelo")
+        keys: Dict[tuple, Any] = {}
         try:
-            params = {
-                "limit": limit,
-                "sort": "-fecha_consulta"
-            }
-            
-            async with aiohttp.ClientSession() as session:
-                async with session.get(
-                    self.contactos_url,
-                    params=params,
-                    headers=self.headers
-                ) as response:
-                    
-                    if response.status == 200:
+            async for row in self.iter_records(self.materiales_url, query, page_size=page_size):
+                keys[material_key(row)] = row.get(id_field)
+            return keys
+        except ConnectionError as e:
+            logger.error(f"❌ Error obteniendo índice de materiales: {e}")
+            return None
+    
+    async def iter_records(self, table_url: str, query: Optional[NocodbQuery] = None,
+                           page_size: int = 1000,
+                           limit: Optional[int] = None,
+                           offset: int = 0) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Recorre los registros de una tabla página por página (offset) sin cargarlos
+        en memoria; la página siguiente se pide mientras se consume la actual.
+        Las columnas, filtros y orden de `query` se resuelven en NocoDB; limit corta
+        el total recorrido. Lanza ConnectionError si NocoDB responde con error
+        """
+        query_params = query.params() if query is not None else {}
+        if limit is not None and limit <= 0:
+            return
+        end = None if limit is None else offset + limit
+        
+        async with self.guarded_session() as session:
+            async def fetch_page(page_offset: int):
+                size = page_size if end is None else min(page_size, end - page_offset)
+                params: Dict[str, Any] = {**query_params, "limit": size, "offset": page_offset}
+                try:
+                    async with session.get(
+                        table_url,
+                        params=params,
+                        headers=self.headers
+                    ) as response:
+                        
+                        if response.status != 200:
+                            error_text = await response.text()
+                            raise ConnectionError(f"NocoDB respondió {response.status}: {error_text}")
                         result = await response.json()
-                        return result.get("list", [])
-                    else:
-                        error_text = await response.text()
-                        logger.error(f"Error obteniendo contactos: {response.status} - {error_text}")
-                        return None
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    raise ConnectionError(f"Error de conexión con NocoDB: {e}") from e
+                return result.get("list", []), result.get("pageInfo", {}).get("isLastPage", True)
+            
+            pending: Optional[asyncio.Future] = asyncio.ensure_future(fetch_page(offset))
+            try:
+                while pending is not None:
+                    rows, last_page = await pending
+                    pending = None
+                    offset += len(rows)
+                    if rows and not last_page and (end is None or offset < end):
+                        # Prefetch: la próxima página viaja mientras se entregan estas filas
+                        pending = asyncio.ensure_future(fetch_page(offset))
+                    for row in rows:
+                        yield row
+            finally:
+                if pending is not None:
+                    pending.cancel()
+                    # Si ya había fallado, que no quede una excepción sin recuperar
+                    pending.add_done_callback(lambda task: task.cancelled() or task.exception())
+    
+    def iter_contacts(self, query: Optional[NocodbQuery] = None, page_size: int = 1000,
+                      limit: Optional[int] = None) -> AsyncIterator[Dict[str, Any]]:
+        """Contactos de NocoDB página por página (por defecto los más recientes primero)"""
+        query = (query or NocodbQuery()).with_default_sort("-fecha_consulta")
+        return self.iter_records(self.contactos_url, query, page_size, limit)
+    
+    def iter_quotes(self, query: Optional[NocodbQuery] = None, page_size: int = 1000,
+                    limit: Optional[int] = None) -> AsyncIterator[Dict[str, Any]]:
+        """Cotizaciones de NocoDB página por página (por defecto las más recientes primero)"""
+        query = (query or NocodbQuery()).with_default_sort("-fecha_creacion")
+        return self.iter_records(self.cotizaciones_url, query, page_size, limit)
+    
+    def iter_customers(self, query: Optional[NocodbQuery] = None, page_size: int = 1000,
+                       limit: Optional[int] = None) -> AsyncIterator[Dict[str, Any]]:
+        """Clientes de NocoDB página por página (por defecto los más recientes primero)"""
+        query = (query or NocodbQuery()).with_default_sort("-fecha_consulta")
+        return self.iter_records(self.clientes_url, query, page_size, limit)
+    
+    def iter_materials(self, query: Optional[NocodbQuery] = None, page_size: int = 1000,
+                       limit: Optional[int] = None) -> AsyncIterator[Dict[str, Any]]:
+        """Materiales de NocoDB página por página (por defecto los actualizados más recientemente primero)"""
+        query = (query or NocodbQuery()).with_default_sort("-fecha_actualizacion")
+        return self.iter_records(self.materiales_url, query, page_size, limit)
+    
+    async def upsert_records(self, table_url: str, records: List[Dict[str, Any]], key_fields: tuple,
+                             raise_rejected: bool = False) -> bool:
+        """
+        Alta idempotente: los registros cuya clave ya existe se actualizan
+        (PATCH con su id) y el resto se inserta, todo con llamadas masivas.
+        Una clave vacía no identifica a nadie: esos registros siempre se insertan.
+        Con raise_rejected, un 4xx de NocoDB lanza RejectedWriteError
+        """
+        id_field = settings.NOCODB_ID_FIELD
+        first = key_fields[0]
+        values = sorted({str(record.get(first) or "") for record in records} - {""})
+        existing: Dict[tuple, Any] = {}
+        if values:
+            query = NocodbQuery().select(id_field, *key_fields)
+            try:
+                query = query.where(first, "in", values)
+            except ValueError:
+                # Algún valor no entra en la sintaxis de filtros: se recorre la tabla (solo las claves)
+                pass
+            try:
+                async for row in self.iter_records(table_url, query):
+                    key = natural_key(row, key_fields)
+                    if all(key):
+                        existing[key] = row.get(id_field)
+            except ConnectionError as e:
+                logger.error(f"❌ Error buscando registros existentes: {e}")
+                return False
+        
+        updates, inserts = [], []
+        for record in records:
+            key = natural_key(record, key_fields)
+            record_id = existing.get(key) if all(key) else None
+            if record_id is None:
+                inserts.append(record)
+            else:
+                updates.append({**record, id_field: record_id})
+        
+        if updates and await self._bulk_request("patch", table_url, updates, raise_rejected) is None:
+            return False
+        if inserts and await self._bulk_request("post", table_url, inserts, raise_rejected) is None:
+            return False
+        logger.info(f"✅ Upsert en NocoDB: {len(inserts)} altas, {len(updates)} ya existentes")
+        return True
+    
+    async def deliver_outbox_batch(self, table_name: str, records: List[Dict[str, Any]], retry: bool) -> bool:
+        """
+        Entrega de un lote del outbox: inserción masiva, o upsert por el id de idempotencia
+        (NOCODB_OUTBOX_ID_FIELD) si es un reintento; sin esa columna el reintento solo inserta.
+        Un rechazo de NocoDB (4xx) lanza RejectedWriteError: el outbox aísla el registro
+        """
+        table_url = self.outbox_tables[table_name]
+        id_field = settings.NOCODB_OUTBOX_ID_FIELD
+        if retry and id_field:
+            # Un intento anterior pudo haber llegado a NocoDB (timeout): no duplicar
+            return await self.upsert_records(table_url, records, (id_field,), raise_rejected=True)
+        return await self._bulk_request("post", table_url, records, raise_rejected=True) is not None
+    
+    async def update_material_prices(self, price_updates: List[Dict[str, Any]]) -> bool:
+        """
+        Actualiza precios de materiales en NocoDB con llamadas masivas
+        """
+        fecha = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        records = [{**update, "fecha_actualizacion": fecha} for update in price_updates]
+        return await self.bulk_update_records(self.materiales_url, records)
+    
+    async def _bulk_request(self, method: str, table_url: str, records: List[Dict[str, Any]],
+                            raise_rejected: bool = False) -> Optional[List[Dict[str, Any]]]:
+        """
+        Envía los registros en tandas usando una única sesión HTTP e invalida las lecturas de la tabla.
+        Devuelve None si falla; con raise_rejected, un 4xx (salvo 408/429) lanza RejectedWriteError
+        """
+        if not records:
+            return []
+        
+        batch_size = max(1, settings.NOCODB_BULK_BATCH_SIZE)
+        results: List[Dict[str, Any]] = []
+        try:
+            async with self.guarded_session() as session:
+                for start in range(0, len(records), batch_size):
+                    batch = records[start:start + batch_size]
+                    async with session.request(
+                        method.upper(),
+                        table_url,
+                        json=batch,
+                        headers=self.headers
+                    ) as response:
                         
+                        if response.status != 200:
+                            error_text = await response.text()
+                            logger.error(f"❌ Error en operación masiva {method.upper()} ({len(batch)} registros): {response.status} - {error_text}")
+                            if raise_rejected and 400 <= response.status < 500 and response.status not in (408, 429):
+                                raise RejectedWriteError(response.status, error_text)
+                            return None
+                        result = await response.json()
+                        results.extend(result if isinstance(result, list) else [result])
+            
+            logger.info(f"✅ Operación masiva {method.upper()} completada: {len(records)} registros")
+            return results
+            
+        except RejectedWriteError:
+            raise
         except Exception as e:
+            logger.error(f"❌ Error en operación masiva {method.upper()}: {e}")
+            return None
+        finally:
+            self.invalidate_table(table_url)
+    
+    @coalesced_read
+    async def get_contacts(self, limit: int = 100) -> Optional[list]:
+        """
+        Obtiene la lista de contactos desde NocoDB (recorre las páginas que hagan falta)
+        """
+        try:
+            return [row async for row in self.iter_contacts(limit=self._list_limit(limit))]
+        except ConnectionError as e:
             logger.error(f"Error obteniendo contactos: {e}")
             return None
     
+    @coalesced_read
     async def get_quotes(self, limit: int = 100) -> Optional[list]:
         """
-        Obtiene la lista de cotizaciones desde NocoDB
+        Obtiene la lista de cotizaciones desde NocoDB (recorre las páginas que hagan falta)
         """
         try:
-            params = {
-                "limit": limit,
-                "sort": "-fecha_creacion"
-            }
+            return [row async for row in self.iter_quotes(limit=self._list_limit(limit))]
+        except ConnectionError as e:
+            logger.error(f"Error obteniendo cotizaciones: {e}")
+            return None
+    
+    @coalesced_read
+    async def get_materials_from_nocodb(self, limit: int = 1000, active_only: bool = False) -> Optional[List[Dict[str, Any]]]:
+        """
+        Obtener materiales desde NocoDB (recorre las páginas que hagan falta).
+        Solo se piden las columnas del catálogo; con active_only NocoDB filtra los inactivos.
+        Si NocoDB no responde o el circuito está abierto, devuelve el último catálogo leído
+        """
+        query = NocodbQuery().select(*MATERIAL_CATALOG_FIELDS)
+        if active_only:
+            query = query.where("activo", "eq", True)
+        try:
+            logger.info(f"🔄 Obteniendo materiales desde NocoDB (límite: {limit})")
+            materials = [row async for row in self.iter_materials(query, limit=limit)]
+            logger.info(f"✅ Materiales obtenidos exitosamente: {len(materials)} registros")
+            self._last_materials[active_only] = materials
+            return materials
             
-            async with aiohttp.ClientSession() as session:
-                async with session.get(
-                    self.cotizaciones_url,
-                    params=params,
+        except CircuitOpenError as e:
+            logger.warning(f"🔴 {e}: se usa el último catálogo leído")
+            return self._last_materials.get(active_only)
+        except ConnectionError as e:
+            logger.error(f"🌐 Error obteniendo materiales desde NocoDB: {e}")
+            return self._last_materials.get(active_only)
+    
+    async def update_contact_status(self, contact_id: int, status: str) -> bool:
+        """
+        Actualiza el estado de un contacto
+        """
+        try:
+            update_data = {"estado_consulta": status}
+            
+            async with self.guarded_session() as session:
+                async with session.patch(
+                    f"{self.contactos_url}/{contact_id}",
+                    json=update_data,
                     headers=self.headers
                 ) as response:
                     
                     if response.status == 200:
-                        result = await response.json()
-                        return result.get("list", [])
+                        self.patch_cached_record(self.contactos_url, contact_id, update_data)
+                        logger.info(f"Estado del contacto {contact_id} actualizado a: {status}")
+                        return True
                     else:
                         error_text = await response.text()
-                        logger.error(f"Error obteniendo cotizaciones: {response.status} - {error_text}")
-                        return None
+                        logger.error(f"Error actualizando estado: {response.status} - {error_text}")
+                        return False
                         
         except Exception as e:
-            logger.error(f"Error obteniendo cotizaciones: {e}")
-            return None
+            logger.error(f"Error actualizando estado del contacto: {e}")
+            self.invalidate_table(self.contactos_url)
+            return False
     
-    async def get_materials_from_nocodb(self, limit: int = 1000) -> Optional[List[Dict[str, Any]]]:
+    @invalidates("get_contacts", "get_customers")
+    async def save_customer_data(self, customer_data: Dict[str, Any]) -> bool:
         """
-        Obtener materiales desde NocoDB
+        Guarda un cliente del cotizador de construcción en la tabla de clientes
+        (por defecto la de contactos, con sus mismas columnas)
         """
         try:
-            logger.info(f"🔄 Obteniendo materiales desde NocoDB (límite: {limit})")
+            logger.info(f"🔄 Guardando cliente: {customer_data.get('nombre', 'Sin nombre')}")
             
-            params = {
-                "limit": limit,
-                "sort": "-fecha_actualizacion"
+            detalle = {
+                key: value for key, value in customer_data.items()
+                if key not in ("nombre", "email", "whatsapp", "observaciones", "fecha") and value is not None
+            }
+            nocodb_data = {
+                "nombre_cliente": customer_data.get("nombre", ""),
+                "email_cliente": customer_data.get("email", ""),
+                "telefono_cliente": customer_data.get("whatsapp", ""),
+                "mensaje_consulta": customer_data.get("observaciones") or "",
+                "fecha_consulta": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                "estado_consulta": "Nuevo",
+                "origen_consulta": "Cotizador Construcción",
+                "notas_internas": ", ".join(f"{key}: {value}" for key, value in detalle.items())
             }
             
-            async with aiohttp.ClientSession() as session:
-                async with session.get(
-                    self.materiales_url,
-                    params=params,
-                    headers=self.headers,
-                    timeout=aiohttp.ClientTimeout(total=30)
+            async with self.guarded_session() as session:
+                async with session.post(
+                    self.clientes_url,
+                    json=nocodb_data,
+                    headers=self.headers
                 ) as response:
                     
-                    logger.info(f"📡 Respuesta recibida de NocoDB (Materiales): {response.status}")
-                    
                     if response.status == 200:
-                        result = await response.json()
-                        materials = result.get("list", [])
-                        logger.info(f"✅ Materiales obtenidos exitosamente: {len(materials)} registros")
-                        return materials
+                        logger.info("✅ Cliente guardado exitosamente")
+                        return True
                     else:
                         error_text = await response.text()
-                        logger.error(f"❌ Error obteniendo materiales desde NocoDB: {response.status} - {error_text}")
-                        return None
-                        
-        except aiohttp.ClientError as e:
-            logger.error(f"🌐 Error de conexión con NocoDB (Materiales): {e}")
-            return None
-        except asyncio.TimeoutError:
-            logger.error("⏰ Timeout en conexión con NocoDB (Materiales)")
-            return None
+                        logger.error(f"❌ Error guardando cliente: {response.status} - {error_text}")
+                        return False
+        
         except Exception as e:
-            logger.error(f"❌ Error inesperado en servicio NocoDB (Materiales): {e}")
+            logger.error(f"❌ Error guardando cliente: {e}")
+            return False
+    
+    @coalesced_read
+    async def get_customers(self, limit: int = 100) -> Optional[list]:
+        """
+        Obtiene la lista de clientes desde NocoDB (recorre las páginas que hagan falta)
+        """
+        try:
+            return [row async for row in self.iter_customers(limit=self._list_limit(limit))]
+        except ConnectionError as e:
+            logger.error(f"Error obteniendo clientes: {e}")
             return None
     
-    async def update_contact_status(self, contact_id: int, status: str) -> bool:
+    async def update_customer_status(self, customer_id: int, status: str) -> bool:
         """
-        Actualiza el estado de un contacto
+        Actualiza el estado de un cliente
         """
         try:
-            update_data = {"estado_consulta": status}
-            
-            async with aiohttp.ClientSession() as session:
+            async with self.guarded_session() as session:
                 async with session.patch(
-                    f"{self.contactos_url}/{contact_id}",
-                    json=update_data,
+                    f"{self.clientes_url}/{customer_id}",
+                    json={"estado_consulta": status},
                     headers=self.headers
                 ) as response:
                     
                     if response.status == 200:
-                        logger.info(f"Estado del contacto {contact_id} actualizado a: {status}")
+                        self.patch_cached_record(self.clientes_url, customer_id, {"estado_consulta": status})
+                        logger.info(f"Estado del cliente {customer_id} actualizado a: {status}")
                         return True
                     else:
                         error_text = await response.text()
-                        logger.error(f"Error actualizando estado: {response.status} - {error_text}")
+                        logger.error(f"Error actualizando estado del cliente: {response.status} - {error_text}")
                         return False
-                        
+        
         except Exception as e:
-            logger.error(f"Error actualizando estado del contacto: {e}")
+            logger.error(f"Error actualizando estado del cliente: {e}")
+            self.invalidate_table(self.clientes_url)
             return False
 
 # Instancia global del servicio de Nocodb
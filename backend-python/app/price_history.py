@@ -0,0 +1,249 @@
+"""
+Historial compacto de precios de materiales
+Serie temporal por SKU (categoría:id) guardada en arreglos de floats y persistida
+en un archivo binario de solo-agregado. Varios workers comparten el archivo: las
+escrituras toman un flock exclusivo y cada proceso lee las observaciones que
+agregaron los demás antes de escribir y antes de responder una consulta
+"""
+
+import bisect
+import fcntl
+import logging
+import os
+import struct
+import threading
+import time
+from array import array
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, BinaryIO, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+# Registro en disco: timestamp (float64), precio (float64), largo del SKU (uint16) + SKU en UTF-8
+RECORD_HEADER = struct.Struct("<ddH")
+
+# Observación de precio: (sku, precio, timestamp en segundos epoch)
+PriceObservation = Tuple[str, float, float]
+
+
+def material_sku(category: str, material_id: Any) -> str:
+    return f"{category}:{material_id}"
+
+
+class PriceHistoryStore:
+    """Serie temporal de precios por SKU: timestamps y precios en array('d')"""
+
+    def __init__(self, path: Optional[str] = None):
+        # Sin ruta el historial vive solo en memoria (y solo en este proceso)
+        self.path = path or None
+        self._series: Dict[str, Tuple[array, array]] = {}
+        self._offset = 0  # bytes del archivo ya leídos
+        self._loaded = False
+        self._lock = threading.RLock()
+        self._writer: Optional[ThreadPoolExecutor] = None
+
+    def load(self):
+        """
+        Leer las observaciones del archivo que este proceso todavía no vio (I/O
+        bloqueante): en la API se llama en el startup con asyncio.to_thread y las
+        consultas lo repiten para ver lo que agregaron otros workers
+        """
+        with self._lock:
+            self._catch_up()
+
+    def _catch_up(self):
+        if not self.path:
+            return
+        try:
+            size = os.path.getsize(self.path)
+        except FileNotFoundError:
+            return
+        if size == self._offset:
+            return
+        with self._locked_file() as f:
+            self._read_new(f)
+
+    @contextmanager
+    def _locked_file(self) -> Iterator[BinaryIO]:
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path, "a+b") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield f
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _read_new(self, f: BinaryIO):
+        """Aplicar los registros desde self._offset (con el flock tomado)"""
+        f.seek(0, os.SEEK_END)
+        if f.tell() < self._offset:
+            # El archivo se reemplazó o se truncó por fuera: se relee completo
+            self._series.clear()
+            self._offset = 0
+        f.seek(self._offset)
+        data = f.read()
+
+        offset = 0
+        count = 0
+        while offset + RECORD_HEADER.size <= len(data):
+            timestamp, price, sku_length = RECORD_HEADER.unpack_from(data, offset)
+            end = offset + RECORD_HEADER.size + sku_length
+            if end > len(data):
+                break
+            sku = data[offset + RECORD_HEADER.size:end].decode("utf-8")
+            self._append(sku, timestamp, price)
+            offset = end
+            count += 1
+
+        if offset != len(data):
+            # Escritura interrumpida (con el flock nadie está escribiendo): se descarta el registro incompleto
+            logger.warning(f"Historial de precios con {len(data) - offset} bytes incompletos, se truncan")
+            f.truncate(self._offset + offset)
+        self._offset += offset
+
+        if not self._loaded:
+            self._loaded = True
+            logger.info(f"Historial de precios cargado: {count} observaciones de {len(self._series)} materiales")
+
+    def _append(self, sku: str, timestamp: float, price: float):
+        series = self._series.get(sku)
+        if series is None:
+            series = self._series[sku] = (array("d"), array("d"))
+        timestamps, prices = series
+        if timestamps and timestamp < timestamps[-1]:
+            # Observación fuera de orden: insertar manteniendo la serie ordenada
+            index = bisect.bisect_right(timestamps, timestamp)
+            timestamps.insert(index, timestamp)
+            prices.insert(index, price)
+        else:
+            timestamps.append(timestamp)
+            prices.append(price)
+
+    def _apply(self, observations: List[PriceObservation]) -> Tuple[int, bytes]:
+        """Agregar en memoria los precios que cambiaron; devuelve (cantidad, registros a escribir)"""
+        buffer = bytearray()
+        recorded = 0
+        for sku, price, timestamp in observations:
+            price = float(price)
+            series = self._series.get(sku)
+            if series is not None and series[1] and series[1][-1] == price:
+                continue
+            self._append(sku, timestamp, price)
+            encoded = sku.encode("utf-8")
+            buffer += RECORD_HEADER.pack(timestamp, price, len(encoded)) + encoded
+            recorded += 1
+        return recorded, bytes(buffer)
+
+    def record_many(self, observations: Iterable[PriceObservation]) -> int:
+        """
+        Registrar precios observados; solo se guardan los que cambiaron respecto al último.
+        Hace I/O bloqueante: desde el event loop usar submit()
+        """
+        observations = list(observations)
+        with self._lock:
+            if not self.path:
+                return self._apply(observations)[0]
+            try:
+                with self._locked_file() as f:
+                    # Primero lo que agregaron otros workers, así el "cambió" compara contra lo último
+                    self._read_new(f)
+                    recorded, buffer = self._apply(observations)
+                    if buffer:
+                        f.write(buffer)
+                        f.flush()
+                        self._offset += len(buffer)
+                return recorded
+            except OSError as e:
+                logger.error(f"Error guardando historial de precios: {e}")
+                return 0
+
+    def submit(self, observations: Iterable[PriceObservation]) -> Future:
+        """Registrar en un thread aparte, en el orden en que se envían (no bloquea el event loop)"""
+        with self._lock:
+            if self._writer is None:
+                self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="price-history")
+        return self._writer.submit(self.record_many, list(observations))
+
+    def record(self, sku: str, price: float, timestamp: Optional[float] = None) -> bool:
+        return self.record_many([(sku, price, timestamp or time.time())]) == 1
+
+    def price_at(self, sku: str, when: datetime) -> Optional[Dict[str, Any]]:
+        """Precio vigente en una fecha (última observación anterior o igual)"""
+        with self._lock:
+            self._catch_up()
+            series = self._series.get(sku)
+            if series is None:
+                return None
+            timestamps, prices = series
+            index = bisect.bisect_right(timestamps, when.timestamp()) - 1
+            if index < 0:
+                return None
+            return {
+                "sku": sku,
+                "price": prices[index],
+                "observed_at": datetime.fromtimestamp(timestamps[index]).isoformat()
+            }
+
+    def trend(self, sku: str,
+              since: Optional[datetime] = None,
+              until: Optional[datetime] = None,
+              max_points: int = 200) -> Optional[Dict[str, Any]]:
+        """Evolución del precio en un rango, con variación y puntos submuestreados"""
+        with self._lock:
+            self._catch_up()
+            series = self._series.get(sku)
+            if series is None:
+                return None
+            timestamps, prices = series
+            start = bisect.bisect_left(timestamps, since.timestamp()) if since else 0
+            end = bisect.bisect_right(timestamps, until.timestamp()) if until else len(timestamps)
+            window = prices[start:end]
+            if not window:
+                return {"sku": sku, "observations": 0, "points": []}
+
+            step = max(1, -(-len(window) // max(1, max_points)))
+            indices = list(range(start, end, step))
+            if indices[-1] != end - 1:
+                indices.append(end - 1)
+
+            first, last = window[0], window[-1]
+            return {
+                "sku": sku,
+                "observations": len(window),
+                "first_price": first,
+                "last_price": last,
+                "min_price": min(window),
+                "max_price": max(window),
+                "change_pct": round((last - first) / first * 100, 2) if first else None,
+                "points": [
+                    {"date": datetime.fromtimestamp(timestamps[i]).isoformat(), "price": prices[i]}
+                    for i in indices
+                ]
+            }
+
+    def price_ratio(self, sku: str, since: datetime, until: Optional[datetime] = None) -> Optional[float]:
+        """Factor de ajuste de precio entre dos fechas (útil para re-cotizar)"""
+        before = self.price_at(sku, since)
+        after = self.price_at(sku, until or datetime.now())
+        if not before or not after or not before["price"]:
+            return None
+        return after["price"] / before["price"]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._catch_up()
+            return {
+                "materials": len(self._series),
+                "observations": sum(len(t) for t, _ in self._series.values()),
+                "path": self.path
+            }
+
+
+# Instancia global del historial de precios
+price_history = PriceHistoryStore(settings.PRICE_HISTORY_PATH)
@@ -1,10 +1,10 @@
-import aiohttp
 import asyncio
 from typing import Dict, List, Optional
 from datetime import datetime, timedelta
 import json
 import os
 from .models import PrecioMaterial, Material
+from .http_client import http_clients
 
 class PriceService:
     """Servicio para obtener precios de materiales de construcción en Argentina"""
@@ -86,7 +86,7 @@ class PriceService:
     async def _fetch_from_indec(self, material: str) -> Optional[PrecioMaterial]:
         """Obtiene precios del INDEC (Instituto Nacional de Estadística y Censos)"""
         try:
-            async with aiohttp.ClientSession() as session:
+            async with http_clients.session("precios") as session:
                 # Simular llamada a API del INDEC
                 # En producción, usar la API real del INDEC
                 await asyncio.sleep(0.1)  # Simular delay de red
@@ -107,7 +107,7 @@ class PriceService:
     async def _fetch_from_camara_construccion(self, material: str) -> Optional[PrecioMaterial]:
         """Obtiene precios de la Cámara de Construcción"""
         try:
-            async with aiohttp.ClientSession() as session:
+            async with http_clients.session("precios") as session:
                 # Simular llamada a API de la Cámara
                 await asyncio.sleep(0.1)
                 
@@ -127,7 +127,7 @@ class PriceService:
     async def _fetch_from_precios_ar(self, material: str) -> Optional[PrecioMaterial]:
         """Obtiene precios de PreciosAR"""
         try:
-            async with aiohttp.ClientSession() as session:
+            async with http_clients.session("precios") as session:
                 # Simular llamada a API de PreciosAR
                 await asyncio.sleep(0.1)
                 
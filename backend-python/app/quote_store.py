@@ -0,0 +1,553 @@
+"""
+Repositorio de cotizaciones solares
+Backend en memoria (desarrollo) o SQLite en modo WAL (compartido entre workers y persistente)
+"""
+
+import asyncio
+import bisect
+import heapq
+import logging
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from .config import settings
+from .solar_models import SolarQuoteResponse
+
+logger = logging.getLogger(__name__)
+
+# Clave de orden de las cotizaciones: (created_at en segundos epoch, quote_id)
+SortKey = Tuple[float, str]
+
+
+def encode_cursor(quote: SolarQuoteResponse) -> str:
+    """Cursor de paginación `<created_at ISO>,<quote_id>` de una cotización"""
+    return f"{quote.created_at.isoformat()},{quote.quote_id}"
+
+
+def decode_cursor(cursor: str) -> SortKey:
+    """Interpretar un cursor `after=<created_at>,<quote_id>`; ValueError si es inválido"""
+    created_at, separator, quote_id = cursor.partition(",")
+    if not separator or not quote_id:
+        raise ValueError(f"Cursor inválido: {cursor!r}")
+    return datetime.fromisoformat(created_at).timestamp(), quote_id
+
+
+def sort_key(quote: SolarQuoteResponse) -> SortKey:
+    return quote.created_at.timestamp(), quote.quote_id
+
+
+class QuoteRepository(ABC):
+    """Interfaz del repositorio de cotizaciones"""
+
+    @abstractmethod
+    async def save(self, quote: SolarQuoteResponse):
+        ...
+
+    @abstractmethod
+    async def get(self, quote_id: str) -> Optional[SolarQuoteResponse]:
+        ...
+
+    @abstractmethod
+    async def delete(self, quote_id: str) -> bool:
+        ...
+
+    @abstractmethod
+    async def update_status(self, quote_id: str, status: str) -> bool:
+        ...
+
+    @abstractmethod
+    async def list(self, limit: int = 10, offset: int = 0,
+                   client_email: Optional[str] = None,
+                   location: Optional[str] = None) -> Tuple[List[SolarQuoteResponse], int]:
+        """Cotizaciones más recientes primero y total que cumple los filtros"""
+        ...
+
+    @abstractmethod
+    async def page(self, limit: int = 10, after: Optional[SortKey] = None,
+                   client_email: Optional[str] = None,
+                   location: Optional[str] = None,
+                   created_from: Optional[datetime] = None,
+                   created_to: Optional[datetime] = None) -> Tuple[List[SolarQuoteResponse], bool]:
+        """
+        Paginación por clave (keyset): cotizaciones anteriores a `after` en orden
+        (created_at, quote_id) descendente. Devuelve la página y si hay más.
+        """
+        ...
+
+    @abstractmethod
+    async def count(self) -> int:
+        ...
+
+    @abstractmethod
+    async def sweep_expired(self) -> int:
+        """Quitar (o archivar) las cotizaciones vencidas; devuelve cuántas se quitaron"""
+        ...
+
+    @abstractmethod
+    async def stats(self) -> Dict[str, Any]:
+        """Contadores de cotizaciones vigentes, vencidas pendientes de barrido y desalojadas"""
+        ...
+
+
+class MemoryQuoteRepository(QuoteRepository):
+    """Cotizaciones en un diccionario del proceso (se pierden al reiniciar)"""
+
+    def __init__(self, max_entries: int = 0):
+        self._quotes: Dict[str, SolarQuoteResponse] = {}
+        self.max_entries = max_entries
+
+        # Índices ordenados por (created_at, quote_id), mantenidos en cada alta y baja
+        self._by_created: List[SortKey] = []
+        self._by_email: Dict[str, List[SortKey]] = {}
+        self._by_location: Dict[str, List[SortKey]] = {}
+
+        # Min-heap de (vencimiento, quote_id); las entradas obsoletas se descartan al extraerlas
+        self._expiry_heap: List[Tuple[float, str]] = []
+        self.evicted = {"expired": 0, "capacity": 0}
+
+    def _pop_soonest(self) -> Optional[Tuple[float, str]]:
+        """Extraer la próxima cotización a vencer que siga almacenada"""
+        while self._expiry_heap:
+            valid_until, quote_id = heapq.heappop(self._expiry_heap)
+            quote = self._quotes.get(quote_id)
+            if quote is not None and quote.valid_until.timestamp() == valid_until:
+                return valid_until, quote_id
+        return None
+
+    def _index_lists(self, quote: SolarQuoteResponse) -> List[List[SortKey]]:
+        lists = [self._by_created]
+        email = (quote.request.client_email or "").lower()
+        if email:
+            lists.append(self._by_email.setdefault(email, []))
+        lists.append(self._by_location.setdefault(quote.request.location, []))
+        return lists
+
+    def _discard(self, quote_id: str) -> Optional[SolarQuoteResponse]:
+        """Quitar una cotización del almacenamiento y de los índices ordenados"""
+        quote = self._quotes.pop(quote_id, None)
+        if quote is not None:
+            key = sort_key(quote)
+            for index in self._index_lists(quote):
+                position = bisect.bisect_left(index, key)
+                if position < len(index) and index[position] == key:
+                    del index[position]
+        return quote
+
+    async def save(self, quote: SolarQuoteResponse):
+        self._discard(quote.quote_id)
+        self._quotes[quote.quote_id] = quote
+        key = sort_key(quote)
+        for index in self._index_lists(quote):
+            bisect.insort(index, key)
+        heapq.heappush(self._expiry_heap, (quote.valid_until.timestamp(), quote.quote_id))
+        if self.max_entries and len(self._quotes) > self.max_entries:
+            # Sobre el límite se desaloja primero lo que vence antes
+            now = time.time()
+            while len(self._quotes) > self.max_entries:
+                entry = self._pop_soonest()
+                if entry is None:
+                    break
+                self._discard(entry[1])
+                self.evicted["expired" if entry[0] <= now else "capacity"] += 1
+
+    async def get(self, quote_id: str) -> Optional[SolarQuoteResponse]:
+        return self._quotes.get(quote_id)
+
+    async def delete(self, quote_id: str) -> bool:
+        return self._discard(quote_id) is not None
+
+    async def update_status(self, quote_id: str, status: str) -> bool:
+        quote = self._quotes.get(quote_id)
+        if quote is None:
+            return False
+        quote.status = status
+        return True
+
+    async def list(self, limit: int = 10, offset: int = 0,
+                   client_email: Optional[str] = None,
+                   location: Optional[str] = None) -> Tuple[List[SolarQuoteResponse], int]:
+        index = self._select_index(client_email, location)
+        if client_email is None or location is None:
+            # El índice elegido ya es exactamente el filtro: se corta por posición, O(limit)
+            end = max(len(index) - offset, 0)
+            keys = index[max(end - limit, 0):end]
+            return [self._quotes[key[1]] for key in reversed(keys)], len(index)
+        keys = [
+            key for key in reversed(index)
+            if self._matches(self._quotes[key[1]], client_email, location)
+        ]
+        return [self._quotes[key[1]] for key in keys[offset:offset + limit]], len(keys)
+
+    def _select_index(self, client_email: Optional[str], location: Optional[str]) -> List[SortKey]:
+        """Índice más selectivo para los filtros dados"""
+        if client_email is not None:
+            return self._by_email.get(client_email.lower(), [])
+        if location is not None:
+            return self._by_location.get(location, [])
+        return self._by_created
+
+    @staticmethod
+    def _matches(quote: SolarQuoteResponse, client_email: Optional[str], location: Optional[str]) -> bool:
+        return (
+            (client_email is None or (quote.request.client_email or "").lower() == client_email.lower())
+            and (location is None or quote.request.location == location)
+        )
+
+    async def page(self, limit: int = 10, after: Optional[SortKey] = None,
+                   client_email: Optional[str] = None,
+                   location: Optional[str] = None,
+                   created_from: Optional[datetime] = None,
+                   created_to: Optional[datetime] = None) -> Tuple[List[SolarQuoteResponse], bool]:
+        index = self._select_index(client_email, location)
+
+        # Acotar el rango con búsqueda binaria: O(log n) + lo que se recorre
+        high = bisect.bisect_left(index, after) if after is not None else len(index)
+        if created_to is not None:
+            high = min(high, bisect.bisect_left(index, (created_to.timestamp(), chr(0x10FFFF))))
+        low = bisect.bisect_left(index, (created_from.timestamp(), "")) if created_from is not None else 0
+
+        quotes: List[SolarQuoteResponse] = []
+        for position in range(high - 1, low - 1, -1):
+            quote = self._quotes[index[position][1]]
+            if not self._matches(quote, client_email, location):
+                continue
+            if len(quotes) == limit:
+                return quotes, True
+            quotes.append(quote)
+        return quotes, False
+
+    async def count(self) -> int:
+        return len(self._quotes)
+
+    async def sweep_expired(self) -> int:
+        now = time.time()
+        removed = 0
+        while self._expiry_heap and self._expiry_heap[0][0] <= now:
+            entry = self._pop_soonest()
+            if entry is None:
+                break
+            if entry[0] > now:
+                heapq.heappush(self._expiry_heap, entry)
+                break
+            self._discard(entry[1])
+            removed += 1
+        self.evicted["expired"] += removed
+        # Compactar el heap si acumuló demasiadas entradas obsoletas
+        if len(self._expiry_heap) > 2 * len(self._quotes) + 64:
+            self._expiry_heap = [(q.valid_until.timestamp(), q.quote_id) for q in self._quotes.values()]
+            heapq.heapify(self._expiry_heap)
+        return removed
+
+    async def stats(self) -> Dict[str, Any]:
+        now = time.time()
+        expired = sum(1 for q in self._quotes.values() if q.valid_until.timestamp() <= now)
+        return {
+            "backend": "memory",
+            "live": len(self._quotes) - expired,
+            "expired": expired,
+            "evicted_by_this_worker": dict(self.evicted),
+            "max_entries": self.max_entries
+        }
+
+
+class SQLiteQuoteRepository(QuoteRepository):
+    """Cotizaciones en SQLite (WAL); las consultas corren en un thread para no bloquear el event loop"""
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS solar_quotes (
+        quote_id TEXT PRIMARY KEY,
+        created_at REAL NOT NULL,
+        valid_until REAL NOT NULL,
+        client_email TEXT,
+        location TEXT,
+        status TEXT NOT NULL,
+        payload TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_solar_quotes_created_at ON solar_quotes (created_at, quote_id);
+    CREATE INDEX IF NOT EXISTS idx_solar_quotes_client_email ON solar_quotes (client_email, created_at, quote_id);
+    CREATE INDEX IF NOT EXISTS idx_solar_quotes_location ON solar_quotes (location, created_at, quote_id);
+    CREATE INDEX IF NOT EXISTS idx_solar_quotes_valid_until ON solar_quotes (valid_until);
+    CREATE TABLE IF NOT EXISTS solar_quotes_archive (
+        quote_id TEXT PRIMARY KEY,
+        created_at REAL NOT NULL,
+        valid_until REAL NOT NULL,
+        client_email TEXT,
+        location TEXT,
+        status TEXT NOT NULL,
+        payload TEXT NOT NULL,
+        archived_at REAL NOT NULL
+    );
+    """
+
+    COLUMNS = "quote_id, created_at, valid_until, client_email, location, status, payload"
+
+    def __init__(self, path: str, max_entries: int = 0, archive_expired: bool = False):
+        self.path = path
+        # El límite se aplica en cada alta, en la misma transacción (COUNT(*) recorre el índice más chico)
+        self.max_entries = max_entries
+        self.archive_expired = archive_expired
+        # Desalojos hechos por este worker (la base se comparte entre workers)
+        self.evicted = {"expired": 0, "capacity": 0}
+        self._local = threading.local()
+        self._schema_lock = threading.Lock()
+        self._schema_ready = False
+
+    def _connection(self) -> sqlite3.Connection:
+        """Una conexión por thread del pool"""
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            with self._schema_lock:
+                if not self._schema_ready:
+                    connection.executescript(self.SCHEMA)
+                    self._schema_ready = True
+            self._local.connection = connection
+        return connection
+
+    @staticmethod
+    def _row_to_quote(payload: str, status: str) -> SolarQuoteResponse:
+        quote = SolarQuoteResponse.model_validate_json(payload)
+        # El estado se actualiza en su columna sin reescribir el payload
+        quote.status = status
+        return quote
+
+    def _save(self, quote: SolarQuoteResponse) -> int:
+        """Guardar la cotización; devuelve cuántas se desalojaron por capacidad"""
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.execute(
+                "INSERT OR REPLACE INTO solar_quotes VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    quote.quote_id,
+                    quote.created_at.timestamp(),
+                    quote.valid_until.timestamp(),
+                    (quote.request.client_email or "").lower() or None,
+                    quote.request.location,
+                    quote.status,
+                    quote.model_dump_json()
+                )
+            )
+            over_capacity = self._trim_capacity(connection) if self.max_entries else 0
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        return over_capacity
+
+    def _get(self, quote_id: str) -> Optional[SolarQuoteResponse]:
+        row = self._connection().execute(
+            "SELECT payload, status FROM solar_quotes WHERE quote_id = ?", (quote_id,)
+        ).fetchone()
+        return self._row_to_quote(*row) if row else None
+
+    def _delete(self, quote_id: str) -> bool:
+        return self._connection().execute(
+            "DELETE FROM solar_quotes WHERE quote_id = ?", (quote_id,)
+        ).rowcount > 0
+
+    def _update_status(self, quote_id: str, status: str) -> bool:
+        return self._connection().execute(
+            "UPDATE solar_quotes SET status = ? WHERE quote_id = ?", (status, quote_id)
+        ).rowcount > 0
+
+    @staticmethod
+    def _where(client_email: Optional[str] = None, location: Optional[str] = None,
+               after: Optional[SortKey] = None, created_from: Optional[datetime] = None,
+               created_to: Optional[datetime] = None) -> Tuple[str, List[Any]]:
+        conditions: List[str] = []
+        params: List[Any] = []
+        if client_email is not None:
+            conditions.append("client_email = ?")
+            params.append(client_email.lower())
+        if location is not None:
+            conditions.append("location = ?")
+            params.append(location)
+        if after is not None:
+            conditions.append("(created_at, quote_id) < (?, ?)")
+            params.extend(after)
+        if created_from is not None:
+            conditions.append("created_at >= ?")
+            params.append(created_from.timestamp())
+        if created_to is not None:
+            conditions.append("created_at <= ?")
+            params.append(created_to.timestamp())
+        return (f"WHERE {' AND '.join(conditions)}" if conditions else ""), params
+
+    def _list(self, limit: int, offset: int, client_email: Optional[str],
+              location: Optional[str]) -> Tuple[List[SolarQuoteResponse], int]:
+        where, params = self._where(client_email, location)
+        connection = self._connection()
+        total = connection.execute(f"SELECT COUNT(*) FROM solar_quotes {where}", params).fetchone()[0]
+        rows = connection.execute(
+            f"SELECT payload, status FROM solar_quotes {where} "
+            f"ORDER BY created_at DESC, quote_id DESC LIMIT ? OFFSET ?",
+            [*params, limit, offset]
+        ).fetchall()
+        return [self._row_to_quote(*row) for row in rows], total
+
+    def _page(self, limit: int, after: Optional[SortKey], client_email: Optional[str],
+              location: Optional[str], created_from: Optional[datetime],
+              created_to: Optional[datetime]) -> Tuple[List[SolarQuoteResponse], bool]:
+        where, params = self._where(client_email, location, after, created_from, created_to)
+        rows = self._connection().execute(
+            f"SELECT payload, status FROM solar_quotes {where} "
+            f"ORDER BY created_at DESC, quote_id DESC LIMIT ?",
+            [*params, limit + 1]
+        ).fetchall()
+        return [self._row_to_quote(*row) for row in rows[:limit]], len(rows) > limit
+
+    def _count(self) -> int:
+        return self._connection().execute("SELECT COUNT(*) FROM solar_quotes").fetchone()[0]
+
+    def _remove_where(self, connection: sqlite3.Connection, condition: str, params: Tuple) -> int:
+        """Borrar (archivando si corresponde) las cotizaciones que cumplen la condición"""
+        if self.archive_expired:
+            connection.execute(
+                f"INSERT OR REPLACE INTO solar_quotes_archive SELECT {self.COLUMNS}, ? FROM solar_quotes WHERE {condition}",
+                (time.time(), *params)
+            )
+        return connection.execute(f"DELETE FROM solar_quotes WHERE {condition}", params).rowcount
+
+    def _trim_capacity(self, connection: sqlite3.Connection) -> int:
+        """Desalojar lo que excede max_entries (dentro de una transacción abierta)"""
+        excess = connection.execute("SELECT COUNT(*) FROM solar_quotes").fetchone()[0] - self.max_entries
+        if excess <= 0:
+            return 0
+        # Se desaloja primero lo que vence antes (usa el índice de valid_until)
+        return self._remove_where(
+            connection,
+            "quote_id IN (SELECT quote_id FROM solar_quotes ORDER BY valid_until LIMIT ?)",
+            (excess,)
+        )
+
+    def _sweep_expired(self) -> Tuple[int, int]:
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            expired = self._remove_where(connection, "valid_until <= ?", (time.time(),))
+            over_capacity = self._trim_capacity(connection) if self.max_entries else 0
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        return expired, over_capacity
+
+    def _stats(self) -> Dict[str, Any]:
+        connection = self._connection()
+        now = time.time()
+        total = connection.execute("SELECT COUNT(*) FROM solar_quotes").fetchone()[0]
+        expired = connection.execute(
+            "SELECT COUNT(*) FROM solar_quotes WHERE valid_until <= ?", (now,)
+        ).fetchone()[0]
+        archived = connection.execute("SELECT COUNT(*) FROM solar_quotes_archive").fetchone()[0]
+        return {
+            "backend": "sqlite",
+            "live": total - expired,
+            "expired": expired,
+            "archived": archived,
+            "evicted_by_this_worker": dict(self.evicted),
+            "max_entries": self.max_entries
+        }
+
+    async def save(self, quote: SolarQuoteResponse):
+        self.evicted["capacity"] += await asyncio.to_thread(self._save, quote)
+
+    async def get(self, quote_id: str) -> Optional[SolarQuoteResponse]:
+        return await asyncio.to_thread(self._get, quote_id)
+
+    async def delete(self, quote_id: str) -> bool:
+        return await asyncio.to_thread(self._delete, quote_id)
+
+    async def update_status(self, quote_id: str, status: str) -> bool:
+        return await asyncio.to_thread(self._update_status, quote_id, status)
+
+    async def list(self, limit: int = 10, offset: int = 0,
+                   client_email: Optional[str] = None,
+                   location: Optional[str] = None) -> Tuple[List[SolarQuoteResponse], int]:
+        return await asyncio.to_thread(self._list, limit, offset, client_email, location)
+
+    async def page(self, limit: int = 10, after: Optional[SortKey] = None,
+                   client_email: Optional[str] = None,
+                   location: Optional[str] = None,
+                   created_from: Optional[datetime] = None,
+                   created_to: Optional[datetime] = None) -> Tuple[List[SolarQuoteResponse], bool]:
+        return await asyncio.to_thread(
+            self._page, limit, after, client_email, location, created_from, created_to
+        )
+
+    async def count(self) -> int:
+        return await asyncio.to_thread(self._count)
+
+    async def sweep_expired(self) -> int:
+        expired, over_capacity = await asyncio.to_thread(self._sweep_expired)
+        self.evicted["expired"] += expired
+        self.evicted["capacity"] += over_capacity
+        return expired + over_capacity
+
+    async def stats(self) -> Dict[str, Any]:
+        return await asyncio.to_thread(self._stats)
+
+
+def create_quote_repository(backend: str, path: str, max_entries: int = 0,
+                            archive_expired: bool = False) -> QuoteRepository:
+    """Crear el repositorio configurado (QUOTE_STORE_BACKEND: sqlite | memory)"""
+    if backend == "memory":
+        logger.warning("⚠️ Cotizaciones en memoria: no se comparten entre workers ni sobreviven reinicios")
+        return MemoryQuoteRepository(max_entries=max_entries)
+    if backend == "sqlite":
+        return SQLiteQuoteRepository(path, max_entries=max_entries, archive_expired=archive_expired)
+    raise ValueError(f"Backend de cotizaciones no soportado: {backend}")
+
+
+async def _sweep_loop(repository: QuoteRepository, interval_seconds: float):
+    while True:
+        await asyncio.sleep(interval_seconds)
+        try:
+            removed = await repository.sweep_expired()
+            if removed:
+                logger.info(f"🧹 Cotizaciones vencidas desalojadas: {removed}")
+        except Exception as e:
+            logger.error(f"Error barriendo cotizaciones vencidas: {e}")
+
+
+_sweeper_task: Optional[asyncio.Task] = None
+
+
+def start_quote_sweeper(repository: Optional[QuoteRepository] = None):
+    """Iniciar el barrido periódico de cotizaciones vencidas (QUOTE_SWEEP_INTERVAL_SECONDS)"""
+    global _sweeper_task
+    if settings.QUOTE_SWEEP_INTERVAL_SECONDS <= 0:
+        return
+    if _sweeper_task is None or _sweeper_task.done():
+        _sweeper_task = asyncio.create_task(
+            _sweep_loop(repository or quote_repository, settings.QUOTE_SWEEP_INTERVAL_SECONDS)
+        )
+
+
+async def stop_quote_sweeper():
+    if _sweeper_task is not None and not _sweeper_task.done():
+        _sweeper_task.cancel()
+        try:
+            await _sweeper_task
+        except asyncio.CancelledError:
+            pass
+
+
+# Instancia global del repositorio de cotizaciones
+quote_repository = create_quote_repository(
+    settings.QUOTE_STORE_BACKEND,
+    settings.QUOTE_STORE_PATH,
+    max_entries=settings.QUOTE_STORE_MAX_ENTRIES,
+    archive_expired=settings.QUOTE_ARCHIVE_EXPIRED
+)
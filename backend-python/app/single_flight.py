@@ -0,0 +1,142 @@
+"""
+Coalescencia de lecturas (single-flight) con cache TTL corta
+Las lecturas idénticas concurrentes comparten una sola llamada al upstream y su
+resultado; durante la TTL se sirve el resultado sin volver a llamar
+"""
+
+import asyncio
+import functools
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, Optional, Tuple
+
+# Resultado que reciben los que esperaban si el líder de la lectura fue cancelado
+_LEADER_CANCELLED = object()
+
+
+class SingleFlightCache:
+    """
+    Lecturas agrupadas por clave: una llamada en vuelo por clave y cache TTL detrás.
+    Los resultados se comparten entre quienes esperan: no deben modificarse.
+    Solo se cachean resultados exitosos (distintos de None y sin excepción).
+    Los errores (Exception) se comparten; si el líder se cancela, otro de los que
+    esperaban repite la lectura.
+    ttl_by_name define una TTL propia para las claves de ciertos métodos.
+    """
+
+    def __init__(self, ttl_seconds: float, max_entries: int = 256,
+                 ttl_by_name: Optional[Dict[str, float]] = None):
+        self.ttl_seconds = ttl_seconds
+        self.ttl_by_name = ttl_by_name or {}
+        self.max_entries = max_entries
+        self._cache: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        # Se incrementa en cada invalidación: una lectura que empezó antes no se cachea
+        self._generation = 0
+        self.metrics = {"hits": 0, "coalesced": 0, "upstream_calls": 0, "invalidations": 0, "patches": 0}
+
+    def _ttl_for(self, key: Hashable) -> float:
+        if isinstance(key, tuple) and key and key[0] in self.ttl_by_name:
+            return self.ttl_by_name[key[0]]
+        return self.ttl_seconds
+
+    async def run(self, key: Hashable, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        while True:
+            cached = self._cache.get(key)
+            if cached is not None:
+                expires_at, value = cached
+                if time.monotonic() < expires_at:
+                    self.metrics["hits"] += 1
+                    return value
+                del self._cache[key]
+
+            inflight = self._inflight.get(key)
+            if inflight is None:
+                return await self._lead(key, fetch)
+            self.metrics["coalesced"] += 1
+            value = await asyncio.shield(inflight)
+            if value is not _LEADER_CANCELLED:
+                return value
+            # El líder fue cancelado: uno de los que esperaban pasa a ser el nuevo líder
+
+    async def _lead(self, key: Hashable, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        generation = self._generation
+        self.metrics["upstream_calls"] += 1
+        try:
+            value = await fetch()
+        except Exception as e:
+            future.set_exception(e)
+            # Evitar el aviso de excepción no recuperada si nadie más esperaba
+            future.exception()
+            raise
+        except BaseException:
+            # La cancelación es del líder, no de la lectura: no se propaga a los demás
+            future.set_result(_LEADER_CANCELLED)
+            raise
+        finally:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+
+        future.set_result(value)
+        ttl_seconds = self._ttl_for(key)
+        if value is not None and ttl_seconds > 0 and generation == self._generation:
+            self._cache[key] = (time.monotonic() + ttl_seconds, value)
+            if len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        return value
+
+    def invalidate(self, *names: str):
+        """Descartar las entradas cuyas claves empiezan con alguno de los nombres (todas si no se indica)"""
+        self._generation += 1
+        self.metrics["invalidations"] += 1
+        if not names:
+            self._cache.clear()
+            return
+        for key in [key for key in self._cache if isinstance(key, tuple) and key and key[0] in names]:
+            del self._cache[key]
+
+    def patch(self, names: Iterable[str], update: Callable[[Any], Any]):
+        """
+        Reemplazar en el lugar las entradas de los nombres indicados por update(valor),
+        sin cambiar su vencimiento. update debe devolver un valor nuevo (los cacheados
+        se comparten). Una lectura en vuelo que empezó antes no se cachea
+        """
+        names = tuple(names)
+        self._generation += 1
+        self.metrics["patches"] += 1
+        for key, (expires_at, value) in list(self._cache.items()):
+            if isinstance(key, tuple) and key and key[0] in names:
+                self._cache[key] = (expires_at, update(value))
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.metrics, "entries": len(self._cache), "inflight": len(self._inflight)}
+
+
+def coalesced_read(method: Callable[..., Awaitable[Any]]) -> Callable[..., Awaitable[Any]]:
+    """
+    Decorador para métodos de lectura de un servicio con atributo `read_cache`
+    (SingleFlightCache). La clave es (nombre del método, argumentos).
+    """
+    @functools.wraps(method)
+    async def wrapper(self, *args: Any, **kwargs: Any) -> Any:
+        key = (method.__name__, args, tuple(sorted(kwargs.items())))
+        return await self.read_cache.run(key, lambda: method(self, *args, **kwargs))
+
+    return wrapper
+
+
+def invalidates(*names: str) -> Callable[[Callable[..., Awaitable[Any]]], Callable[..., Awaitable[Any]]]:
+    """Decorador para métodos de escritura: al terminar invalida las lecturas indicadas"""
+    def decorator(method: Callable[..., Awaitable[Any]]) -> Callable[..., Awaitable[Any]]:
+        @functools.wraps(method)
+        async def wrapper(self, *args: Any, **kwargs: Any) -> Any:
+            try:
+                return await method(self, *args, **kwargs)
+            finally:
+                self.read_cache.invalidate(*names)
+
+        return wrapper
+
+    return decorator
@@ -2,7 +2,9 @@
 Calculadora de sistemas solares - Dimensionamiento y cálculos económicos
 """
 import math
-from typing import List, Dict, Any, Optional, Tuple
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Set, Tuple
 from datetime import datetime, timedelta
 import logging
 from .solar_models import (
@@ -11,6 +13,10 @@ from .solar_models import (
     SolarPanelType, InverterType, BatteryType
 )
 from .solar_materials_service import SolarMaterialsService
+from .stock_reservations import StockReservationStore
+from .price_history import material_sku
+from .config import settings
+from .audit_log import audit_log
 
 logger = logging.getLogger(__name__)
 
@@ -18,8 +24,26 @@ logger = logging.getLogger(__name__)
 class SolarCalculator:
     """Calculadora de sistemas solares"""
     
-    def __init__(self):
-        self.materials_service = SolarMaterialsService()
+    # Campos de la solicitud que no influyen en el diseño (datos del cliente)
+    DESIGN_CACHE_EXCLUDE = {"client_name", "client_email", "client_phone", "notes"}
+    
+    def __init__(self, materials_service: Optional[SolarMaterialsService] = None,
+                 reservations: Optional[StockReservationStore] = None):
+        self.materials_service = materials_service or SolarMaterialsService()
+        
+        # Reservas de stock vigentes (None = se usa solo el stock del catálogo)
+        self.reservations = reservations
+        
+        # Cache LRU de diseños con los SKUs cuyo stock consultó cada uno; se vacía cuando
+        # cambia el catálogo y se descartan los diseños afectados cuando cambian reservas
+        self._design_cache: "OrderedDict[str, Tuple[SolarSystemDesign, frozenset]]" = OrderedDict()
+        self._design_cache_version = self.materials_service.version
+        self._stock_generation = 0
+        # Los diseños se calculan en threads del ejecutor de cálculos
+        self._design_cache_lock = threading.Lock()
+        self._local = threading.local()
+        if reservations is not None:
+            reservations.add_listener(self._on_stock_change)
         
         # Parámetros de cálculo por ubicación
         self.location_params = {
@@ -74,7 +98,68 @@ class SolarCalculator:
             "industrial": 32.0
         }
     
+    def __getstate__(self) -> Dict[str, Any]:
+        """Copia para los procesos del ejecutor de cálculos (heavy=True), con la cache de diseños vacía"""
+        state = self.__dict__.copy()
+        state["_design_cache"] = OrderedDict()
+        del state["_design_cache_lock"]
+        del state["_local"]
+        return state
+    
+    def __setstate__(self, state: Dict[str, Any]):
+        self.__dict__.update(state)
+        self._design_cache_lock = threading.Lock()
+        self._local = threading.local()
+    
     def calculate_system_design(self, request: SolarQuoteRequest) -> SolarSystemDesign:
+        """Calcular el diseño completo del sistema solar (cacheado por versión del catálogo)"""
+        catalog_version = self.materials_service.version
+        cache_key = request.model_dump_json(exclude=self.DESIGN_CACHE_EXCLUDE)
+        with self._design_cache_lock:
+            if self._design_cache_version != catalog_version:
+                self._design_cache.clear()
+                self._design_cache_version = catalog_version
+            
+            entry = self._design_cache.get(cache_key)
+            if entry is not None:
+                self._design_cache.move_to_end(cache_key)
+                # Copia: quien recibe el diseño puede modificarlo
+                return entry[0].model_copy(deep=True)
+            stock_generation = self._stock_generation
+        
+        self._local.skus = set()
+        design = self._compute_system_design(request)
+        skus = frozenset(self._local.skus)
+        with self._design_cache_lock:
+            # Si cambiaron reservas durante el cálculo el diseño puede estar desactualizado
+            if self._design_cache_version == catalog_version and self._stock_generation == stock_generation:
+                self._design_cache[cache_key] = (design.model_copy(deep=True), skus)
+                if len(self._design_cache) > settings.DESIGN_CACHE_SIZE:
+                    self._design_cache.popitem(last=False)
+        return design
+    
+    def _on_stock_change(self, skus: Set[str]):
+        """Descartar solo los diseños que consultaron el stock de alguno de los SKUs"""
+        with self._design_cache_lock:
+            self._stock_generation += 1
+            stale = [key for key, (_, used) in self._design_cache.items() if not used.isdisjoint(skus)]
+            for key in stale:
+                del self._design_cache[key]
+    
+    def _has_stock(self, category: str, item: Dict[str, Any], quantity: int) -> bool:
+        """Hay stock suficiente del material (sin dato de stock se asume disponible)"""
+        stock = item.get("stock")
+        if stock is None:
+            return True
+        if self.reservations is not None:
+            sku = material_sku(category, item.get("id"))
+            skus = getattr(self._local, "skus", None)
+            if skus is not None:
+                skus.add(sku)
+            stock = self.reservations.available(sku, stock)
+        return stock >= quantity
+    
+    def _compute_system_design(self, request: SolarQuoteRequest) -> SolarSystemDesign:
         """Calcular el diseño completo del sistema solar"""
         try:
             logger.info(f"Iniciando cálculo para consumo: {request.monthly_consumption_kwh} kWh/mes")
@@ -141,10 +226,14 @@ class SolarCalculator:
             )
             
             logger.info(f"Cálculo completado. Potencia: {required_power} kWp, Inversión: ${cost_calculation['total_investment']:,.0f}")
+            audit_log.emit("calculo_sistema", "Sistema solar calculado", ubicacion=request.location,
+                           consumo_mensual_kwh=request.monthly_consumption_kwh, potencia=required_power)
             return design
             
         except Exception as e:
             logger.error(f"Error en cálculo del sistema: {e}")
+            audit_log.emit("error_calculo", "Error en cálculo de sistema solar", level="ERROR",
+                           error=str(e), ubicacion=request.location)
             raise
     
     def _calculate_required_power(self, request: SolarQuoteRequest) -> float:
@@ -184,11 +273,19 @@ class SolarCalculator:
         if not panels:
             raise ValueError("No hay paneles disponibles")
         
-        # Seleccionar el panel más eficiente (usar power_watts como criterio)
-        selected_panel = max(panels, key=lambda p: p.get("power_watts", 0))
+        # Seleccionar el panel más eficiente (usar power_watts como criterio) con stock suficiente;
+        # si ninguno alcanza se mantiene el más eficiente
+        def panels_needed(panel: Dict[str, Any]) -> int:
+            return math.ceil((required_power * 1000) / (panel.get("power_watts") or 400))
+        
+        panels_by_power = sorted(panels, key=lambda p: p.get("power_watts", 0), reverse=True)
+        selected_panel = next(
+            (p for p in panels_by_power if self._has_stock("panels", p, panels_needed(p))),
+            panels_by_power[0]
+        )
         
         # Calcular cantidad de paneles
-        panel_count = math.ceil((required_power * 1000) / selected_panel.get("power_watts", 400))
+        panel_count = panels_needed(selected_panel)
         components["panels"] = [selected_panel] * panel_count
         components["panel_count"] = panel_count
         
@@ -212,14 +309,23 @@ class SolarCalculator:
             if min_inverter_power <= inv.get("power_kw", 0) <= max_inverter_power
         ]
         
-        if suitable_inverters:
-            selected_inverter = min(suitable_inverters, key=lambda i: i.get("power_kw", 0))
-        else:
-            # Si no hay inversor en el rango, usar el más cercano
-            selected_inverter = min(inverters, key=lambda i: abs(i.get("power_kw", 0) - system_power_kw))
+        def inverters_needed(inverter: Dict[str, Any]) -> int:
+            return math.ceil(system_power_kw / (inverter.get("power_kw") or 5.0))
+        
+        # Preferir el inversor más chico del rango; si no hay en el rango, el más cercano.
+        # Entre los candidatos se toma el primero con stock suficiente
+        candidates = sorted(suitable_inverters, key=lambda i: i.get("power_kw", 0))
+        candidates += sorted(
+            (i for i in inverters if i not in suitable_inverters),
+            key=lambda i: abs(i.get("power_kw", 0) - system_power_kw)
+        )
+        selected_inverter = next(
+            (i for i in candidates if self._has_stock("inverters", i, inverters_needed(i))),
+            candidates[0]
+        )
         
         # Calcular cantidad de inversores
-        inverter_count = math.ceil(system_power_kw / selected_inverter.get("power_kw", 5.0))
+        inverter_count = inverters_needed(selected_inverter)
         components["inverters"] = [selected_inverter] * inverter_count
         components["inverter_count"] = inverter_count
         
@@ -240,12 +346,21 @@ class SolarCalculator:
                     if bat.get("power_kw", 0) >= required_capacity
                 ]
                 
-                if suitable_batteries:
-                    selected_battery = min(suitable_batteries, key=lambda b: b.get("power_kw", 0))
-                else:
-                    selected_battery = max(batteries, key=lambda b: b.get("power_kw", 0))
+                def batteries_needed(battery: Dict[str, Any]) -> int:
+                    return math.ceil(required_capacity / (battery.get("power_kw") or 10))
+                
+                candidates = sorted(suitable_batteries, key=lambda b: b.get("power_kw", 0))
+                candidates += sorted(
+                    (b for b in batteries if b not in suitable_batteries),
+                    key=lambda b: b.get("power_kw", 0),
+                    reverse=True
+                )
+                selected_battery = next(
+                    (b for b in candidates if self._has_stock("batteries", b, batteries_needed(b))),
+                    candidates[0]
+                )
                 
-                battery_count = math.ceil(required_capacity / selected_battery.get("power_kw", 10))
+                battery_count = batteries_needed(selected_battery)
                 components["batteries"] = [selected_battery] * battery_count
                 components["battery_count"] = battery_count
         
@@ -455,7 +570,7 @@ class SolarCalculator:
     def _map_panel_dict(self, panel_dict: Dict[str, Any]) -> SolarPanel:
         """Mapear diccionario de panel a objeto SolarPanel"""
         return SolarPanel(
-            id=panel_dict.get("id", "panel_default"),
+            id=str(panel_dict.get("id", "panel_default")),
             name=panel_dict.get("model", "Panel Solar"),
             brand=panel_dict.get("brand", "Marca"),
             model=panel_dict.get("model", "Modelo"),
@@ -474,7 +589,7 @@ class SolarCalculator:
     def _map_inverter_dict(self, inverter_dict: Dict[str, Any]) -> Inverter:
         """Mapear diccionario de inversor a objeto Inverter"""
         return Inverter(
-            id=inverter_dict.get("id", "inverter_default"),
+            id=str(inverter_dict.get("id", "inverter_default")),
             name=inverter_dict.get("model", "Inversor Solar"),
             brand=inverter_dict.get("brand", "Marca"),
             model=inverter_dict.get("model", "Modelo"),
@@ -504,7 +619,7 @@ class SolarCalculator:
             logger.warning(f"⚠️ Usando valores por defecto para: {missing_fields}")
         
         return Battery(
-            id=battery_dict.get("id", "battery_default"),
+            id=str(battery_dict.get("id", "battery_default")),
             name=battery_dict.get("model", "Batería Solar"),
             brand=battery_dict.get("brand", "Marca"),
             model=battery_dict.get("model", "Modelo"),
@@ -523,7 +638,7 @@ class SolarCalculator:
     def _map_mounting_dict(self, mounting_dict: Dict[str, Any]) -> MountingSystem:
         """Mapear diccionario de montaje a objeto MountingSystem"""
         return MountingSystem(
-            id=mounting_dict.get("id", "mounting_default"),
+            id=str(mounting_dict.get("id", "mounting_default")),
             name=mounting_dict.get("model", "Sistema de Montaje"),
             brand=mounting_dict.get("brand", "Marca"),
             model=mounting_dict.get("model", "Modelo"),
@@ -539,12 +654,14 @@ class SolarCalculator:
     def _map_cable_dict(self, cable_dict: Dict[str, Any]) -> Cable:
         """Mapear diccionario de cable a objeto Cable"""
         return Cable(
-            id=cable_dict.get("id", "cable_default"),
+            id=str(cable_dict.get("id", "cable_default")),
             name=cable_dict.get("model", "Cable Solar"),
             brand=cable_dict.get("brand", "Marca"),
             model=cable_dict.get("model", "Modelo"),
             type=cable_dict.get("type", "dc"),
             section_mm2=float(cable_dict.get("section_mm2", 4.0)),
+            voltage_rating=float(cable_dict.get("voltage_rating", 1000.0)),
+            current_rating=float(cable_dict.get("current_rating", 30.0)),
             length_meters=float(cable_dict.get("length_meters", 100.0)),
             price_per_meter=float(cable_dict.get("price_per_meter", 250.0)),
             price_ars=float(cable_dict.get("price_ars", 25000))
@@ -553,7 +670,7 @@ class SolarCalculator:
     def _map_protection_dict(self, protection_dict: Dict[str, Any]) -> ProtectionDevice:
         """Mapear diccionario de protección a objeto ProtectionDevice"""
         return ProtectionDevice(
-            id=protection_dict.get("id", "protection_default"),
+            id=str(protection_dict.get("id", "protection_default")),
             name=protection_dict.get("model", "Dispositivo de Protección"),
             brand=protection_dict.get("brand", "Marca"),
             model=protection_dict.get("model", "Modelo"),
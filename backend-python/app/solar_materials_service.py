@@ -2,21 +2,140 @@
 Servicio para gestión de materiales solares desde NocoDB
 """
 import os
+import copy
 import json
+import time
+import asyncio
 import logging
+from collections import Counter
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Any
+from typing import Dict, Iterable, List, Optional, Any, Tuple
 from enum import Enum
 
-import aiohttp
 from app.config import settings
+from app.nocodb_query import NocodbQuery
+from app.nocodb_service import MATERIAL_CATALOG_FIELDS, nocodb_service
+from app.price_history import PriceHistoryStore, material_sku, price_history
 
 logger = logging.getLogger(__name__)
 
+# Especificación del resumen por categoría:
+# categoría -> (clave en el resumen, tipo por defecto, campo de rango, clave del rango)
+SUMMARY_SPEC = {
+    "panels": ("panels", "monocristalino", "power_watts", "power_range"),
+    "inverters": ("inverters", "string", "power_kw", "power_range"),
+    "batteries": ("batteries", "litio", "power_kw", "capacity_range"),
+    "mounting": ("mounting_systems", "techo", None, None),
+    "cables": ("cables", None, "section_mm2", "section_range"),
+    "protection": ("protection_devices", "sobretencion", None, None),
+}
+
+# Campo de precio en el catálogo y columna equivalente en NocoDB por categoría
+PRICE_FIELDS = {
+    "panels": ("price_ars", "precio_ars"),
+    "inverters": ("price_ars", "precio_ars"),
+    "batteries": ("price_ars", "precio_ars"),
+    "mounting": ("price_per_kw", "precio_por_kw"),
+    "cables": ("price_ars", "precio_ars"),
+    "protection": ("price_ars", "precio_ars"),
+}
+
+def map_nocodb_material(material: Dict[str, Any]) -> Optional[Tuple[str, Dict[str, Any]]]:
+    """Mapear un registro de NocoDB a (categoría, registro del catálogo)"""
+    material_type = (material.get("tipo_material") or "").lower()
+    material_id = material.get(settings.NOCODB_ID_FIELD)
+    
+    if material_type == "panel":
+        return "panels", {
+            "id": material_id,
+            "brand": material.get("marca", ""),
+            "model": material.get("modelo", ""),
+            "power_watts": material.get("potencia_watts", 0),
+            "price_ars": material.get("precio_ars", 0),
+            "active": material.get("activo", True),
+            "stock": material.get("stock_disponible"),
+            "specifications": material.get("especificaciones_tecnicas", ""),
+            "warranty_years": material.get("garantia_anos", 0),
+            "supplier": material.get("proveedor", ""),
+            "type": "monocristalino"  # Default type
+        }
+    elif material_type == "inversor":
+        return "inverters", {
+            "id": material_id,
+            "brand": material.get("marca", ""),
+            "model": material.get("modelo", ""),
+            "power_kw": material.get("potencia_kw", 0),
+            "price_ars": material.get("precio_ars", 0),
+            "active": material.get("activo", True),
+            "stock": material.get("stock_disponible"),
+            "specifications": material.get("especificaciones_tecnicas", ""),
+            "warranty_years": material.get("garantia_anos", 0),
+            "supplier": material.get("proveedor", ""),
+            "type": "string"  # Default type
+        }
+    elif material_type == "bateria":
+        return "batteries", {
+            "id": material_id,
+            "brand": material.get("marca", ""),
+            "model": material.get("modelo", ""),
+            "power_kw": material.get("potencia_kw", 0),
+            "price_ars": material.get("precio_ars", 0),
+            "active": material.get("activo", True),
+            "stock": material.get("stock_disponible"),
+            "specifications": material.get("especificaciones_tecnicas", ""),
+            "warranty_years": material.get("garantia_anos", 0),
+            "supplier": material.get("proveedor", ""),
+            "type": material.get("type", "litio"),
+            # Campos requeridos agregados
+            "capacity_ah": material.get("capacity_ah", 200.0),
+            "voltage": material.get("voltage", 48.0),
+            "cycles": material.get("cycles", 6000),
+            "efficiency": material.get("efficiency", 95.0),
+            "dimensions": material.get("dimensions", {"width": 500, "height": 300, "depth": 200}),
+            "weight": material.get("weight", 50.0)
+        }
+    elif material_type == "montaje":
+        return "mounting", {
+            "id": material_id,
+            "brand": material.get("marca", ""),
+            "model": material.get("modelo", ""),
+            "price_per_kw": material.get("precio_por_kw", 0),
+            "active": material.get("activo", True),
+            "stock": material.get("stock_disponible"),
+            "specifications": material.get("especificaciones_tecnicas", ""),
+            "supplier": material.get("proveedor", ""),
+            "type": "techo"  # Default type
+        }
+    elif material_type == "cable":
+        return "cables", {
+            "id": material_id,
+            "brand": material.get("marca", ""),
+            "model": material.get("modelo", ""),
+            "price_ars": material.get("precio_ars", 0),
+            "active": material.get("activo", True),
+            "stock": material.get("stock_disponible"),
+            "specifications": material.get("especificaciones_tecnicas", ""),
+            "supplier": material.get("proveedor", ""),
+            "type": "dc"  # Default type
+        }
+    elif material_type == "proteccion":
+        return "protection", {
+            "id": material_id,
+            "brand": material.get("marca", ""),
+            "model": material.get("modelo", ""),
+            "price_ars": material.get("precio_ars", 0),
+            "active": material.get("activo", True),
+            "stock": material.get("stock_disponible"),
+            "specifications": material.get("especificaciones_tecnicas", ""),
+            "supplier": material.get("proveedor", ""),
+            "type": "sobretencion"  # Default type
+        }
+    return None
+
 class SolarMaterialsService:
     """Servicio para gestión de materiales solares desde NocoDB"""
     
-    def __init__(self):
+    def __init__(self, history: Optional[PriceHistoryStore] = price_history):
         # Usar variables correctas de NocoDB
         self.nocodb_url = getattr(settings, 'NC_DB_URL', settings.NOCODB_URL)
         self.nocodb_token = getattr(settings, 'NC_TOKEN', settings.NOCODB_TOKEN)
@@ -33,8 +152,33 @@ class SolarMaterialsService:
         self.cache_expiry = None
         self.cache_duration = timedelta(hours=1)
         
-        # Inicializar materiales por defecto
-        self.materials = self.get_default_materials()
+        # Versión del catálogo: se incrementa en cada cambio
+        self.version = 0
+        
+        # Estadísticas del resumen mantenidas incrementalmente
+        self._summary_stats: Dict[str, Dict[str, Any]] = {}
+        self._summary_cache: Optional[Dict[str, Any]] = None
+        
+        # Serializa las actualizaciones de precios para aplicarlas atómicamente
+        self._update_lock = asyncio.Lock()
+        
+        # Historial de precios observados (sincronizaciones y actualizaciones)
+        self.price_history = history
+        
+        # Inicializar materiales por defecto (no se registran en el historial)
+        self.materials: Dict[str, List[Dict]] = {}
+        self.set_materials(self.get_default_materials(), record_history=False)
+    
+    def __getstate__(self) -> Dict[str, Any]:
+        """Copia para los procesos del ejecutor de cálculos: solo el catálogo (sin historial ni lock)"""
+        state = self.__dict__.copy()
+        state["price_history"] = None
+        del state["_update_lock"]
+        return state
+    
+    def __setstate__(self, state: Dict[str, Any]):
+        self.__dict__.update(state)
+        self._update_lock = asyncio.Lock()
     
     def get_default_materials(self) -> Dict[str, List[Dict]]:
         """Obtener materiales por defecto como fallback"""
@@ -132,136 +276,218 @@ class SolarMaterialsService:
         """Obtener materiales (síncrono para compatibilidad)"""
         return self.materials
     
-    async def refresh_materials(self):
+    def set_materials(self, materials: Dict[str, List[Dict]], record_history: bool = True):
+        """Reemplazar el catálogo completo y recalcular el resumen"""
+        self.materials = materials
+        self._summary_stats = {category: self._empty_stats() for category in SUMMARY_SPEC}
+        for category, items in materials.items():
+            for item in items:
+                self._account_item(category, item, 1)
+        self._bump_version()
+        if record_history:
+            self._record_prices((category, item) for category, items in materials.items() for item in items)
+    
+    def upsert_material(self, category: str, item: Dict[str, Any]):
+        """Agregar o reemplazar un material ajustando el resumen sin recorrer el catálogo"""
+        items = self.materials.setdefault(category, [])
+        for index, current in enumerate(items):
+            if current.get("id") == item.get("id"):
+                self._account_item(category, current, -1)
+                items[index] = item
+                break
+        else:
+            items.append(item)
+        self._account_item(category, item, 1)
+        self._bump_version()
+        self._record_prices([(category, item)])
+    
+    def upsert_materials(self, entries: List[Tuple[str, Dict[str, Any]]]):
+        """Agregar o reemplazar varios materiales con un único cambio de versión"""
+        positions: Dict[str, Dict[Any, int]] = {}
+        for category, item in entries:
+            items = self.materials.setdefault(category, [])
+            if category not in positions:
+                positions[category] = {current.get("id"): i for i, current in enumerate(items)}
+            index = positions[category].get(item.get("id"))
+            if index is None:
+                positions[category][item.get("id")] = len(items)
+                items.append(item)
+            else:
+                self._account_item(category, items[index], -1)
+                items[index] = item
+            self._account_item(category, item, 1)
+        if entries:
+            self._bump_version()
+            self._record_prices(entries)
+    
+    def remove_material(self, category: str, material_id: Any) -> bool:
+        """Eliminar un material ajustando el resumen sin recorrer el catálogo"""
+        items = self.materials.get(category, [])
+        for index, current in enumerate(items):
+            if current.get("id") == material_id:
+                self._account_item(category, current, -1)
+                del items[index]
+                self._bump_version()
+                return True
+        return False
+    
+    async def update_material_prices(self, updates: List[Any], write_through: bool = True) -> List[Dict[str, Any]]:
+        """
+        Aplicar un lote de actualizaciones de precio de forma atómica.
+        Se valida todo el lote, se escribe en NocoDB en llamadas masivas y recién
+        entonces se reemplazan los materiales en memoria con un único cambio de versión.
+        """
+        async with self._update_lock:
+            changes = []
+            for update in updates:
+                category = update.material_type
+                if category not in PRICE_FIELDS:
+                    raise ValueError(f"Tipo de material no válido: {category}")
+                
+                items = self.materials.get(category, [])
+                index = next(
+                    (i for i, m in enumerate(items) if str(m.get("id")) == str(update.material_id)),
+                    None
+                )
+                if index is None:
+                    raise ValueError(f"Material no encontrado: {category}:{update.material_id}")
+                
+                price_field, _ = PRICE_FIELDS[category]
+                changes.append((category, {**items[index], price_field: update.new_price, "price_source": update.price_source}))
+            
+            if write_through:
+                # Solo los registros que provienen de NocoDB (id numérico) se escriben
+                records = [
+                    {settings.NOCODB_ID_FIELD: item["id"], PRICE_FIELDS[category][1]: item[PRICE_FIELDS[category][0]]}
+                    for category, item in changes
+                    if str(item.get("id", "")).isdigit()
+                ]
+                if records and not await nocodb_service.update_material_prices(records):
+                    raise ConnectionError("NocoDB rechazó la actualización masiva de precios")
+            
+            # El catálogo pudo refrescarse durante la escritura: se ubica cada material nuevamente por id
+            for category, new_item in changes:
+                items = self.materials.get(category, [])
+                for index, old_item in enumerate(items):
+                    if old_item.get("id") == new_item["id"]:
+                        self._account_item(category, old_item, -1)
+                        items[index] = {**old_item, **{k: new_item[k] for k in (PRICE_FIELDS[category][0], "price_source")}}
+                        self._account_item(category, items[index], 1)
+                        break
+            self._bump_version()
+            self._record_prices(
+                (category, item, update.updated_at.timestamp())
+                for (category, item), update in zip(changes, updates)
+            )
+            
+            logger.info(f"Precios actualizados: {len(changes)} materiales (versión de catálogo {self.version})")
+            return [
+                {"material_type": category, "material_id": item["id"], "new_price": item[PRICE_FIELDS[category][0]]}
+                for category, item in changes
+            ]
+    
+    def _record_prices(self, entries: Iterable[Tuple]):
+        """Registrar en el historial los precios de (categoría, material[, timestamp])"""
+        if self.price_history is None:
+            return
+        now = time.time()
+        observations = []
+        for entry in entries:
+            category, item = entry[0], entry[1]
+            price_field = PRICE_FIELDS.get(category, ("price_ars",))[0]
+            price = item.get(price_field)
+            if price is None or item.get("id") is None:
+                continue
+            timestamp = entry[2] if len(entry) > 2 else now
+            observations.append((material_sku(category, item["id"]), price, timestamp))
+        if observations:
+            # El archivo se escribe en el thread del historial: no bloquea el event loop
+            self.price_history.submit(observations)
+    
+    def _bump_version(self):
+        """Marcar el catálogo como modificado"""
+        self.version += 1
+        self._summary_cache = None
+    
+    @staticmethod
+    def _empty_stats() -> Dict[str, Any]:
+        return {"total": 0, "active": 0, "types": Counter(), "range": Counter()}
+    
+    def _account_item(self, category: str, item: Dict[str, Any], delta: int):
+        """Sumar (delta=1) o restar (delta=-1) un material de las estadísticas"""
+        spec = SUMMARY_SPEC.get(category)
+        if spec is None:
+            return
+        _, default_type, range_field, _ = spec
+        stats = self._summary_stats.setdefault(category, self._empty_stats())
+        stats["total"] += delta
+        if item.get("active", True):
+            stats["active"] += delta
+        if default_type is not None:
+            self._count(stats["types"], item.get("type", default_type), delta)
+        if range_field is not None:
+            self._count(stats["range"], item.get(range_field, 0), delta)
+    
+    @staticmethod
+    def _count(counter: Counter, key: Any, delta: int):
+        """Ajustar un conteo; la clave se elimina al llegar a cero (O(1))"""
+        count = counter[key] + delta
+        if count > 0:
+            counter[key] = count
+        else:
+            del counter[key]
+    
+    async def refresh_materials(self) -> bool:
         """Actualizar materiales desde NocoDB"""
         try:
-            new_materials = await self.load_materials_from_nocodb()
-            self.materials = new_materials
+            new_materials = await self.fetch_materials_from_nocodb()
+            if new_materials is None:
+                # Mantener el catálogo actual si NocoDB no responde
+                logger.warning("No se pudo refrescar el catálogo, se mantienen los materiales actuales")
+                return False
+            self.set_materials(new_materials)
             logger.info("Materiales actualizados desde NocoDB")
+            return True
         except Exception as e:
             logger.error(f"Error actualizando materiales: {e}")
-            # Mantener materiales por defecto en caso de error
+            return False
     
     async def load_materials_from_nocodb(self) -> Dict[str, List[Dict]]:
-        """Cargar materiales desde NocoDB"""
+        """Cargar materiales desde NocoDB (materiales por defecto si falla)"""
+        materials = await self.fetch_materials_from_nocodb()
+        return materials if materials is not None else self.get_default_materials()
+    
+    async def fetch_materials_from_nocodb(self) -> Optional[Dict[str, List[Dict]]]:
+        """Cargar materiales desde NocoDB recorriendo todas las páginas; None si la carga falla"""
         try:
             logger.info("Cargando materiales desde NocoDB...")
             
-            async with aiohttp.ClientSession() as session:
-                async with session.get(
-                    self.materials_url,
-                    headers=self.headers,
-                    timeout=aiohttp.ClientTimeout(total=30)
-                ) as response:
-                    
-                    if response.status == 200:
-                        result = await response.json()
-                        materials_data = result.get("list", [])
-                        
-                        # Organizar materiales por tipo
-                        organized_materials = {
-                            "panels": [],
-                            "inverters": [],
-                            "batteries": [],
-                            "mounting": [],
-                            "cables": [],
-                            "protection": []
-                        }
-                        
-                        for material in materials_data:
-                            material_type = material.get("tipo_material", "").lower()
-                            
-                            if material_type == "panel":
-                                organized_materials["panels"].append({
-                                    "id": material.get("id"),
-                                    "brand": material.get("marca", ""),
-                                    "model": material.get("modelo", ""),
-                                    "power_watts": material.get("potencia_watts", 0),
-                                    "price_ars": material.get("precio_ars", 0),
-                                    "active": material.get("activo", True),
-                                    "specifications": material.get("especificaciones_tecnicas", ""),
-                                    "warranty_years": material.get("garantia_anos", 0),
-                                    "supplier": material.get("proveedor", ""),
-                                    "type": "monocristalino"  # Default type
-                                })
-                            elif material_type == "inversor":
-                                organized_materials["inverters"].append({
-                                    "id": material.get("id"),
-                                    "brand": material.get("marca", ""),
-                                    "model": material.get("modelo", ""),
-                                    "power_kw": material.get("potencia_kw", 0),
-                                    "price_ars": material.get("precio_ars", 0),
-                                    "active": material.get("activo", True),
-                                    "specifications": material.get("especificaciones_tecnicas", ""),
-                                    "warranty_years": material.get("garantia_anos", 0),
-                                    "supplier": material.get("proveedor", ""),
-                                    "type": "string"  # Default type
-                                })
-                            elif material_type == "bateria":
-                                organized_materials["batteries"].append({
-                                    "id": material.get("id"),
-                                    "brand": material.get("marca", ""),
-                                    "model": material.get("modelo", ""),
-                                    "power_kw": material.get("potencia_kw", 0),
-                                    "price_ars": material.get("precio_ars", 0),
-                                    "active": material.get("activo", True),
-                                    "specifications": material.get("especificaciones_tecnicas", ""),
-                                    "warranty_years": material.get("garantia_anos", 0),
-                                    "supplier": material.get("proveedor", ""),
-                                    "type": material.get("type", "litio"),
-                                    # Campos requeridos agregados
-                                    "capacity_ah": material.get("capacity_ah", 200.0),
-                                    "voltage": material.get("voltage", 48.0),
-                                    "cycles": material.get("cycles", 6000),
-                                    "efficiency": material.get("efficiency", 95.0),
-                                    "dimensions": material.get("dimensions", {"width": 500, "height": 300, "depth": 200}),
-                                    "weight": material.get("weight", 50.0)
-                                })
-                            elif material_type == "montaje":
-                                organized_materials["mounting"].append({
-                                    "id": material.get("id"),
-                                    "brand": material.get("marca", ""),
-                                    "model": material.get("modelo", ""),
-                                    "price_per_kw": material.get("precio_por_kw", 0),
-                                    "active": material.get("activo", True),
-                                    "specifications": material.get("especificaciones_tecnicas", ""),
-                                    "supplier": material.get("proveedor", ""),
-                                    "type": "techo"  # Default type
-                                })
-                            elif material_type == "cable":
-                                organized_materials["cables"].append({
-                                    "id": material.get("id"),
-                                    "brand": material.get("marca", ""),
-                                    "model": material.get("modelo", ""),
-                                    "price_ars": material.get("precio_ars", 0),
-                                    "active": material.get("activo", True),
-                                    "specifications": material.get("especificaciones_tecnicas", ""),
-                                    "supplier": material.get("proveedor", ""),
-                                    "type": "dc"  # Default type
-                                })
-                            elif material_type == "proteccion":
-                                organized_materials["protection"].append({
-                                    "id": material.get("id"),
-                                    "brand": material.get("marca", ""),
-                                    "model": material.get("modelo", ""),
-                                    "price_ars": material.get("precio_ars", 0),
-                                    "active": material.get("activo", True),
-                                    "specifications": material.get("especificaciones_tecnicas", ""),
-                                    "supplier": material.get("proveedor", ""),
-                                    "type": "sobretencion"  # Default type
-                                })
-                        
-                        logger.info(f"Materiales cargados desde NocoDB: {len(materials_data)} registros")
-                        return organized_materials
-                        
-                    else:
-                        error_text = await response.text()
-                        logger.error(f"Error cargando materiales desde NocoDB: {response.status} - {error_text}")
-                        return self.get_default_materials()
-                        
+            # Organizar materiales por tipo
+            organized_materials = {
+                "panels": [],
+                "inverters": [],
+                "batteries": [],
+                "mounting": [],
+                "cables": [],
+                "protection": []
+            }
+            
+            # Con el circuito abierto falla al instante y se conserva el catálogo en memoria
+            count = 0
+            query = NocodbQuery().select(*MATERIAL_CATALOG_FIELDS)
+            async for material in nocodb_service.iter_records(self.materials_url, query):
+                count += 1
+                mapped = map_nocodb_material(material)
+                if mapped:
+                    category, record = mapped
+                    organized_materials[category].append(record)
+            
+            logger.info(f"Materiales cargados desde NocoDB: {count} registros")
+            return organized_materials
+            
         except Exception as e:
             logger.error(f"Error cargando materiales desde NocoDB: {e}")
-            return self.get_default_materials()
+            return None
     
     # Métodos de compatibilidad para el calculador solar
     def get_panels(self, panel_type: Optional[str] = None, 
@@ -349,61 +575,30 @@ class SolarMaterialsService:
         return protection
     
     def get_materials_summary(self) -> Dict[str, Any]:
-        """Obtener resumen de todos los materiales"""
-        panels = self.materials.get("panels", [])
-        inverters = self.materials.get("inverters", [])
-        batteries = self.materials.get("batteries", [])
-        mounting = self.materials.get("mounting", [])
-        cables = self.materials.get("cables", [])
-        protection = self.materials.get("protection", [])
-        
-        return {
-            "panels": {
-                "total": len(panels),
-                "active": len([p for p in panels if p.get("active", True)]),
-                "types": list(set(p.get("type", "monocristalino") for p in panels)),
-                "power_range": {
-                    "min": min(p.get("power_watts", 0) for p in panels) if panels else 0,
-                    "max": max(p.get("power_watts", 0) for p in panels) if panels else 0
+        """Obtener resumen de todos los materiales (se arma solo si el catálogo cambió; devuelve una copia)"""
+        if self._summary_cache is None:
+            summary = {}
+            for category, (key, default_type, range_field, range_key) in SUMMARY_SPEC.items():
+                stats = self._summary_stats.get(category) or self._empty_stats()
+                entry: Dict[str, Any] = {
+                    "total": stats["total"],
+                    "active": stats["active"]
                 }
-            },
-            "inverters": {
-                "total": len(inverters),
-                "active": len([i for i in inverters if i.get("active", True)]),
-                "types": list(set(i.get("type", "string") for i in inverters)),
-                "power_range": {
-                    "min": min(i.get("power_kw", 0) for i in inverters) if inverters else 0,
-                    "max": max(i.get("power_kw", 0) for i in inverters) if inverters else 0
-                }
-            },
-            "batteries": {
-                "total": len(batteries),
-                "active": len([b for b in batteries if b.get("active", True)]),
-                "types": list(set(b.get("type", "litio") for b in batteries)),
-                "capacity_range": {
-                    "min": min(b.get("power_kw", 0) for b in batteries) if batteries else 0,
-                    "max": max(b.get("power_kw", 0) for b in batteries) if batteries else 0
-                }
-            },
-            "mounting_systems": {
-                "total": len(mounting),
-                "active": len([m for m in mounting if m.get("active", True)]),
-                "types": list(set(m.get("type", "techo") for m in mounting))
-            },
-            "cables": {
-                "total": len(cables),
-                "active": len([c for c in cables if c.get("active", True)]),
-                "section_range": {
-                    "min": min(c.get("section_mm2", 0) for c in cables) if cables else 0,
-                    "max": max(c.get("section_mm2", 0) for c in cables) if cables else 0
-                }
-            },
-            "protection_devices": {
-                "total": len(protection),
-                "active": len([p for p in protection if p.get("active", True)]),
-                "types": list(set(p.get("type", "sobretencion") for p in protection))
-            }
-        }
+                if default_type is not None:
+                    entry["types"] = list(stats["types"])
+                if range_field is not None:
+                    values = stats["range"]
+                    entry[range_key] = {
+                        "min": min(values) if values else 0,
+                        "max": max(values) if values else 0
+                    }
+                summary[key] = entry
+            self._summary_cache = summary
+        return copy.deepcopy(self._summary_cache)
+    
+    def get_active_materials_count(self) -> int:
+        """Cantidad total de materiales activos"""
+        return sum(stats["active"] for stats in self._summary_stats.values())
 
 # Instancia global del servicio
 solar_materials_service = SolarMaterialsService()
@@ -249,6 +249,17 @@ class MaterialPriceUpdate(BaseModel):
     updated_at: datetime = Field(default_factory=datetime.now)
 
 
+class MaterialPriceBatchUpdate(BaseModel):
+    """Lote de actualizaciones de precios aplicado de forma atómica"""
+    updates: List[MaterialPriceUpdate] = Field(..., min_length=1, description="Actualizaciones a aplicar")
+    write_through: bool = Field(True, description="Escribir los cambios en NocoDB")
+
+
+class SolarBatchCalculationRequest(BaseModel):
+    """Lote de solicitudes para calcular diseños en una sola llamada"""
+    requests: List[SolarQuoteRequest] = Field(..., min_length=1, description="Solicitudes a calcular")
+
+
 class SolarCalculationParams(BaseModel):
     """Parámetros para cálculos solares"""
     location: str = Field(..., description="Ubicación")
@@ -1,9 +1,12 @@
 """
 Rutas de la API para el sistema de cotización solar
 """
-from fastapi import APIRouter, HTTPException, Depends, BackgroundTasks, Request
+from fastapi import APIRouter, HTTPException, Depends, Query, Request, UploadFile, File
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from typing import List, Optional, Dict, Any
 from datetime import datetime, timedelta
+import asyncio
+import io
 import logging
 import uuid
 
@@ -11,11 +14,30 @@ from .solar_models import (
     SolarQuoteRequest, SolarQuoteResponse, SolarSystemDesign,
     SolarPanel, Inverter, Battery, MountingSystem, Cable, ProtectionDevice,
     SolarPanelType, InverterType, BatteryType, InstallationType,
-    MaterialPriceUpdate
+    MaterialPriceUpdate, MaterialPriceBatchUpdate, SolarBatchCalculationRequest
 )
 from .solar_calculator import SolarCalculator
 from .solar_materials_service import SolarMaterialsService
+from .nocodb_query import NocodbQuery
 from .nocodb_service import nocodb_service
+from .http_client import http_clients
+from .health_service import health_service
+from .materials_import import MaterialsImporter
+from .materials_search import materials_search_index
+from .price_history import material_sku, price_history
+from .stock_reservations import InsufficientStockError, stock_reservations
+from .quote_store import decode_cursor, encode_cursor, quote_repository
+from .compute_executor import compute_executor
+from .job_runner import job_runner
+from .audit_log import audit_log
+from .csv_export import (
+    CONTACT_COLUMNS, LOG_COLUMNS, QUOTE_COLUMNS, QUOTE_NOCODB_FIELDS, iter_store_quotes, nocodb_quote_to_row,
+    prefetch, quote_to_row, stream_csv
+)
+from .batch_quoting import NDJSONStreamingResponse, calculate_batch, stream_designs
+from .fast_json import dumps as fast_dumps, fast_response
+from .idempotency import IdempotencyConflictError, IdempotencyKeyReusedError, fingerprint, idempotency_store
+from .config import settings
 
 logger = logging.getLogger(__name__)
 
@@ -23,20 +45,120 @@ logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/api/solar", tags=["solar"])
 
 @router.get("/health")
+@router.get("/health/live")
 async def health_check():
-    """Endpoint de salud para verificar conectividad"""
+    """Liveness: chequeo superficial sin dependencias, apto para balanceadores"""
     return {
-        "status": "ok",
-        "message": "Solar API is running",
-        "timestamp": datetime.now().isoformat()
+        **health_service.liveness(),
+        "message": "Solar API is running"
     }
 
 # Instancias de servicios
 materials_service = SolarMaterialsService()
-solar_calculator = SolarCalculator()
+solar_calculator = SolarCalculator(materials_service, stock_reservations)
+materials_importer = MaterialsImporter(nocodb_service, materials_service)
+
+# Tarea de refresco periódico del catálogo
+materials_refresh_task: Optional[asyncio.Task] = None
+
+# Payload serializado de /materials y la lectura de NocoDB que lo produjo
+# (la cache de lecturas devuelve el mismo objeto hasta que vence o se invalida)
+materials_payload_cache: Dict[str, Any] = {"source": None, "content": None, "body": None}
+
+
+async def _check_materials() -> Dict[str, Any]:
+    """Readiness: el catálogo tiene materiales activos"""
+    active_materials = materials_service.get_active_materials_count()
+    if active_materials <= 0:
+        raise RuntimeError("No hay materiales activos en el catálogo")
+    return {"active_materials": active_materials, "catalog_version": materials_service.version}
+
+
+async def _check_calculator() -> Dict[str, Any]:
+    """Readiness: la calculadora tiene parámetros de ubicación cargados"""
+    if not solar_calculator.location_params:
+        raise RuntimeError("Calculadora sin parámetros de ubicación")
+    return {"locations": len(solar_calculator.location_params)}
+
+
+async def _check_nocodb() -> Dict[str, Any]:
+    """Readiness: NocoDB responde (no crítico, hay fallbacks locales)"""
+    if not await nocodb_service.check_connection():
+        raise RuntimeError("NocoDB no respondió correctamente")
+    return {
+        "read_cache": nocodb_service.read_cache.get_stats(),
+        "write_behind": nocodb_service.writer.get_stats(),
+        "outbox": await nocodb_service.outbox.get_stats(),
+        "breakers": nocodb_service.breakers.get_stats(),
+        "audit_log": audit_log.get_stats(),
+        "http_clients": http_clients.get_stats()
+    }
+
+
+health_service.register_check("materials_service", _check_materials)
+health_service.register_check("solar_calculator", _check_calculator)
+health_service.register_check("nocodb", _check_nocodb, critical=False)
+
+
+async def _check_compute() -> Dict[str, Any]:
+    """Readiness: ocupación del ejecutor de cálculos (informativo)"""
+    metrics = compute_executor.get_metrics()
+    return {"in_flight": metrics["in_flight"], "max_pending": metrics["max_pending"]}
+
+
+health_service.register_check("compute", _check_compute, critical=False)
+
+
+async def _check_jobs() -> Dict[str, Any]:
+    """Readiness: colas de trabajos en marcha y su profundidad (informativo)"""
+    if not job_runner.running:
+        raise RuntimeError("Colas de trabajos detenidas")
+    return {
+        name: {"queued": queue["queued"], "running": queue["running"], "failed": queue["failed"]}
+        for name, queue in job_runner.get_stats()["queues"].items()
+    }
+
 
-# Almacenamiento temporal de cotizaciones (en producción usar base de datos)
-quotes_storage: Dict[str, SolarQuoteResponse] = {}
+health_service.register_check("jobs", _check_jobs, critical=False)
+
+
+@router.get("/compute/metrics")
+async def get_compute_metrics() -> Dict[str, Any]:
+    """Métricas de la cola de cálculos (en vuelo, rechazados, espera y ejecución promedio)"""
+    return compute_executor.get_metrics()
+
+
+@router.get("/jobs/metrics")
+async def get_job_metrics() -> Dict[str, Any]:
+    """Métricas de las colas de trabajos (en cola, en curso, reintentos, fallos, espera y duración)"""
+    return job_runner.get_stats()
+
+
+@router.get("/nocodb/outbox")
+async def get_nocodb_outbox_stats() -> Dict[str, Any]:
+    """Estado del outbox de NocoDB: profundidad, antigüedad del pendiente más viejo y reintentos"""
+    return await nocodb_service.outbox.get_stats()
+
+
+@router.get("/nocodb/breakers")
+async def get_nocodb_breakers() -> Dict[str, Any]:
+    """Circuit breakers de NocoDB por endpoint: estado, fallos, rechazos, timeout y latencias"""
+    return nocodb_service.breakers.get_stats()
+
+
+@router.get("/audit/stats")
+async def get_audit_log_stats() -> Dict[str, Any]:
+    """Registro de auditoría: eventos emitidos, muestreados, en buffer, enviados y en el respaldo local"""
+    return audit_log.get_stats()
+
+
+@router.get("/health/ready")
+async def readiness_check(force: bool = False):
+    """Readiness: chequeo profundo cacheado según HEALTH_READY_STALENESS_SECONDS"""
+    result = await health_service.readiness(force=force)
+    result["quotes_count"] = await quote_repository.count()
+    status_code = 200 if result["status"] == "ready" else 503
+    return JSONResponse(status_code=status_code, content=result)
 
 
 @router.get("/materials/panels")
@@ -145,6 +267,74 @@ async def get_protection_devices(
         raise HTTPException(status_code=500, detail="Error interno del servidor")
 
 
+async def refresh_materials_catalog() -> bool:
+    """Refrescar el catálogo desde NocoDB y sincronizar el índice de búsqueda"""
+    refreshed = await materials_service.refresh_materials()
+    materials_search_index.sync(materials_service)
+    return refreshed
+
+
+async def _materials_refresh_loop():
+    """Refresca el catálogo al iniciar y luego cada MATERIALS_REFRESH_INTERVAL_SECONDS"""
+    while True:
+        await refresh_materials_catalog()
+        if settings.MATERIALS_REFRESH_INTERVAL_SECONDS <= 0:
+            return
+        await asyncio.sleep(settings.MATERIALS_REFRESH_INTERVAL_SECONDS)
+
+
+def start_materials_refresh():
+    """Iniciar el refresco del catálogo en segundo plano"""
+    global materials_refresh_task
+    if materials_refresh_task is None or materials_refresh_task.done():
+        materials_refresh_task = asyncio.create_task(_materials_refresh_loop())
+
+
+async def stop_materials_refresh():
+    """Detener el refresco del catálogo"""
+    if materials_refresh_task is not None and not materials_refresh_task.done():
+        materials_refresh_task.cancel()
+        try:
+            await materials_refresh_task
+        except asyncio.CancelledError:
+            pass
+
+
+@router.get("/materials/search")
+async def search_materials(
+    q: Optional[str] = None,
+    material_type: Optional[str] = None,
+    brand: Optional[str] = None,
+    power_band: Optional[str] = None,
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    min_power_watts: Optional[float] = None,
+    max_power_watts: Optional[float] = None,
+    include_inactive: bool = False,
+    limit: int = 20,
+    offset: int = 0
+) -> Dict[str, Any]:
+    """Búsqueda de texto con facetas (tipo, marca, banda de potencia) y filtros numéricos"""
+    try:
+        materials_search_index.sync(materials_service)
+        return materials_search_index.search(
+            query=q,
+            material_type=material_type,
+            brand=brand,
+            band=power_band,
+            min_price=min_price,
+            max_price=max_price,
+            min_power_watts=min_power_watts,
+            max_power_watts=max_power_watts,
+            include_inactive=include_inactive,
+            limit=max(1, min(limit, 100)),
+            offset=max(0, offset)
+        )
+    except Exception as e:
+        logger.error(f"Error buscando materiales: {e}")
+        raise HTTPException(status_code=500, detail="Error interno del servidor")
+
+
 @router.get("/materials/summary")
 async def get_materials_summary() -> Dict[str, Any]:
     """Obtener resumen de todos los materiales disponibles"""
@@ -159,31 +349,86 @@ async def get_materials_summary() -> Dict[str, Any]:
 @router.post("/materials/update-price")
 async def update_material_price(price_update: MaterialPriceUpdate) -> Dict[str, Any]:
     """Actualizar precio de un material"""
+    result = await update_material_prices(MaterialPriceBatchUpdate(updates=[price_update]))
+    return {
+        "success": True,
+        "message": "Precio actualizado correctamente",
+        "material_type": price_update.material_type,
+        "material_id": price_update.material_id,
+        "new_price": price_update.new_price,
+        "updated_at": price_update.updated_at,
+        "catalog_version": result["catalog_version"]
+    }
+
+
+@router.post("/materials/update-prices")
+async def update_material_prices(batch: MaterialPriceBatchUpdate) -> Dict[str, Any]:
+    """Actualizar precios en lote: todo el lote se aplica o ninguno"""
     try:
-        success = materials_service.update_material_price(
-            material_type=price_update.material_type,
-            material_id=price_update.material_id,
-            new_price=price_update.new_price,
-            price_source=price_update.price_source
+        updated = await materials_service.update_material_prices(
+            batch.updates,
+            write_through=batch.write_through
         )
+        audit_log.emit(
+            "material_actualizado",
+            f"{len(updated)} precios de materiales actualizados",
+            materiales=[f"{update.material_type}/{update.material_id}" for update in batch.updates],
+            catalog_version=materials_service.version
+        )
+        return {
+            "success": True,
+            "message": f"{len(updated)} precios actualizados correctamente",
+            "updated": updated,
+            "catalog_version": materials_service.version
+        }
         
-        if success:
-            return {
-                "success": True,
-                "message": "Precio actualizado correctamente",
-                "material_type": price_update.material_type,
-                "material_id": price_update.material_id,
-                "new_price": price_update.new_price,
-                "updated_at": price_update.updated_at
-            }
-        else:
-            raise HTTPException(status_code=400, detail="Error actualizando precio")
-            
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ConnectionError as e:
+        logger.error(f"Error escribiendo precios en NocoDB: {e}")
+        raise HTTPException(status_code=502, detail=str(e))
     except Exception as e:
-        logger.error(f"Error actualizando precio: {e}")
+        logger.error(f"Error actualizando precios: {e}")
         raise HTTPException(status_code=500, detail="Error interno del servidor")
 
 
+@router.get("/materials/{material_type}/{material_id}/price-history")
+async def get_material_price_history(
+    material_type: str,
+    material_id: str,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    max_points: int = 200
+) -> Dict[str, Any]:
+    """Evolución del precio de un material"""
+    # La consulta lee antes lo que agregaron otros workers al archivo: fuera del event loop
+    trend = await asyncio.to_thread(
+        price_history.trend,
+        material_sku(material_type, material_id),
+        since,
+        until,
+        max(1, min(max_points, 1000))
+    )
+    if trend is None:
+        raise HTTPException(status_code=404, detail="Sin historial de precios para el material")
+    return trend
+
+
+@router.get("/materials/{material_type}/{material_id}/price-at")
+async def get_material_price_at(material_type: str, material_id: str, date: datetime) -> Dict[str, Any]:
+    """Precio vigente de un material en una fecha dada"""
+    sku = material_sku(material_type, material_id)
+    observation = await asyncio.to_thread(price_history.price_at, sku, date)
+    if observation is None:
+        raise HTTPException(status_code=404, detail="Sin precio registrado para esa fecha")
+    ratio = await asyncio.to_thread(price_history.price_ratio, sku, date)
+    return {
+        **observation,
+        "requested_date": date.isoformat(),
+        "change_since_pct": round((ratio - 1) * 100, 2) if ratio is not None else None
+    }
+
+
 @router.get("/locations/{location}/sun-data")
 async def get_location_sun_data(location: str) -> Dict[str, Any]:
     """Obtener datos de radiación solar por ubicación"""
@@ -214,10 +459,11 @@ async def estimate_system_size(request: Request) -> Dict[str, Any]:
         if monthly_consumption <= 0:
             raise HTTPException(status_code=400, detail="El consumo mensual debe ser mayor a 0")
         
-        estimation = solar_calculator.estimate_system_size(
-            monthly_consumption=monthly_consumption,
-            location=location,
-            installation_type=installation_type
+        estimation = await compute_executor.run_or_503(
+            solar_calculator.estimate_system_size,
+            monthly_consumption,
+            location,
+            installation_type
         )
         
         logger.info(f"✅ Estimación completada: {estimation}")
@@ -236,9 +482,15 @@ async def estimate_system_size(request: Request) -> Dict[str, Any]:
 @router.post("/quote", response_model=SolarQuoteResponse)
 async def create_solar_quote(
     request: SolarQuoteRequest,
-    background_tasks: BackgroundTasks
+    http_request: Request,
+    response: Response
 ) -> SolarQuoteResponse:
-    """Crear cotización solar completa"""
+    """
+    Crear cotización solar completa.
+    Con el header Idempotency-Key los reintentos devuelven la misma cotización sin
+    volver a guardar en NocoDB ni enviar emails; sin header, los envíos idénticos
+    dentro de DUPLICATE_SUBMIT_WINDOW_SECONDS se coalescen de la misma forma.
+    """
     try:
         logger.info(f"Iniciando cotización para: {request.client_name or 'Cliente anónimo'}")
         logger.info(f"Datos recibidos: consumo={request.monthly_consumption_kwh}, área={request.available_area_m2}, ubicación={request.location}")
@@ -264,36 +516,76 @@ async def create_solar_quote(
             logger.error("Tipo de instalación no especificado")
             raise HTTPException(status_code=400, detail="Debe especificar un tipo de instalación")
         
-        # Generar ID único para la cotización
-        quote_id = str(uuid.uuid4())
-        logger.info(f"ID de cotización generado: {quote_id}")
-        
-        # Calcular diseño del sistema
-        logger.info("Iniciando cálculo del sistema...")
-        design = solar_calculator.calculate_system_design(request)
-        logger.info(f"Cálculo completado. Potencia: {design.required_power_kwp} kWp")
-        
-        # Crear respuesta de cotización
-        quote_response = SolarQuoteResponse(
-            quote_id=quote_id,
-            request=request,
-            design=design,
-            valid_until=datetime.now() + timedelta(days=30)  # Válida por 30 días
-        )
+        created: Dict[str, SolarQuoteResponse] = {}
         
-        # Guardar cotización
-        quotes_storage[quote_id] = quote_response
+        async def create_quote() -> str:
+            # Generar ID único para la cotización
+            quote_id = str(uuid.uuid4())
+            logger.info(f"ID de cotización generado: {quote_id}")
+            
+            # Calcular diseño del sistema
+            logger.info("Iniciando cálculo del sistema...")
+            design = await compute_executor.run_or_503(solar_calculator.calculate_system_design, request)
+            logger.info(f"Cálculo completado. Potencia: {design.required_power_kwp} kWp")
+            
+            # Crear respuesta de cotización
+            quote_response = SolarQuoteResponse(
+                quote_id=quote_id,
+                request=request,
+                design=design,
+                valid_until=datetime.now() + timedelta(days=30)  # Válida por 30 días
+            )
+            
+            # Guardar cotización
+            await quote_repository.save(quote_response)
+            
+            # Guardar en NocoDB (en background)
+            job_runner.submit("nocodb", save_quote_to_nocodb, quote_response)
+            
+            # Enviar email de confirmación y notificación interna (en background, en threads)
+            if request.client_email:
+                job_runner.submit("email", send_quote_email, quote_response)
+                job_runner.submit("email", send_quote_notification, quote_response)
+            
+            created[quote_id] = quote_response
+            logger.info(f"Cotización creada exitosamente: {quote_id}")
+            audit_log.emit(
+                "cotizacion_generada",
+                f"Cotización solar generada para {request.client_name or 'Cliente anónimo'}",
+                ip=http_request.client.host if http_request.client else None,
+                quote_id=quote_id,
+                cliente=request.client_name,
+                potencia=design.required_power_kwp
+            )
+            return quote_id
         
-        # Guardar en NocoDB (en background)
-        background_tasks.add_task(save_quote_to_nocodb, quote_response)
+        request_hash = fingerprint(request.model_dump_json())
+        idempotency_key = http_request.headers.get("Idempotency-Key")
+        if idempotency_key:
+            key, window = f"key:{idempotency_key}", settings.IDEMPOTENCY_WINDOW_SECONDS
+        else:
+            key, window = f"auto:{request_hash}", settings.DUPLICATE_SUBMIT_WINDOW_SECONDS
         
-        # Enviar email de confirmación (en background)
-        if request.client_email:
-            background_tasks.add_task(send_quote_email, quote_response)
+        if window <= 0:
+            quote_id = await create_quote()
+        else:
+            quote_id, replayed = await idempotency_store.run(key, request_hash, window, create_quote)
+            if replayed:
+                quote = await quote_repository.get(quote_id)
+                if quote is not None:
+                    logger.info(f"Solicitud repetida, se devuelve la cotización {quote_id}")
+                    response.headers["Idempotent-Replayed"] = "true"
+                    return fast_response(quote, response)
+                # La cotización original ya no existe: se genera una nueva
+                await idempotency_store.release(key)
+                quote_id, _ = await idempotency_store.run(key, request_hash, window, create_quote)
         
-        logger.info(f"Cotización creada exitosamente: {quote_id}")
-        return quote_response
+        return fast_response(created.get(quote_id) or await quote_repository.get(quote_id), response)
         
+    except IdempotencyKeyReusedError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except IdempotencyConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
     except HTTPException:
         raise
     except Exception as e:
@@ -305,16 +597,15 @@ async def create_solar_quote(
 async def get_solar_quote(quote_id: str) -> SolarQuoteResponse:
     """Obtener cotización por ID"""
     try:
-        if quote_id not in quotes_storage:
+        quote = await quote_repository.get(quote_id)
+        if quote is None:
             raise HTTPException(status_code=404, detail="Cotización no encontrada")
         
-        quote = quotes_storage[quote_id]
-        
         # Verificar si la cotización sigue siendo válida
         if quote.valid_until < datetime.now():
             raise HTTPException(status_code=410, detail="Cotización expirada")
         
-        return quote
+        return fast_response(quote)
         
     except HTTPException:
         raise
@@ -325,41 +616,161 @@ async def get_solar_quote(quote_id: str) -> SolarQuoteResponse:
 
 @router.get("/quotes")
 async def list_solar_quotes(
-    limit: int = 10,
-    offset: int = 0
+    limit: int = Query(10, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    after: Optional[str] = None,
+    client_email: Optional[str] = None,
+    location: Optional[str] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None
 ) -> Dict[str, Any]:
-    """Listar cotizaciones (para administración)"""
+    """
+    Listar cotizaciones (para administración), más recientes primero.
+    Con `after=<created_at>,<quote_id>` (o filtros de fecha) se pagina por clave
+    usando `next_cursor`; sin cursor se mantiene la paginación por offset.
+    """
     try:
-        quotes_list = list(quotes_storage.values())
-        
-        # Ordenar por fecha de creación (más recientes primero)
-        quotes_list.sort(key=lambda x: x.created_at, reverse=True)
+        if after is not None or created_from is not None or created_to is not None:
+            try:
+                cursor = decode_cursor(after) if after else None
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+            
+            quotes_page, has_more = await quote_repository.page(
+                limit=limit,
+                after=cursor,
+                client_email=client_email,
+                location=location,
+                created_from=created_from,
+                created_to=created_to
+            )
+            return fast_response({
+                "quotes": quotes_page,
+                "limit": limit,
+                "has_more": has_more,
+                "next_cursor": encode_cursor(quotes_page[-1]) if has_more else None
+            })
         
-        # Paginación
-        total = len(quotes_list)
-        quotes_page = quotes_list[offset:offset + limit]
+        quotes_page, total = await quote_repository.list(
+            limit=limit,
+            offset=offset,
+            client_email=client_email,
+            location=location
+        )
+        has_more = offset + limit < total
         
-        return {
+        return fast_response({
             "quotes": quotes_page,
             "total": total,
             "limit": limit,
             "offset": offset,
-            "has_more": offset + limit < total
-        }
+            "has_more": has_more,
+            "next_cursor": encode_cursor(quotes_page[-1]) if has_more and quotes_page else None
+        })
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error listando cotizaciones: {e}")
         raise HTTPException(status_code=500, detail="Error interno del servidor")
 
 
+def _csv_download(rows, filename: str) -> StreamingResponse:
+    stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    return StreamingResponse(
+        rows,
+        media_type="text/csv; charset=utf-8",
+        headers={"Content-Disposition": f'attachment; filename="{filename}_{stamp}.csv"'}
+    )
+
+
+def _check_export_format(format: str):
+    if format != "csv":
+        raise HTTPException(status_code=400, detail="Formato no soportado (solo csv)")
+
+
+async def _nocodb_export(table_url: str, columns: List[str], sort: str):
+    """Registros de NocoDB paginados (solo las columnas del CSV), con la primera página pedida antes de responder"""
+    query = NocodbQuery().select(*columns).sort(sort)
+    try:
+        return await prefetch(
+            nocodb_service.iter_records(table_url, query, page_size=settings.EXPORT_PAGE_SIZE)
+        )
+    except ConnectionError as e:
+        logger.error(f"Error exportando desde NocoDB: {e}")
+        raise HTTPException(status_code=502, detail="No se pudo leer NocoDB")
+
+
+@router.get("/quotes/export")
+async def export_quotes(
+    format: str = "csv",
+    source: str = "store",
+    client_email: Optional[str] = None,
+    location: Optional[str] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None
+) -> StreamingResponse:
+    """
+    Exportar cotizaciones en el formato de cotizaciones_solares.csv, fila por fila.
+    source=store lee el store local (con filtros); source=nocodb pagina la tabla de NocoDB
+    """
+    _check_export_format(format)
+    if source == "store":
+        quotes = iter_store_quotes(
+            quote_repository,
+            settings.EXPORT_PAGE_SIZE,
+            client_email=client_email,
+            location=location,
+            created_from=created_from,
+            created_to=created_to
+        )
+        rows = stream_csv(quotes, QUOTE_COLUMNS, quote_to_row, settings.EXPORT_FLUSH_ROWS)
+    elif source == "nocodb":
+        records = await _nocodb_export(nocodb_service.cotizaciones_url, QUOTE_NOCODB_FIELDS, "-fecha_cotizacion")
+        rows = stream_csv(records, QUOTE_COLUMNS, nocodb_quote_to_row, settings.EXPORT_FLUSH_ROWS)
+    else:
+        raise HTTPException(status_code=400, detail="source debe ser 'store' o 'nocodb'")
+    
+    logger.info(f"📤 Exportando cotizaciones (source={source})")
+    return _csv_download(rows, "cotizaciones_solares")
+
+
+@router.get("/contacts/export")
+async def export_contacts(format: str = "csv") -> StreamingResponse:
+    """Exportar contactos desde NocoDB en el formato de contactos.csv"""
+    _check_export_format(format)
+    records = await _nocodb_export(nocodb_service.contactos_url, CONTACT_COLUMNS, "-fecha_consulta")
+    logger.info("📤 Exportando contactos")
+    return _csv_download(stream_csv(records, CONTACT_COLUMNS, flush_rows=settings.EXPORT_FLUSH_ROWS), "contactos")
+
+
+@router.get("/logs/export")
+async def export_system_logs(format: str = "csv") -> StreamingResponse:
+    """Exportar logs del sistema desde NocoDB en el formato de logs_sistema.csv"""
+    _check_export_format(format)
+    records = await _nocodb_export(nocodb_service.logs_url, LOG_COLUMNS, "-fecha_hora")
+    logger.info("📤 Exportando logs del sistema")
+    return _csv_download(stream_csv(records, LOG_COLUMNS, flush_rows=settings.EXPORT_FLUSH_ROWS), "logs_sistema")
+
+
+@router.get("/quotes/stats")
+async def get_quotes_stats() -> Dict[str, Any]:
+    """Contadores de cotizaciones vigentes, vencidas y desalojadas"""
+    try:
+        return await quote_repository.stats()
+    except Exception as e:
+        logger.error(f"Error obteniendo estadísticas de cotizaciones: {e}")
+        raise HTTPException(status_code=500, detail="Error interno del servidor")
+
+
 @router.delete("/quote/{quote_id}")
 async def delete_solar_quote(quote_id: str) -> Dict[str, Any]:
     """Eliminar cotización"""
     try:
-        if quote_id not in quotes_storage:
+        if not await quote_repository.delete(quote_id):
             raise HTTPException(status_code=404, detail="Cotización no encontrada")
         
-        del quotes_storage[quote_id]
+        await asyncio.to_thread(stock_reservations.release, quote_id)
         
         return {
             "success": True,
@@ -374,36 +785,77 @@ async def delete_solar_quote(quote_id: str) -> Dict[str, Any]:
         raise HTTPException(status_code=500, detail="Error interno del servidor")
 
 
-@router.get("/health")
-async def solar_health_check() -> Dict[str, Any]:
-    """Health check del sistema solar"""
+def quote_stock_items(quote: SolarQuoteResponse) -> Dict[str, Any]:
+    """Líneas de stock de una cotización: sku -> (cantidad, stock del catálogo)"""
+    design = quote.design
+    lines = [
+        ("panels", design.selected_panels, design.panel_count),
+        ("inverters", design.selected_inverters, design.inverter_count),
+        ("batteries", design.selected_batteries, design.battery_count),
+    ]
+    catalog = materials_service.get_materials()
+    items = {}
+    for category, selected, quantity in lines:
+        if not selected or not quantity:
+            continue
+        material_id = selected[0].id
+        material = next(
+            (m for m in catalog.get(category, []) if str(m.get("id")) == material_id),
+            {}
+        )
+        items[material_sku(category, material_id)] = (quantity, material.get("stock"))
+    return items
+
+
+@router.post("/quote/{quote_id}/accept")
+async def accept_solar_quote(quote_id: str) -> Dict[str, Any]:
+    """Aceptar una cotización reservando el stock de sus componentes por un tiempo limitado"""
     try:
-        # Verificar servicios
-        materials_summary = materials_service.get_materials_summary()
+        quote = await quote_repository.get(quote_id)
+        if quote is None:
+            raise HTTPException(status_code=404, detail="Cotización no encontrada")
+        if quote.valid_until < datetime.now():
+            raise HTTPException(status_code=410, detail="Cotización expirada")
         
-        # Contar materiales activos
-        active_materials = sum(
-            summary["active"] for summary in materials_summary.values()
+        # El stock sale del catálogo en memoria: no hay consulta a NocoDB por cotización
+        reservations = await asyncio.to_thread(
+            stock_reservations.reserve,
+            quote_id,
+            quote_stock_items(quote),
+            settings.STOCK_RESERVATION_TTL_HOURS * 3600
         )
+        quote.status = "accepted"
+        await quote_repository.update_status(quote_id, quote.status)
         
         return {
-            "status": "healthy",
-            "timestamp": datetime.now(),
-            "active_materials": active_materials,
-            "quotes_count": len(quotes_storage),
-            "services": {
-                "materials_service": "ok",
-                "solar_calculator": "ok"
-            }
+            "success": True,
+            "quote_id": quote_id,
+            "status": quote.status,
+            "reservations": reservations
         }
         
+    except InsufficientStockError as e:
+        raise HTTPException(status_code=409, detail={"message": str(e), "shortages": e.shortages})
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Error en health check: {e}")
-        return {
-            "status": "unhealthy",
-            "timestamp": datetime.now(),
-            "error": str(e)
-        }
+        logger.error(f"Error aceptando cotización {quote_id}: {e}")
+        raise HTTPException(status_code=500, detail="Error interno del servidor")
+
+
+@router.delete("/quote/{quote_id}/reservation")
+async def release_quote_reservation(quote_id: str) -> Dict[str, Any]:
+    """Liberar el stock reservado por una cotización"""
+    try:
+        released = await asyncio.to_thread(stock_reservations.release, quote_id)
+        quote = await quote_repository.get(quote_id)
+        if quote is not None and quote.status == "accepted":
+            await quote_repository.update_status(quote_id, "pending")
+        return {"success": True, "quote_id": quote_id, "released": released}
+    except Exception as e:
+        logger.error(f"Error liberando reservas de {quote_id}: {e}")
+        raise HTTPException(status_code=500, detail="Error interno del servidor")
+
 
 @router.get("/test")
 async def test_solar_calculator() -> Dict[str, Any]:
@@ -452,18 +904,9 @@ async def sync_materials_from_external_source():
         # Obtener materiales desde fuente externa (simulada)
         external_materials = await get_external_solar_materials()
         
-        # Guardar cada material en NocoDB
-        saved_count = 0
-        for material in external_materials:
-            try:
-                success = await nocodb_service.save_material(material)
-                if success:
-                    saved_count += 1
-                    logger.info(f"Material guardado: {material.get('marca', '')} {material.get('modelo', '')}")
-                else:
-                    logger.error(f"Error guardando material: {material.get('marca', '')} {material.get('modelo', '')}")
-            except Exception as e:
-                logger.error(f"Error procesando material: {e}")
+        # Guardar los materiales en NocoDB con llamadas masivas
+        result = await materials_importer.import_rows(external_materials)
+        saved_count = result["inserted"] + result["updated"]
         
         return {
             "status": "success",
@@ -480,6 +923,37 @@ async def sync_materials_from_external_source():
             "message": "Error en sincronización de materiales"
         }
 
+@router.post("/materials/import")
+async def import_materials_csv(
+    file: UploadFile = File(...),
+    dry_run: bool = False,
+    upsert: bool = True
+) -> Dict[str, Any]:
+    """Importar lista de precios en CSV (esquema materiales_solares.csv) en streaming"""
+    try:
+        logger.info(f"Importando materiales desde {file.filename} (dry_run={dry_run}, upsert={upsert})")
+        stream = io.TextIOWrapper(file.file, encoding="utf-8-sig", newline="")
+        try:
+            summary = await materials_importer.import_csv(stream, dry_run=dry_run, upsert=upsert)
+        finally:
+            stream.detach()
+        
+        return {
+            "status": "success" if summary["failed"] == 0 else "partial",
+            "filename": file.filename,
+            **summary
+        }
+        
+    except ConnectionError as e:
+        logger.error(f"Error importando materiales: {e}")
+        raise HTTPException(status_code=502, detail=str(e))
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="El archivo debe estar codificado en UTF-8")
+    except Exception as e:
+        logger.error(f"Error importando materiales: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail="Error interno del servidor")
+
+
 @router.get("/materials/from-nocodb")
 async def get_materials_from_nocodb():
     """Obtener materiales desde NocoDB para el frontend"""
@@ -505,7 +979,7 @@ async def get_materials_from_nocodb():
                 
                 if material_type == "panel":
                     organized_materials["panels"].append({
-                        "id": material.get("id"),
+                        "id": material.get(settings.NOCODB_ID_FIELD),
                         "brand": material.get("marca", ""),
                         "model": material.get("modelo", ""),
                         "power_watts": material.get("potencia_watts", 0),
@@ -517,7 +991,7 @@ async def get_materials_from_nocodb():
                     })
                 elif material_type == "inversor":
                     organized_materials["inverters"].append({
-                        "id": material.get("id"),
+                        "id": material.get(settings.NOCODB_ID_FIELD),
                         "brand": material.get("marca", ""),
                         "model": material.get("modelo", ""),
                         "power_kw": material.get("potencia_kw", 0),
@@ -529,7 +1003,7 @@ async def get_materials_from_nocodb():
                     })
                 elif material_type == "bateria":
                     organized_materials["batteries"].append({
-                        "id": material.get("id"),
+                        "id": material.get(settings.NOCODB_ID_FIELD),
                         "brand": material.get("marca", ""),
                         "model": material.get("modelo", ""),
                         "power_kw": material.get("potencia_kw", 0),
@@ -541,7 +1015,7 @@ async def get_materials_from_nocodb():
                     })
                 elif material_type == "montaje":
                     organized_materials["mounting"].append({
-                        "id": material.get("id"),
+                        "id": material.get(settings.NOCODB_ID_FIELD),
                         "brand": material.get("marca", ""),
                         "model": material.get("modelo", ""),
                         "price_per_kw": material.get("precio_por_kw", 0),
@@ -551,7 +1025,7 @@ async def get_materials_from_nocodb():
                     })
                 elif material_type == "cable":
                     organized_materials["cables"].append({
-                        "id": material.get("id"),
+                        "id": material.get(settings.NOCODB_ID_FIELD),
                         "brand": material.get("marca", ""),
                         "model": material.get("modelo", ""),
                         "price_ars": material.get("precio_ars", 0),
@@ -561,7 +1035,7 @@ async def get_materials_from_nocodb():
                     })
                 elif material_type == "proteccion":
                     organized_materials["protection"].append({
-                        "id": material.get("id"),
+                        "id": material.get(settings.NOCODB_ID_FIELD),
                         "brand": material.get("marca", ""),
                         "model": material.get("modelo", ""),
                         "price_ars": material.get("precio_ars", 0),
@@ -786,8 +1260,8 @@ async def get_external_solar_materials() -> List[Dict[str, Any]]:
         }
     ]
 
-async def save_quote_to_nocodb(quote: SolarQuoteResponse):
-    """Guardar cotización en NocoDB (función de background)"""
+async def save_quote_to_nocodb(quote: SolarQuoteResponse) -> bool:
+    """Guardar cotización en NocoDB (trabajo de la cola "nocodb"; False = reintentar)"""
     try:
         logger.info(f"Guardando cotización {quote.quote_id} en NocoDB...")
         
@@ -810,7 +1284,10 @@ async def save_quote_to_nocodb(quote: SolarQuoteResponse):
             "roi_anos": quote.design.payback_years,
             "fecha_cotizacion": quote.created_at.strftime("%Y-%m-%d %H:%M:%S"),
             "estado_cotizacion": "generada",
-            "notas_adicionales": f"Tipo de batería: {quote.request.battery_type or 'No especificado'}"
+            "notas_adicionales": (
+                f"Respaldo con baterías: {quote.request.battery_autonomy_hours or 'sin dato de'} h de autonomía"
+                if quote.request.battery_backup else "Sin respaldo con baterías"
+            )
         }
         
         # Guardar en NocoDB
@@ -820,12 +1297,14 @@ async def save_quote_to_nocodb(quote: SolarQuoteResponse):
             logger.info(f"Cotización {quote.quote_id} guardada exitosamente en NocoDB")
         else:
             logger.error(f"Error guardando cotización {quote.quote_id} en NocoDB")
+        return success
         
     except Exception as e:
         logger.error(f"Error guardando cotización en NocoDB: {e}")
+        return False
 
-async def send_quote_email(quote: SolarQuoteResponse):
-    """Enviar email con la cotización (función de background)"""
+def send_quote_email(quote: SolarQuoteResponse) -> bool:
+    """Enviar email con la cotización al cliente (trabajo de la cola "email"; False = reintentar)"""
     try:
         logger.info(f"Enviando email de cotización {quote.quote_id} a {quote.request.client_email}")
         
@@ -843,30 +1322,54 @@ async def send_quote_email(quote: SolarQuoteResponse):
             logger.info(f"Email de cotización enviado exitosamente a {quote.request.client_email}")
         else:
             logger.error(f"Error enviando email de cotización a {quote.request.client_email}")
+        return success
         
-        # Enviar notificación interna a marketing
-        notification_success = improved_email_service.send_quote_notification_email(quote.dict())
+    except Exception as e:
+        logger.error(f"Error enviando email de cotización: {e}")
+        return False
+
+def send_quote_notification(quote: SolarQuoteResponse) -> bool:
+    """Enviar notificación interna a marketing (trabajo aparte: un reintento no reenvía el email al cliente)"""
+    try:
+        from .email_service_improved import improved_email_service
+        
+        success = improved_email_service.send_quote_notification_email(quote.dict())
         
-        if notification_success:
+        if success:
             logger.info("Notificación interna enviada a marketing@sumpetrol.com.ar")
         else:
             logger.error("Error enviando notificación interna")
+        return success
         
     except Exception as e:
-        logger.error(f"Error enviando email de cotización: {e}")
+        logger.error(f"Error enviando notificación interna: {e}")
+        return False
 
 
 # Rutas de compatibilidad con el frontend existente
+def _materials_response() -> Any:
+    """Payload cacheado de /materials: bytes ya serializados por el camino rápido o el dict"""
+    if not settings.FAST_JSON_RESPONSES:
+        return materials_payload_cache["content"]
+    if materials_payload_cache["body"] is None:
+        materials_payload_cache["body"] = fast_dumps(materials_payload_cache["content"])
+    return Response(content=materials_payload_cache["body"], media_type="application/json")
+
+
 @router.get("/materials")
 async def get_materials():
     """Obtener lista de materiales solares desde NocoDB"""
     try:
-        logger.info("🔍 Obteniendo materiales desde NocoDB...")
-        logger.info(f"📡 URL de NocoDB: {nocodb_service.materiales_url}")
-        logger.info(f"🔑 Token configurado: {'Sí' if nocodb_service.nocodb_token else 'No'}")
+        # Obtener materiales activos desde NocoDB (filtro y columnas resueltos en NocoDB)
+        materials_data = await nocodb_service.get_materials_from_nocodb(active_only=True)
         
-        # Obtener materiales desde NocoDB
-        materials_data = await nocodb_service.get_materials_from_nocodb()
+        # Servir el payload ya serializado si sale de la misma lectura de NocoDB
+        if materials_data and materials_payload_cache["source"] is materials_data:
+            return _materials_response()
+        
+        logger.info("🔍 Materiales leídos desde NocoDB")
+        logger.info(f"📡 URL de NocoDB: {nocodb_service.materiales_url}")
+        logger.info(f"🔑 Token configurado: {'Sí' if nocodb_service.token else 'No'}")
         logger.info(f"📦 Materiales obtenidos: {len(materials_data) if materials_data else 0} registros")
         
         if materials_data:
@@ -885,7 +1388,7 @@ async def get_materials():
                 
                 if material_type == "panel":
                     organized_materials["panels"].append({
-                        "id": material.get("id"),
+                        "id": material.get(settings.NOCODB_ID_FIELD),
                         "brand": material.get("marca", ""),
                         "model": material.get("modelo", ""),
                         "power_watts": material.get("potencia_watts", 0),
@@ -897,7 +1400,7 @@ async def get_materials():
                     })
                 elif material_type == "inversor":
                     organized_materials["inverters"].append({
-                        "id": material.get("id"),
+                        "id": material.get(settings.NOCODB_ID_FIELD),
                         "brand": material.get("marca", ""),
                         "model": material.get("modelo", ""),
                         "power_kw": material.get("potencia_kw", 0),
@@ -909,7 +1412,7 @@ async def get_materials():
                     })
                 elif material_type == "bateria":
                     organized_materials["batteries"].append({
-                        "id": material.get("id"),
+                        "id": material.get(settings.NOCODB_ID_FIELD),
                         "brand": material.get("marca", ""),
                         "model": material.get("modelo", ""),
                         "power_kw": material.get("potencia_kw", 0),
@@ -921,7 +1424,7 @@ async def get_materials():
                     })
                 elif material_type == "montaje":
                     organized_materials["mounting"].append({
-                        "id": material.get("id"),
+                        "id": material.get(settings.NOCODB_ID_FIELD),
                         "brand": material.get("marca", ""),
                         "model": material.get("modelo", ""),
                         "price_per_kw": material.get("precio_por_kw", 0),
@@ -931,7 +1434,7 @@ async def get_materials():
                     })
                 elif material_type == "cable":
                     organized_materials["cables"].append({
-                        "id": material.get("id"),
+                        "id": material.get(settings.NOCODB_ID_FIELD),
                         "brand": material.get("marca", ""),
                         "model": material.get("modelo", ""),
                         "price_ars": material.get("precio_ars", 0),
@@ -941,7 +1444,7 @@ async def get_materials():
                     })
                 elif material_type == "proteccion":
                     organized_materials["protection"].append({
-                        "id": material.get("id"),
+                        "id": material.get(settings.NOCODB_ID_FIELD),
                         "brand": material.get("marca", ""),
                         "model": material.get("modelo", ""),
                         "price_ars": material.get("precio_ars", 0),
@@ -951,7 +1454,8 @@ async def get_materials():
                     })
             
             logger.info(f"Materiales organizados: {len(materials_data)} registros")
-            return organized_materials
+            materials_payload_cache.update({"source": materials_data, "content": organized_materials, "body": None})
+            return _materials_response()
             
         else:
             logger.warning("No se encontraron materiales en NocoDB, usando materiales por defecto")
@@ -1008,8 +1512,53 @@ async def get_materials():
 async def calculate_solar_system(request: SolarQuoteRequest) -> SolarSystemDesign:
     """Calcular sistema solar (endpoint de compatibilidad)"""
     try:
-        design = solar_calculator.calculate_system_design(request)
-        return design
+        design = await compute_executor.run_or_503(solar_calculator.calculate_system_design, request)
+        return fast_response(design)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error calculando sistema solar: {e}")
         raise HTTPException(status_code=500, detail="Error interno del servidor")
+
+
+@router.post("/calculate/batch")
+async def calculate_solar_systems_batch(batch: SolarBatchCalculationRequest) -> Dict[str, Any]:
+    """Calcular varios diseños en una llamada (errores informados por elemento)"""
+    if len(batch.requests) > settings.BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"El lote supera {settings.BATCH_MAX_ITEMS} solicitudes; use /calculate/stream (NDJSON)"
+        )
+    try:
+        results = await compute_executor.run_or_503(calculate_batch, solar_calculator, batch.requests, heavy=True)
+        failed = sum(1 for result in results if result["status"] == "error")
+        return fast_response({
+            "total": len(results),
+            "succeeded": len(results) - failed,
+            "failed": failed,
+            "results": results
+        })
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error calculando lote de sistemas solares: {e}")
+        raise HTTPException(status_code=500, detail="Error interno del servidor")
+
+
+@router.post("/calculate/stream")
+async def calculate_solar_systems_stream(request: Request) -> NDJSONStreamingResponse:
+    """
+    Calcular diseños en streaming: el cuerpo es NDJSON de SolarQuoteRequest y la
+    respuesta NDJSON con un resultado por línea ({"line", "status", "design"|"error"})
+    a medida que se calculan
+    """
+    logger.info("📦 Iniciando cálculo por lotes NDJSON")
+    return NDJSONStreamingResponse(
+        stream_designs(
+            request.stream(),
+            solar_calculator,
+            compute_executor,
+            chunk_size=settings.BATCH_STREAM_CHUNK_SIZE,
+            max_line_bytes=settings.BATCH_STREAM_MAX_LINE_BYTES
+        )
+    )
@@ -0,0 +1,242 @@
+"""
+Reservas de stock con vencimiento
+Las reservas se guardan en SQLite y se validan dentro de una transacción exclusiva,
+de modo que son atómicas entre requests concurrentes y entre workers del mismo host.
+Las cantidades reservadas se leen de un snapshot en memoria que se actualiza al
+reservar o liberar y periódicamente (reservas de otros workers y vencimientos)
+"""
+
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS stock_reservations (
+    reservation_id TEXT PRIMARY KEY,
+    quote_id TEXT NOT NULL,
+    sku TEXT NOT NULL,
+    quantity INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_stock_reservations_sku ON stock_reservations (sku, expires_at);
+CREATE INDEX IF NOT EXISTS idx_stock_reservations_quote ON stock_reservations (quote_id);
+"""
+
+
+class InsufficientStockError(Exception):
+    """No hay stock disponible para completar la reserva"""
+
+    def __init__(self, shortages: Dict[str, Dict[str, int]]):
+        self.shortages = shortages
+        super().__init__(
+            "Stock insuficiente: " + ", ".join(
+                f"{sku} (pedido {s['requested']}, disponible {s['available']})" for sku, s in shortages.items()
+            )
+        )
+
+
+class StockReservationStore:
+    """Reservas de stock por SKU con vencimiento"""
+
+    def __init__(self, path: str, snapshot_ttl_seconds: float = 2.0):
+        self.path = path
+        self.snapshot_ttl_seconds = snapshot_ttl_seconds
+        self._snapshot: Dict[str, int] = {}
+        self._snapshot_lock = threading.Lock()
+        # Se incrementa cada vez que cambia alguna cantidad reservada
+        self.version = 0
+        # Callbacks con los SKUs cuyas reservas cambiaron
+        self._listeners: List[Callable[[Set[str]], None]] = []
+        self._initialized = False
+
+    def __getstate__(self) -> Dict[str, Any]:
+        """Copia para los procesos del ejecutor de cálculos: el snapshot vigente, sin callbacks"""
+        state = self.__dict__.copy()
+        state["_listeners"] = []
+        del state["_snapshot_lock"]
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]):
+        self.__dict__.update(state)
+        self._snapshot_lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if not self._initialized and self.path != ":memory:":
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+        connection = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+        if not self._initialized:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript(SCHEMA)
+            self._initialized = True
+        return connection
+
+    def add_listener(self, listener: Callable[[Set[str]], None]):
+        """Registrar un callback que recibe los SKUs cuyas cantidades reservadas cambiaron"""
+        self._listeners.append(listener)
+
+    def reserved_quantities(self) -> Dict[str, int]:
+        """Cantidades reservadas vigentes por SKU (snapshot en memoria, sin I/O)"""
+        return self._snapshot
+
+    def refresh(self) -> Set[str]:
+        """Releer las reservas vigentes de SQLite; devuelve los SKUs que cambiaron (bloqueante)"""
+        connection = self._connect()
+        try:
+            rows = connection.execute(
+                "SELECT sku, SUM(quantity) FROM stock_reservations WHERE expires_at > ? GROUP BY sku",
+                (time.time(),)
+            ).fetchall()
+        finally:
+            connection.close()
+        snapshot = {sku: int(quantity) for sku, quantity in rows}
+        with self._snapshot_lock:
+            previous = self._snapshot
+            changed = {sku for sku in previous.keys() | snapshot.keys() if previous.get(sku) != snapshot.get(sku)}
+            self._snapshot = snapshot
+            if changed:
+                self.version += 1
+        if changed:
+            for listener in self._listeners:
+                try:
+                    listener(changed)
+                except Exception as e:
+                    logger.error(f"Error notificando cambios de reservas de stock: {e}")
+        return changed
+
+    def available(self, sku: str, stock: Optional[int]) -> Optional[int]:
+        """Stock disponible descontando reservas; None si el stock no se controla"""
+        if stock is None:
+            return None
+        return int(stock) - self.reserved_quantities().get(sku, 0)
+
+    def reserve(self, quote_id: str, items: Dict[str, Tuple[int, Optional[int]]],
+                ttl_seconds: float) -> List[Dict[str, Any]]:
+        """
+        Reservar todas las líneas de una cotización o ninguna.
+        items: sku -> (cantidad pedida, stock del catálogo o None si no se controla).
+        Si la cotización ya tenía reservas vigentes, se renueva su vencimiento.
+        """
+        now = time.time()
+        expires_at = now + ttl_seconds
+        connection = self._connect()
+        try:
+            # BEGIN IMMEDIATE toma el lock de escritura: nadie más puede reservar en el medio
+            connection.execute("BEGIN IMMEDIATE")
+            connection.execute("DELETE FROM stock_reservations WHERE expires_at <= ?", (now,))
+
+            existing = connection.execute(
+                "SELECT sku FROM stock_reservations WHERE quote_id = ?", (quote_id,)
+            ).fetchall()
+            if existing:
+                connection.execute(
+                    "UPDATE stock_reservations SET expires_at = ? WHERE quote_id = ?", (expires_at, quote_id)
+                )
+            else:
+                shortages = {}
+                for sku, (quantity, stock) in items.items():
+                    if stock is None:
+                        continue
+                    reserved = connection.execute(
+                        "SELECT COALESCE(SUM(quantity), 0) FROM stock_reservations WHERE sku = ?", (sku,)
+                    ).fetchone()[0]
+                    available = int(stock) - int(reserved)
+                    if quantity > available:
+                        shortages[sku] = {"requested": quantity, "available": max(available, 0)}
+                if shortages:
+                    connection.execute("ROLLBACK")
+                    raise InsufficientStockError(shortages)
+
+                connection.executemany(
+                    "INSERT INTO stock_reservations VALUES (?, ?, ?, ?, ?, ?)",
+                    [
+                        (str(uuid.uuid4()), quote_id, sku, quantity, now, expires_at)
+                        for sku, (quantity, _) in items.items() if quantity > 0
+                    ]
+                )
+            connection.execute("COMMIT")
+        except sqlite3.Error:
+            if connection.in_transaction:
+                connection.execute("ROLLBACK")
+            raise
+        finally:
+            connection.close()
+
+        self.refresh()
+        logger.info(f"Stock reservado para la cotización {quote_id} hasta {time.ctime(expires_at)}")
+        return self.get_reservations(quote_id)
+
+    def release(self, quote_id: str) -> int:
+        """Liberar las reservas de una cotización"""
+        connection = self._connect()
+        try:
+            released = connection.execute(
+                "DELETE FROM stock_reservations WHERE quote_id = ?", (quote_id,)
+            ).rowcount
+        finally:
+            connection.close()
+        if released:
+            self.refresh()
+        return released
+
+    def get_reservations(self, quote_id: str) -> List[Dict[str, Any]]:
+        connection = self._connect()
+        try:
+            rows = connection.execute(
+                "SELECT sku, quantity, created_at, expires_at FROM stock_reservations "
+                "WHERE quote_id = ? AND expires_at > ?",
+                (quote_id, time.time())
+            ).fetchall()
+        finally:
+            connection.close()
+        return [
+            {"sku": sku, "quantity": quantity, "created_at": created_at, "expires_at": expires_at}
+            for sku, quantity, created_at, expires_at in rows
+        ]
+
+
+async def _refresh_loop(store: StockReservationStore, interval_seconds: float):
+    while True:
+        try:
+            await asyncio.to_thread(store.refresh)
+        except Exception as e:
+            logger.error(f"Error refrescando las reservas de stock: {e}")
+        await asyncio.sleep(interval_seconds)
+
+
+_refresh_task: Optional[asyncio.Task] = None
+
+
+def start_stock_refresh(store: Optional[StockReservationStore] = None):
+    """Cargar las reservas y refrescarlas cada STOCK_SNAPSHOT_TTL_SECONDS"""
+    global _refresh_task
+    store = store or stock_reservations
+    if _refresh_task is None or _refresh_task.done():
+        _refresh_task = asyncio.create_task(_refresh_loop(store, max(store.snapshot_ttl_seconds, 0.1)))
+
+
+async def stop_stock_refresh():
+    if _refresh_task is not None and not _refresh_task.done():
+        _refresh_task.cancel()
+        try:
+            await _refresh_task
+        except asyncio.CancelledError:
+            pass
+
+
+# Instancia global de reservas de stock
+stock_reservations = StockReservationStore(
+    settings.STOCK_RESERVATIONS_PATH,
+    snapshot_ttl_seconds=settings.STOCK_SNAPSHOT_TTL_SECONDS
+)
@@ -0,0 +1,157 @@
+"""
+Escritura diferida (write-behind) de altas en NocoDB
+Las altas de una misma tabla se juntan y se envían con una sola inserción masiva
+cada N registros o T milisegundos, con concurrencia de envíos acotada.
+Quien encola espera el resultado de su lote (True/False). Si NocoDB rechaza
+el lote (4xx) se divide en mitades hasta aislar los registros rechazados,
+así un registro inválido no hace perder a los demás.
+"""
+
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from .nocodb_outbox import RejectedWriteError
+
+logger = logging.getLogger(__name__)
+
+# Inserción masiva: None si falla, RejectedWriteError si NocoDB rechaza el lote (4xx)
+InsertMany = Callable[[str, List[Dict[str, Any]]], Awaitable[Optional[List[Dict[str, Any]]]]]
+
+
+class _TableQueue:
+    def __init__(self):
+        self.items: List[Tuple[Dict[str, Any], asyncio.Future]] = []
+        self.wakeup = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+
+
+class WriteBehindWriter:
+    """Una cola por tabla; se activa en el startup y se vacía en el shutdown"""
+
+    def __init__(self, insert_many: InsertMany, batch_size: int, flush_interval_ms: float,
+                 max_concurrency: int):
+        self.insert_many = insert_many
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_concurrency = max(1, max_concurrency)
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._running = False
+        self._queues: Dict[str, _TableQueue] = {}
+        self._flushes: Set[asyncio.Task] = set()
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self.metrics = {
+            "submitted": 0, "batches": 0, "records_written": 0, "records_failed": 0,
+            "records_rejected": 0, "batches_split": 0, "largest_batch": 0
+        }
+
+    @property
+    def active(self) -> bool:
+        """Hay escritor en marcha en el event loop actual"""
+        if not self._running:
+            return False
+        try:
+            return asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            return False
+
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._running = True
+        logger.info(
+            f"📝 Escritura diferida en NocoDB activa (lotes de {self.batch_size}, "
+            f"cada {self.flush_interval * 1000:.0f} ms, {self.max_concurrency} envíos en paralelo)"
+        )
+
+    async def submit(self, table_url: str, record: Dict[str, Any]) -> bool:
+        """Encolar un alta y esperar el resultado de la inserción masiva que la incluye"""
+        queue = self._queues.get(table_url)
+        if queue is None:
+            queue = self._queues[table_url] = _TableQueue()
+        if queue.task is None or queue.task.done():
+            queue.task = asyncio.create_task(self._run(table_url, queue))
+
+        future = self._loop.create_future()
+        queue.items.append((record, future))
+        self.metrics["submitted"] += 1
+        if len(queue.items) == 1 or len(queue.items) >= self.batch_size:
+            queue.wakeup.set()
+        return await asyncio.shield(future)
+
+    async def _run(self, table_url: str, queue: _TableQueue):
+        while True:
+            if not queue.items:
+                if not self._running:
+                    return
+                queue.wakeup.clear()
+                await queue.wakeup.wait()
+                continue
+
+            # Esperar a completar el lote o a que venza la ventana desde el primer registro
+            if len(queue.items) < self.batch_size and self._running:
+                queue.wakeup.clear()
+                try:
+                    await asyncio.wait_for(queue.wakeup.wait(), timeout=self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+
+            batch = queue.items[:self.batch_size]
+            del queue.items[:self.batch_size]
+            await self._semaphore.acquire()
+            task = asyncio.create_task(self._flush(table_url, batch))
+            self._flushes.add(task)
+            task.add_done_callback(self._flushes.discard)
+
+    async def _flush(self, table_url: str, batch: List[Tuple[Dict[str, Any], asyncio.Future]]):
+        try:
+            self.metrics["largest_batch"] = max(self.metrics["largest_batch"], len(batch))
+            await self._write(table_url, batch)
+        finally:
+            self._semaphore.release()
+
+    async def _write(self, table_url: str, batch: List[Tuple[Dict[str, Any], asyncio.Future]]):
+        self.metrics["batches"] += 1
+        try:
+            result = await self.insert_many(table_url, [record for record, _ in batch])
+            ok = result is not None
+        except RejectedWriteError as e:
+            if len(batch) > 1:
+                # Aislar los registros rechazados: las mitades válidas se insertan igual
+                self.metrics["batches_split"] += 1
+                middle = len(batch) // 2
+                await self._write(table_url, batch[:middle])
+                await self._write(table_url, batch[middle:])
+                return
+            logger.error(f"❌ NocoDB rechazó un alta diferida: {e}")
+            self.metrics["records_rejected"] += 1
+            ok = False
+        except Exception as e:
+            logger.error(f"❌ Error en inserción masiva diferida ({len(batch)} registros): {e}")
+            ok = False
+
+        self.metrics["records_written" if ok else "records_failed"] += len(batch)
+        for _, future in batch:
+            if not future.done():
+                future.set_result(ok)
+
+    async def drain(self):
+        """Enviar todo lo pendiente y esperar los envíos en curso (shutdown)"""
+        if not self._running:
+            return
+        self._running = False
+        for queue in self._queues.values():
+            queue.wakeup.set()
+        tasks = [queue.task for queue in self._queues.values() if queue.task is not None]
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await asyncio.gather(*list(self._flushes), return_exceptions=True)
+        logger.info(f"📝 Escritura diferida vaciada: {self.metrics['records_written']} registros escritos")
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.metrics,
+            "active": self._running,
+            "pending": sum(len(queue.items) for queue in self._queues.values()),
+            "flushes_in_flight": len(self._flushes),
+        }
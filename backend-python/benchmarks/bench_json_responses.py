@@ -0,0 +1,97 @@
+"""
+Benchmark de serialización de respuestas: /quote, /quotes y /materials
+
+Compara el camino estándar de FastAPI (dump del modelo, revalidación contra
+response_model y json.dumps) con el camino rápido de app.fast_json.
+
+Uso (desde backend-python):
+    python -m benchmarks.bench_json_responses [--quotes 50] [--repeat 200]
+"""
+
+import argparse
+import json
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List
+
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+
+from app.fast_json import dumps, orjson
+from app.solar_calculator import SolarCalculator
+from app.solar_materials_service import SolarMaterialsService
+from app.solar_models import InstallationType, SolarQuoteRequest, SolarQuoteResponse
+
+
+def standard_path(content: Any, adapter: TypeAdapter = None) -> bytes:
+    """Equivalente a lo que hace FastAPI con response_model y JSONResponse"""
+    if adapter is not None:
+        content = adapter.dump_python(adapter.validate_python(jsonable_encoder(content)), mode="json")
+    return json.dumps(jsonable_encoder(content), ensure_ascii=False, allow_nan=False,
+                      separators=(",", ":")).encode("utf-8")
+
+
+def measure(fn: Callable[[], bytes], repeat: int) -> Dict[str, float]:
+    fn()
+    started = time.perf_counter()
+    for _ in range(repeat):
+        body = fn()
+    elapsed = time.perf_counter() - started
+    return {"ms_per_call": elapsed / repeat * 1000, "bytes": len(body)}
+
+
+def build_payloads(quote_count: int) -> Dict[str, Any]:
+    materials_service = SolarMaterialsService(history=None)
+    calculator = SolarCalculator(materials_service)
+    quotes: List[SolarQuoteResponse] = []
+    for i in range(quote_count):
+        request = SolarQuoteRequest(
+            client_name=f"Cliente {i}",
+            client_email=f"cliente{i}@example.com",
+            location="cordoba",
+            monthly_consumption_kwh=300 + 25 * i,
+            tariff_type="residential",
+            available_area_m2=150,
+            installation_type=InstallationType.TECHO_RESIDENCIAL,
+            battery_backup=i % 2 == 0
+        )
+        quotes.append(SolarQuoteResponse(
+            quote_id=f"quote-{i}",
+            request=request,
+            design=calculator.calculate_system_design(request),
+            valid_until=datetime.now() + timedelta(days=30)
+        ))
+    page = {"quotes": quotes, "total": quote_count, "limit": quote_count, "offset": 0, "has_more": False}
+    return {"quote": quotes[-1], "quotes": page, "materials": materials_service.get_materials()}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark de serialización JSON de respuestas")
+    parser.add_argument("--quotes", type=int, default=50, help="Cotizaciones en la página de /quotes")
+    parser.add_argument("--repeat", type=int, default=200, help="Repeticiones por medición")
+    args = parser.parse_args(argv)
+
+    logging.disable(logging.INFO)
+    payloads = build_payloads(args.quotes)
+    quote_adapter = TypeAdapter(SolarQuoteResponse)
+
+    cases = {
+        "/quote": (lambda: standard_path(payloads["quote"], quote_adapter), lambda: dumps(payloads["quote"])),
+        "/quotes": (lambda: standard_path(payloads["quotes"]), lambda: dumps(payloads["quotes"])),
+        "/materials": (lambda: standard_path(payloads["materials"]), lambda: dumps(payloads["materials"])),
+    }
+
+    print(f"orjson: {'sí (' + orjson.__version__ + ')' if orjson else 'no (fallback json)'}")
+    print(f"{'endpoint':<12}{'bytes':>10}{'estándar ms':>14}{'rápido ms':>12}{'speedup':>10}")
+    for name, (standard, fast) in cases.items():
+        slow = measure(standard, args.repeat)
+        quick = measure(fast, args.repeat)
+        print(
+            f"{name:<12}{quick['bytes']:>10}{slow['ms_per_call']:>14.3f}"
+            f"{quick['ms_per_call']:>12.3f}{slow['ms_per_call'] / quick['ms_per_call']:>9.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
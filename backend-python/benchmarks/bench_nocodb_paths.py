@@ -0,0 +1,128 @@
+"""
+Benchmark de los caminos que dependen de NocoDB, contra el NocoDB local
+
+Levanta app.nocodb_fake (SQLite en memoria, latencia configurable) y mide,
+sin red: lectura de materiales activos, altas de cotizaciones directas,
+diferidas (write-behind) y por outbox, y el recorrido paginado de una tabla.
+
+Uso (desde backend-python):
+    python -m benchmarks.bench_nocodb_paths [--latency-ms 20] [--saves 200] [--rows 5000]
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import tempfile
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from app.nocodb_fake import FakeNocodb
+
+
+def _quote(i: int) -> Dict[str, Any]:
+    return {
+        "id_cotizacion": f"bench-{i}",
+        "nombre_cliente": f"Cliente {i}",
+        "email_cliente": f"cliente{i}@example.com",
+        "potencia_requerida_kwp": 3.5,
+        "fecha_cotizacion": f"2026-01-01 10:{i // 60 % 60:02d}:{i % 60:02d}",
+    }
+
+
+async def measure(fake: FakeNocodb, operations: int, run: Callable[[], Awaitable[Any]]) -> Dict[str, float]:
+    calls_before = len(fake.calls)
+    started = time.perf_counter()
+    await run()
+    elapsed = time.perf_counter() - started
+    return {"total_s": elapsed, "ms_per_op": elapsed / operations * 1000, "requests": len(fake.calls) - calls_before}
+
+
+async def run_cases(fake: FakeNocodb, args) -> Dict[str, Dict[str, float]]:
+    from app.http_client import http_clients
+    from app.nocodb_query import NocodbQuery
+    from app.nocodb_service import nocodb_service
+
+    http_clients.start()
+    results = {}
+
+    async def read_materials():
+        for _ in range(args.repeat):
+            await nocodb_service.get_materials_from_nocodb(active_only=True)
+
+    results["materiales activos"] = await measure(fake, args.repeat, read_materials)
+
+    async def save_quotes(offset: int):
+        await asyncio.gather(*(nocodb_service.save_solar_quote(_quote(offset + i)) for i in range(args.saves)))
+
+    results["cotizaciones directas"] = await measure(fake, args.saves, lambda: save_quotes(0))
+
+    nocodb_service.writer.start()
+    results["cotizaciones write-behind"] = await measure(fake, args.saves, lambda: save_quotes(args.saves))
+    await nocodb_service.writer.drain()
+
+    nocodb_service.outbox.start(nocodb_service.deliver_outbox_batch)
+
+    async def save_and_deliver():
+        await save_quotes(2 * args.saves)
+        while (await nocodb_service.outbox.get_stats())["depth"]:
+            await asyncio.sleep(0.01)
+
+    results["cotizaciones outbox"] = await measure(fake, args.saves, save_and_deliver)
+    await nocodb_service.outbox.stop()
+
+    query = NocodbQuery().select("id", "email_cliente", "potencia_requerida_kwp")
+
+    async def walk():
+        async for _ in nocodb_service.iter_records(nocodb_service.contactos_url, query, page_size=args.page_size):
+            pass
+
+    results[f"recorrido {args.rows} filas"] = await measure(fake, args.rows, walk)
+
+    await http_clients.close()
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark de caminos NocoDB contra el NocoDB local")
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="Latencia por pedido del NocoDB local")
+    parser.add_argument("--materials", type=int, default=300, help="Materiales en la tabla")
+    parser.add_argument("--repeat", type=int, default=20, help="Lecturas de materiales")
+    parser.add_argument("--saves", type=int, default=200, help="Altas concurrentes por modo")
+    parser.add_argument("--rows", type=int, default=5000, help="Filas para el recorrido paginado")
+    parser.add_argument("--page-size", type=int, default=1000)
+    args = parser.parse_args(argv)
+
+    logging.disable(logging.WARNING)
+    fake = FakeNocodb(latency_ms=args.latency_ms)
+    data_dir = tempfile.mkdtemp(prefix="bench-nocodb-")
+    # Antes de importar app.config: la aplicación apunta al NocoDB local
+    os.environ.update({
+        "NC_DB_URL": fake.start_in_thread(),
+        "NOCODB_READ_CACHE_TTL_SECONDS": "0",
+        "NOCODB_OUTBOX_PATH": os.path.join(data_dir, "nocodb_outbox.db"),
+        "PRICE_HISTORY_PATH": "",
+    })
+    from app.nocodb_service import nocodb_service
+
+    fake.insert(nocodb_service.materiales_table_id, [
+        {"tipo_material": "panel", "marca": f"Marca {i}", "modelo": f"M{i}", "potencia_watts": 400 + i % 200,
+         "precio_ars": 150000 + i, "activo": i % 4 != 0, "especificaciones_tecnicas": "x" * 200,
+         "fecha_actualizacion": "2026-01-01 10:00:00"}
+        for i in range(args.materials)
+    ])
+    fake.insert(nocodb_service.contactos_table_id, [_quote(i) for i in range(args.rows)])
+
+    try:
+        results = asyncio.run(run_cases(fake, args))
+    finally:
+        fake.stop_thread()
+
+    print(f"NocoDB local con {args.latency_ms:.0f} ms de latencia por pedido")
+    print(f"{'caso':<28}{'total s':>10}{'ms/op':>10}{'pedidos':>10}")
+    for name, result in results.items():
+        print(f"{name:<28}{result['total_s']:>10.2f}{result['ms_per_op']:>10.3f}{result['requests']:>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Configuración de pytest
+Antes de importar la aplicación se levanta un NocoDB local (app.nocodb_fake) y
+NC_DB_URL apunta a él; los stores en disco van a un directorio temporal.
+Así los tests corren sin red y sin tocar data/.
+"""
+
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.nocodb_fake import FakeNocodb  # noqa: E402  (no importa app.config)
+
+_fake = FakeNocodb(token="test-token")
+_data_dir = tempfile.mkdtemp(prefix="cotizador-tests-")
+
+
+def pytest_configure(config):
+    os.environ.update({
+        "NC_DB_URL": _fake.start_in_thread(),
+        "NC_TOKEN": "test-token",
+        "NOCODB_READ_CACHE_TTL_SECONDS": "0",
+        "NOCODB_OUTBOX_PATH": os.path.join(_data_dir, "nocodb_outbox.db"),
+        "NOCODB_OUTBOX_POLL_SECONDS": "0.2",
+        "QUOTE_STORE_PATH": os.path.join(_data_dir, "quotes.db"),
+        "IDEMPOTENCY_STORE_PATH": os.path.join(_data_dir, "idempotency.db"),
+        "STOCK_RESERVATIONS_PATH": os.path.join(_data_dir, "stock_reservations.db"),
+        "PRICE_HISTORY_PATH": "",
+        "MATERIALS_REFRESH_INTERVAL_SECONDS": "0",
+        # Sin SMTP en los tests: los emails fallan una vez y no demoran el shutdown
+        "JOB_MAX_RETRIES": "0",
+        "JOB_SHUTDOWN_TIMEOUT_SECONDS": "1",
+        "AUDIT_FALLBACK_PATH": os.path.join(_data_dir, "audit_log.jsonl"),
+    })
+
+
+def pytest_unconfigure(config):
+    _fake.stop_thread()
+    shutil.rmtree(_data_dir, ignore_errors=True)
+
+
+@pytest.fixture
+def fake_nocodb(monkeypatch):
+    """NocoDB local vacío y sin fallas; settings.NC_DB_URL apunta a él"""
+    from app.config import settings
+    from app.nocodb_service import nocodb_service
+
+    monkeypatch.setattr(settings, "NC_DB_URL", _fake.url)
+    _fake.reset()
+    nocodb_service.read_cache.invalidate()
+    yield _fake
+    _fake.reset()
+
+
+@pytest.fixture(scope="module")
+def client():
+    """Cliente de la aplicación con startup/shutdown (outbox, sesiones HTTP, ...)"""
+    from fastapi.testclient import TestClient
+    from app import solar_routes
+    from app.main import app
+
+    with TestClient(app) as test_client:
+        # Esperar la carga inicial del catálogo (desde el NocoDB local) para que no pise los datos de los tests
+        test_client.portal.call(_wait_task, solar_routes.materials_refresh_task)
+        yield test_client
+
+
+async def _wait_task(task):
+    if task is not None:
+        await asyncio.wait_for(asyncio.shield(task), timeout=10)
+
@@ -0,0 +1,189 @@
+"""
+Caminos que dependen de NocoDB, contra el NocoDB local (ver conftest.py)
+"""
+
+import asyncio
+import time
+
+from app.nocodb_query import NocodbQuery
+from app.nocodb_service import nocodb_service
+
+
+def wait_for(condition, timeout: float = 5.0):
+    """Esperar a que condition() devuelva algo verdadero (entregas del outbox)"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        result = condition()
+        if result:
+            return result
+        time.sleep(0.05)
+    return condition()
+
+
+def _material(tipo: str, marca: str, activo: bool = True, **extra):
+    return {"tipo_material": tipo, "marca": marca, "modelo": f"{marca}-1", "precio_ars": 1000,
+            "activo": activo, "fecha_actualizacion": "2026-01-01 10:00:00", **extra}
+
+
+def test_fake_lists_with_where_fields_and_pages(fake_nocodb):
+    fake_nocodb.insert(nocodb_service.materiales_table_id, [
+        _material("panel", f"P{i}", activo=i % 3 != 0, potencia_watts=400 + i) for i in range(20)
+    ])
+    query = NocodbQuery().select("id", "marca").where("activo", "eq", True).sort("-potencia_watts")
+
+    async def collect():
+        return [row async for row in nocodb_service.iter_records(nocodb_service.materiales_url, query, page_size=5)]
+
+    rows = asyncio.run(collect())
+
+    assert [row["marca"] for row in rows] == [f"P{i}" for i in reversed(range(20)) if i % 3 != 0]
+    assert all(set(row) == {"id", "marca"} for row in rows)
+    assert [method for method, _, _ in fake_nocodb.calls] == ["GET"] * 3
+
+
+def test_materials_returns_only_active_from_nocodb(client, fake_nocodb):
+    fake_nocodb.insert(nocodb_service.materiales_table_id, [
+        _material("panel", "Activo", potencia_watts=550),
+        _material("panel", "Inactivo", activo=False, potencia_watts=450),
+        _material("inversor", "Inversor", potencia_kw=5),
+    ])
+
+    response = client.get("/api/solar/materials")
+
+    assert response.status_code == 200
+    materials = response.json()
+    assert [panel["brand"] for panel in materials["panels"]] == ["Activo"]
+    assert [inverter["brand"] for inverter in materials["inverters"]] == ["Inversor"]
+
+
+def test_materials_fall_back_to_last_catalog_when_nocodb_fails(fake_nocodb):
+    fake_nocodb.insert(nocodb_service.materiales_table_id, [_material("panel", "Cache")])
+    first = asyncio.run(nocodb_service.get_materials_from_nocodb())
+
+    fake_nocodb.configure(error_rate=1.0)
+    second = asyncio.run(nocodb_service.get_materials_from_nocodb())
+
+    assert [row["marca"] for row in second] == [row["marca"] for row in first] == ["Cache"]
+
+
+def test_quote_is_persisted_to_nocodb(client, fake_nocodb):
+    # El catálogo del startup vino del NocoDB local vacío: usar el de respaldo
+    from app.solar_routes import materials_service
+    materials_service.set_materials(materials_service.get_default_materials(), record_history=False)
+
+    response = client.post("/api/solar/quote", json={
+        "client_name": "Ana Test",
+        "client_email": "ana@example.com",
+        "location": "buenos-aires",
+        "monthly_consumption_kwh": 450,
+        "tariff_type": "residencial",
+        "available_area_m2": 60,
+        "installation_type": "techo_residencial",
+    })
+
+    assert response.status_code == 200
+    rows = wait_for(lambda: fake_nocodb.rows(nocodb_service.cotizaciones_table_id))
+    assert [row["email_cliente"] for row in rows] == ["ana@example.com"]
+    assert rows[0]["potencia_requerida_kwp"] == response.json()["design"]["required_power_kwp"]
+
+
+def test_contact_form_is_saved_to_nocodb(client, fake_nocodb):
+    response = client.post("/contacto/enviar", json={
+        "nombre": "Juan Test",
+        "email": "juan@example.com",
+        "telefono": "1100000000",
+        "mensaje": "Quiero una cotización",
+    })
+
+    assert response.status_code == 200
+    rows = wait_for(lambda: fake_nocodb.rows(nocodb_service.contactos_table_id))
+    assert [(row["nombre_cliente"], row["estado_consulta"]) for row in rows] == [("Juan Test", "Nuevo")]
+
+
+def test_audit_events_are_flushed_in_bulk_with_local_fallback(fake_nocodb, tmp_path):
+    from app.audit_log import AuditLog
+
+    audit = AuditLog(buffer_size=100, flush_seconds=60, fallback_path=str(tmp_path / "audit.jsonl"),
+                     sample_rates={"calculo_sistema": 0.0}, replay_max_records=100)
+
+    async def scenario():
+        audit.start(nocodb_service.save_system_logs)
+        audit.emit("contacto_recibido", "Nuevo formulario de contacto recibido", ip="10.0.0.1", nombre="Ana")
+        audit.emit("calculo_sistema", "Sistema solar calculado")  # muestreado al 0%
+        audit.emit("error_calculo", "Error en cálculo", level="ERROR")  # los errores no se muestrean
+        fake_nocodb.configure(error_rate=1.0)
+        await audit.flush()
+        fake_nocodb.configure(error_rate=0.0)
+        audit.emit("email_enviado", "Email enviado exitosamente")
+        await audit.stop()
+
+    asyncio.run(scenario())
+
+    rows = fake_nocodb.rows(nocodb_service.logs_table_id)
+    assert sorted(row["tipo_evento"] for row in rows) == ["contacto_recibido", "email_enviado", "error_calculo"]
+    # Un POST masivo con los eventos nuevos y otro con los reenviados del archivo local
+    assert [method for method, _, _ in fake_nocodb.calls] == ["POST", "POST"]
+    assert not (tmp_path / "audit.jsonl").exists()
+    assert audit.stats["sampled_out"] == 1 and audit.stats["fallback_replayed"] == 2
+
+
+def test_crm_listing_is_cached_and_patched_by_our_writes(client, fake_nocodb):
+    fake_nocodb.insert(nocodb_service.clientes_table_id, [
+        {"nombre_cliente": "Cliente A", "estado_consulta": "Nuevo", "fecha_consulta": "2026-01-01 10:00:00"},
+    ])
+    customer_id = fake_nocodb.rows(nocodb_service.clientes_table_id)[0]["id"]
+
+    first = client.get("/nocodb/clientes").json()
+    second = client.get("/nocodb/clientes").json()
+    assert first == second
+    assert [method for method, _, _ in fake_nocodb.calls] == ["GET"]
+
+    # La actualización de estado corrige la cache en el lugar: no se vuelve a leer NocoDB
+    assert client.patch(f"/nocodb/clientes/{customer_id}/estado", params={"estado": "Contactado"}).status_code == 200
+    patched = client.get("/nocodb/clientes").json()
+    assert [row["estado_consulta"] for row in patched["clientes"]] == ["Contactado"]
+    assert [method for method, _, _ in fake_nocodb.calls] == ["GET", "PATCH"]
+
+    # Un alta invalida el listado: la próxima lectura va a NocoDB
+    assert client.post("/nocodb/clientes", json={"nombre": "Cliente B", "email": "b@example.com"}).status_code == 200
+    refreshed = client.get("/nocodb/clientes").json()
+    assert refreshed["total"] == 2
+    assert [method for method, _, _ in fake_nocodb.calls] == ["GET", "PATCH", "POST", "GET"]
+
+
+def test_outbox_retry_upserts_by_idempotency_id_without_touching_other_rows(fake_nocodb, monkeypatch, tmp_path):
+    from app.config import settings
+    from app.nocodb_outbox import NocodbOutbox
+
+    monkeypatch.setattr(settings, "NOCODB_OUTBOX_ID_FIELD", "id_outbox")
+    table_id = nocodb_service.contactos_table_id
+    # Consulta anterior del mismo cliente y del mismo día, ya atendida en el CRM
+    fake_nocodb.insert(table_id, [{"email_cliente": "ana@example.com", "fecha_consulta": "2026-01-01",
+                                   "estado_consulta": "Contactado", "notas_internas": "Llamar el lunes"}])
+    outbox = NocodbOutbox(str(tmp_path / "outbox.db"), batch_size=10, flush_interval_ms=0, poll_seconds=1,
+                          backoff_base_seconds=0, backoff_max_seconds=0, id_field="id_outbox")
+    attempts = []
+
+    async def deliver(table_name, records, retry):
+        attempts.append(retry)
+        ok = await nocodb_service.deliver_outbox_batch(table_name, records, retry)
+        # El primer lote llega a NocoDB pero la respuesta se pierde (timeout): se reintenta
+        return ok and len(attempts) > 1
+
+    async def scenario():
+        outbox._deliver = deliver
+        for mensaje in ("Primera", "Segunda"):
+            await outbox.enqueue("contactos", {"email_cliente": "ana@example.com", "fecha_consulta": "2026-01-01",
+                                               "mensaje": mensaje, "estado_consulta": "Nuevo", "notas_internas": ""})
+        assert await outbox.deliver_due() == 0
+        assert await outbox.deliver_due() == 2
+
+    asyncio.run(scenario())
+
+    rows = fake_nocodb.rows(table_id)
+    assert attempts == [False, True]
+    assert [(row.get("mensaje"), row["estado_consulta"], row["notas_internas"]) for row in rows] == [
+        (None, "Contactado", "Llamar el lunes"), ("Primera", "Nuevo", ""), ("Segunda", "Nuevo", ""),
+    ]
+    assert len({row["id_outbox"] for row in rows[1:]}) == 2
+    assert [method for method, _, _ in fake_nocodb.calls] == ["POST", "GET", "PATCH"]